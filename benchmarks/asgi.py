@@ -0,0 +1,267 @@
+"""
+Benchmark the full stack in-process at the ASGI level (no network, no HTTP client), per scenario and logging mode.
+
+Reports requests/second, p50/p99 latency and peak memory allocated per request, and compares against a baseline:
+  python -m benchmarks.asgi --save-baseline baseline.json
+  python -m benchmarks.asgi --baseline baseline.json --threshold 0.15
+
+Exits with status 1 if a scenario is slower than the baseline by more than the threshold (in requests/second or p99).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from logging.config import dictConfig
+from typing import Any, Callable
+
+from fastapi import APIRouter, FastAPI, HTTPException
+from fastapi_stack_utils.exception_handler import format_and_log_exception_internal, http_exception_handler
+from fastapi_stack_utils.logging_config import generate_base_logging_config
+from fastapi_stack_utils.middleware import LoggingMiddleware, patch_fastapi_middlewares
+from fastapi_stack_utils.route import AuditLog
+from starlette.middleware import Middleware
+from starlette.types import ASGIApp, Message
+
+LOGGING_MODES = {'console': 'dev', 'json': 'prod'}
+LARGE_JSON_BODY = json.dumps({'items': [{'id': i, 'name': f'item {i}', 'tags': ['a', 'b']} for i in range(1000)]})
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    body: bytes = b''
+    status_code: int = 200
+
+
+SCENARIOS = [
+    Scenario('get', 'GET', '/plain'),
+    Scenario('post_large_json', 'POST', '/audited', LARGE_JSON_BODY.encode()),
+    Scenario('http_exception', 'GET', '/http-exception', status_code=404),
+    Scenario('unhandled_500', 'GET', '/unhandled', status_code=500),
+]
+
+
+@dataclass
+class Result:
+    requests_per_second: float
+    p50_ms: float
+    p99_ms: float
+    peak_kib_per_request: float
+
+
+def create_app() -> ASGIApp:
+    """
+    Build the app as documented in the README, without leaving `FastAPI` patched afterwards
+    """
+    build_middleware_stack = FastAPI.build_middleware_stack
+    patch_fastapi_middlewares(middlewares=[Middleware(LoggingMiddleware)])
+    try:
+        app = FastAPI()
+        app.add_exception_handler(HTTPException, http_exception_handler)
+        app.add_exception_handler(Exception, format_and_log_exception_internal)
+        router = APIRouter(route_class=AuditLog)
+
+        @app.get('/plain')
+        async def plain() -> dict[str, str]:
+            return {'message': 'Pure view'}
+
+        @router.post('/audited')
+        async def audited(body: dict[str, Any]) -> dict[str, int]:
+            # Not validated into models, so the time is spent in the stack rather than in pydantic
+            return {'count': len(body['items'])}
+
+        @app.get('/http-exception')
+        async def http_exception() -> None:
+            raise HTTPException(404, 'Not found')
+
+        @app.get('/unhandled')
+        async def unhandled() -> None:
+            raise ValueError('Some value error')
+
+        app.include_router(router)
+        app.middleware_stack = app.build_middleware_stack()
+        return app.middleware_stack
+    finally:
+        FastAPI.build_middleware_stack = build_middleware_stack  # type: ignore
+
+
+def configure_logging(mode: str) -> None:
+    """
+    Configure logging as in production, but write to /dev/null
+    """
+
+    class Settings:
+        ENVIRONMENT = LOGGING_MODES[mode]
+
+    config = generate_base_logging_config(Settings())
+    for handler in config['handlers'].values():
+        handler['stream'] = open(os.devnull, 'w')  # noqa: SIM115
+    dictConfig(config)
+
+
+async def send_request(app: ASGIApp, scenario: Scenario) -> int:
+    """
+    Send one request through the ASGI app, returning the status code
+    """
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': scenario.method,
+        'scheme': 'http',
+        'path': scenario.path,
+        'raw_path': scenario.path.encode(),
+        'root_path': '',
+        'query_string': b'',
+        'headers': [
+            (b'host', b'benchmark'),
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(scenario.body)).encode()),
+        ],
+        'client': ('127.0.0.1', 50000),
+        'server': ('benchmark', 80),
+    }
+    request_messages = [{'type': 'http.request', 'body': scenario.body, 'more_body': False}]
+    status_code = 0
+
+    async def receive() -> Message:
+        if request_messages:
+            return request_messages.pop()
+        await asyncio.Future()  # the client never disconnects
+        raise AssertionError  # pragma: no cover
+
+    async def send(message: Message) -> None:
+        nonlocal status_code
+        if message['type'] == 'http.response.start':
+            status_code = message['status']
+
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        # ServerErrorMiddleware re-raises after sending the 500 response, for the server to log
+        pass
+    return status_code
+
+
+async def run_scenario(app: ASGIApp, scenario: Scenario, requests: int, warmup: int) -> Result:
+    """
+    Run a scenario, timing each request, then measure allocations in a separate, shorter run
+    """
+    for _ in range(warmup):
+        status_code = await send_request(app, scenario)
+        if status_code != scenario.status_code:
+            raise RuntimeError(f'{scenario.name}: expected {scenario.status_code}, got {status_code}')
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        request_start = time.perf_counter()
+        await send_request(app, scenario)
+        latencies.append(time.perf_counter() - request_start)
+    total = time.perf_counter() - start
+    latencies.sort()
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(max(requests // 20, 1)):
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            await send_request(app, scenario)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - baseline)
+    finally:
+        tracemalloc.stop()
+
+    return Result(
+        requests_per_second=requests / total,
+        p50_ms=latencies[len(latencies) // 2] * 1000,
+        p99_ms=latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000,
+        peak_kib_per_request=sum(peaks) / len(peaks) / 1024,
+    )
+
+
+def run(requests: int, warmup: int, scenarios: list[str] | None = None) -> dict[str, Result]:
+    """
+    Run all (or the given) scenarios in all logging modes, keyed by `<scenario>[<logging mode>]`
+    """
+    app = create_app()
+    results = {}
+    for mode in LOGGING_MODES:
+        configure_logging(mode)
+        for scenario in SCENARIOS:
+            if scenarios and scenario.name not in scenarios:
+                continue
+            results[f'{scenario.name}[{mode}]'] = asyncio.run(run_scenario(app, scenario, requests, warmup))
+    logging.shutdown()
+    return results
+
+
+def find_regressions(results: dict[str, Result], baseline: dict[str, dict[str, float]], threshold: float) -> list[str]:
+    """
+    Compare results to a baseline, returning a description of every regression larger than the threshold
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        expected = Result(**baseline[name])
+        if result.requests_per_second < expected.requests_per_second * (1 - threshold):
+            regressions.append(
+                f'{name}: {result.requests_per_second:,.0f} requests/s, '
+                f'baseline {expected.requests_per_second:,.0f} requests/s'
+            )
+        if result.p99_ms > expected.p99_ms * (1 + threshold):
+            regressions.append(f'{name}: p99 {result.p99_ms:.3f}ms, baseline {expected.p99_ms:.3f}ms')
+    return regressions
+
+
+def print_results(results: dict[str, Result], write: Callable[[str], Any] = print) -> None:
+    """
+    Print the results as a table
+    """
+    write(f'{"scenario":32} {"requests/s":>12} {"p50 ms":>9} {"p99 ms":>9} {"peak KiB":>9}')
+    for name, result in results.items():
+        write(
+            f'{name:32} {result.requests_per_second:>12,.0f} {result.p50_ms:>9.3f} '
+            f'{result.p99_ms:>9.3f} {result.peak_kib_per_request:>9.1f}'
+        )
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Run the benchmarks, optionally saving or comparing against a baseline
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000, help='Requests per scenario')
+    parser.add_argument('--warmup', type=int, default=100, help='Requests per scenario before measuring')
+    parser.add_argument('--scenario', action='append', choices=[scenario.name for scenario in SCENARIOS])
+    parser.add_argument('--save-baseline', metavar='PATH', help='Store the results as a baseline')
+    parser.add_argument('--baseline', metavar='PATH', help='Compare the results with a stored baseline')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Allowed regression, 0.1 is 10%%')
+    args = parser.parse_args(argv)
+
+    results = run(requests=args.requests, warmup=args.warmup, scenarios=args.scenario)
+    print_results(results)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump({name: asdict(result) for name, result in results.items()}, baseline_file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)  # noqa: T001
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+Exception handler throughput during an error storm, with the previous pydantic round-trip and the current handlers.
+
+The `fastapi_stack_utils` logger is disabled, so only building the responses is measured.
+Run with `python -m benchmarks.exception_handler`.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+from fastapi_stack_utils.exception_handler import (
+    format_and_log_exception_internal,
+    format_and_log_exception_public,
+    generate_json_response,
+    http_exception_handler,
+)
+from fastapi_stack_utils.schemas.http_exceptions import ErrorResponse, ServerError
+
+CALLS = 50_000
+
+
+async def pydantic_http_exception_handler(request: Request, exc: HTTPException) -> JSONResponse:
+    """
+    `http_exception_handler` as it was, validating the body with pydantic
+    """
+    detail: Any = exc.detail
+    elements = detail if isinstance(detail, (list, tuple)) else [detail]
+    errors = [ServerError(description=str(element), error=str(element)) for element in elements]
+    return generate_json_response(ErrorResponse(detail=errors), status_code=exc.status_code, headers=exc.headers or {})
+
+
+async def pydantic_exception_internal(request: Request, exc: Exception) -> JSONResponse:
+    """
+    `format_and_log_exception_internal` as it was, without the logging
+    """
+    response_body = ErrorResponse(detail=[ServerError(description='Internal Server Error', error=str(exc))])
+    return generate_json_response(response_body=response_body, status_code=500)
+
+
+async def pydantic_exception_public(request: Request, exc: Exception) -> JSONResponse:
+    """
+    `format_and_log_exception_public` as it was, without the logging
+    """
+    response_body = ErrorResponse(
+        detail=[ServerError(description='Internal Server Error', error='Internal Server Error')]
+    )
+    return generate_json_response(response_body=response_body, status_code=500)
+
+
+async def calls_per_second(handler: Callable[[Request, Any], Awaitable[JSONResponse]], exc: Exception) -> float:
+    """
+    Responses per second built by the handler for the exception
+    """
+    request = Request(scope={'type': 'http'})
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        await handler(request, exc)
+    return CALLS / (time.perf_counter() - start)
+
+
+async def main() -> None:
+    """
+    Compare each handler with its pydantic version
+    """
+    logging.getLogger('fastapi_stack_utils').disabled = True
+    scenarios = [
+        ('http_exception_handler', pydantic_http_exception_handler, http_exception_handler, HTTPException(404, 'x')),
+        ('internal', pydantic_exception_internal, format_and_log_exception_internal, ValueError('Some value error')),
+        ('public', pydantic_exception_public, format_and_log_exception_public, ValueError('Some value error')),
+    ]
+    for name, before, after, exc in scenarios:
+        before_rate = await calls_per_second(before, exc)
+        after_rate = await calls_per_second(after, exc)
+        print(  # noqa: T001
+            f'{name:24} pydantic: {before_rate:>10,.0f}/s   current: {after_rate:>10,.0f}/s   '
+            f'({after_rate / before_rate:.1f}x)'
+        )
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+"""
+Records per second formatted by `python-json-logger` with the previous format string, and by `JsonFormatter`.
+
+Run with `python -m benchmarks.json_formatter`.
+"""
+import logging
+import sys
+import time
+from unittest import mock
+
+from fastapi_stack_utils import logging_config
+from fastapi_stack_utils.logging_config import JSON_LOG_FIELDS, JsonFormatter
+from pythonjsonlogger.jsonlogger import JsonFormatter as PythonJsonLoggerFormatter
+
+RECORDS = 50_000
+
+
+def make_record(exc_info: bool) -> logging.LogRecord:
+    """
+    A record like the ones logged by `AuditLog`, optionally with a traceback
+    """
+    record = logging.LogRecord('benchmark', logging.INFO, __file__, 1, '%s > [%s] | %s', ('user', 'POST', '/'), None)
+    if exc_info:
+        try:
+            raise ValueError('Some value error')
+        except ValueError:
+            record.exc_info = sys.exc_info()
+    record.correlation_id = 'd0b4e0c5-6fb0-4bd0-8e0f-4f0cdbd4e9a1'
+    record.nanostamp = '2023-01-31T12:00:00.123456789'
+    record.user, record.method, record.path = 'user', 'POST', '/logged/hello'
+    return record
+
+
+def records_per_second(formatter: logging.Formatter, exc_info: bool) -> float:
+    """
+    Records per second formatted by the formatter
+    """
+    records = [make_record(exc_info) for _ in range(RECORDS)]
+    start = time.perf_counter()
+    for record in records:
+        formatter.format(record)
+    return RECORDS / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    formatters = {
+        'python-json-logger': PythonJsonLoggerFormatter(  # type: ignore[no-untyped-call]
+            ' '.join(f'%({field})s' for field in JSON_LOG_FIELDS)
+        ),
+        'JsonFormatter (orjson)': JsonFormatter(),
+    }
+    for exc_info in (False, True):
+        print(f'exc_info={exc_info}')  # noqa: T001
+        for name, formatter in formatters.items():
+            print(f'  {name:28} {records_per_second(formatter, exc_info):>10,.0f} records/s')  # noqa: T001
+        # Without orjson, as if it's not installed
+        with mock.patch.object(logging_config, 'orjson', None):
+            fallback = records_per_second(JsonFormatter(), exc_info)
+        print(f'  {"JsonFormatter (json)":28} {fallback:>10,.0f} records/s')  # noqa: T001
@@ -0,0 +1,58 @@
+"""
+Event loop time spent per log call, with the default `StreamHandler` and with `queue=True`.
+
+The stream simulates a slow stdout/log shipper. Run with `python -m benchmarks.logging_queue`.
+"""
+import asyncio
+import io
+import logging
+import time
+from logging.config import dictConfig
+
+from fastapi_stack_utils.logging_config import generate_base_logging_config, stop_queue_logging
+
+CALLS = 5_000
+WRITE_DELAY = 0.00005
+
+
+class Settings:
+    ENVIRONMENT = 'prod'
+
+
+class SlowStream(io.StringIO):
+    def write(self, s: str) -> int:
+        """
+        Write after a delay, like a stdout pipe that's slow to drain
+        """
+        time.sleep(WRITE_DELAY)
+        return super().write(s)
+
+
+async def log_calls(log: logging.Logger) -> float:
+    """
+    Average nanoseconds spent on the event loop per log call
+    """
+    start = time.perf_counter_ns()
+    for i in range(CALLS):
+        log.info('%s > [%s] | %s', 'user', 'POST', {'request': i})
+    return (time.perf_counter_ns() - start) / CALLS
+
+
+def run(queue: bool) -> float:
+    """
+    Configure logging with or without the queue, and measure the log calls
+    """
+    config = generate_base_logging_config(Settings(), queue=queue, queue_size=CALLS * 2)
+    config['handlers']['json']['stream'] = SlowStream()
+    dictConfig(config)
+    try:
+        return asyncio.run(log_calls(logging.getLogger('benchmark')))
+    finally:
+        stop_queue_logging()
+
+
+if __name__ == '__main__':
+    blocking = run(queue=False)
+    queued = run(queue=True)
+    print(f'StreamHandler:      {blocking / 1000:8.1f} µs per log call on the event loop')  # noqa: T001
+    print(f'QueueStreamHandler: {queued / 1000:8.1f} µs per log call on the event loop')  # noqa: T001
@@ -0,0 +1,88 @@
+"""
+Overhead of redacting a 1 MB body, compared to building its audit log representation without redaction:
+  - JSON: `str(parsed)` vs `str(redactor.redact_json(parsed))`
+  - text (truncated, form or non-JSON bodies, and responses): `redactor.redact_text(text)`
+
+Run with `python -m benchmarks.redaction`. Exits with status 1 if an overhead is above the budget.
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Any, Callable
+
+from fastapi_stack_utils.redaction import Redactor
+
+BODY_SIZE = 1024 * 1024
+
+
+def make_body(size: int) -> Any:
+    """
+    JSON body of about `size` bytes, with some sensitive keys and values nested in ordinary records
+    """
+    record = {
+        'id': 0,
+        'name': 'Some name',
+        'email': 'someone@example.com',
+        'tags': ['a', 'b', 'c'],
+        'settings': {'password': 'hunter2', 'theme': 'dark', 'api_key': 'abc123'},
+        'card': '1234-5678-1234-5678',
+    }
+    records = max(size // len(json.dumps(record)), 1)
+    return {'items': [{**record, 'id': index} for index in range(records)]}
+
+
+def best_of(function: Callable[[], Any], repeat: int) -> float:
+    """
+    Fastest of `repeat` runs, in milliseconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def run(size: int, repeat: int) -> dict[str, float]:
+    """
+    Time each variant on a body of `size` bytes, returning milliseconds per MB
+    """
+    redactor = Redactor(patterns=[r'\b\d{4}-\d{4}-\d{4}-\d{4}\b'])
+    parsed = make_body(size)
+    text = json.dumps(parsed)
+    megabytes = len(text) / BODY_SIZE
+    results = {
+        'json_unredacted': best_of(lambda: str(parsed), repeat),
+        'json_redacted': best_of(lambda: str(redactor.redact_json(parsed)), repeat),
+        'text_redacted': best_of(lambda: redactor.redact_text(text), repeat),
+    }
+    return {name: milliseconds / megabytes for name, milliseconds in results.items()}
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Run the benchmark and check the overhead against the budget
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=BODY_SIZE, help='Body size in bytes')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=100, help='Allowed redaction overhead in ms per MB')
+    args = parser.parse_args(argv)
+
+    results = run(args.size, args.repeat)
+    overheads = {
+        'json': results['json_redacted'] - results['json_unredacted'],
+        'text': results['text_redacted'],
+    }
+    for name, milliseconds in results.items():
+        print(f'{name:16} {milliseconds:8.2f} ms/MB')  # noqa: T001
+    over_budget = False
+    for name, overhead in overheads.items():
+        print(f'{name} overhead    {overhead:8.2f} ms/MB (budget {args.budget_ms:.0f})')  # noqa: T001
+        over_budget = over_budget or overhead > args.budget_ms
+    return 1 if over_budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,33 @@
-from fastapi_stack_utils.schemas.http_exceptions import DefaultError, ErrorResponse, ServerError  # noqa
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:  # pragma: no cover
+    from fastapi_stack_utils.schemas.http_exceptions import DefaultError, ErrorResponse, ServerError
 
 __version__ = '0.8.7'
+__all__ = ['DefaultError', 'ErrorResponse', 'ServerError']
+
+# Names re-exported from submodules, imported on first access (PEP 562) so `import fastapi_stack_utils` stays cheap
+_lazy_imports = {
+    'DefaultError': 'fastapi_stack_utils.schemas.http_exceptions',
+    'ErrorResponse': 'fastapi_stack_utils.schemas.http_exceptions',
+    'ServerError': 'fastapi_stack_utils.schemas.http_exceptions',
+}
+
+
+def __getattr__(name: str) -> Any:
+    """
+    Import lazily re-exported names on first access
+    """
+    if name not in _lazy_imports:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(import_module(_lazy_imports[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    """
+    Include the lazily re-exported names
+    """
+    return sorted([*globals(), *_lazy_imports])
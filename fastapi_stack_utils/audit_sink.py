@@ -0,0 +1,213 @@
+import logging
+import sqlite3
+from datetime import datetime
+from logging import Handler, LogRecord
+from pathlib import Path
+from queue import Empty, Full, Queue
+from time import monotonic
+from typing import Any
+
+from fastapi_stack_utils.background import BackgroundThread
+
+log = logging.getLogger('fastapi_stack_utils.audit_sink')
+
+AUDIT_COLUMNS = ('created', 'user', 'method', 'path', 'query', 'body', 'correlation_id')
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS audit (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    user TEXT,
+    method TEXT,
+    path TEXT,
+    query TEXT,
+    body TEXT,
+    correlation_id TEXT
+);
+CREATE INDEX IF NOT EXISTS audit_created ON audit (created);
+CREATE INDEX IF NOT EXISTS audit_user_created ON audit (user, created);
+CREATE INDEX IF NOT EXISTS audit_path_created ON audit (path, created);
+CREATE INDEX IF NOT EXISTS audit_method_created ON audit (method, created);
+"""
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Open the audit database in WAL mode, so it can be queried while workers append to it
+    """
+    connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    # With WAL, `NORMAL` only syncs on checkpoints, and is still safe against corruption
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class SqliteAuditHandler(Handler):
+    """
+    Logging handler storing the request records of `AuditLog` (user, method, path, query and body) in SQLite.
+    Other records, and those of warmup requests, are ignored, so it can be added to the `fastapi_stack_utils.route`
+    logger.
+
+    `emit` only puts the row on a bounded queue, and never blocks: rows are dropped and counted in `dropped` when
+    it's full. A background thread inserts the rows in batches of up to `batch_size`, at least every
+    `flush_interval` seconds. If the database can't be opened, the error is logged once, and later rows are dropped
+    until `start` is called again.
+    """
+
+    def __init__(self, path: str, batch_size: int = 500, flush_interval: float = 1.0, maxsize: int = 10_000) -> None:
+        super().__init__()
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows: Queue[tuple[Any, ...] | None] = Queue(maxsize)
+        self.dropped = 0
+        self.writer = BackgroundThread(self.write_batches, 'audit-sink')
+        # Why the database could not be opened, so records don't retry it one by one
+        self.connect_error: sqlite3.Error | None = None
+
+    @property
+    def running(self) -> bool:
+        """
+        Whether queued rows are being written to the database
+        """
+        return self.writer.running
+
+    def start(self) -> None:
+        """
+        Open the database and start writing queued rows, e.g. on warmup, so the first request doesn't do it.
+        Tries again if the database could not be opened.
+        """
+        self.connect_error = None
+        self.writer.start()
+
+    def emit(self, record: LogRecord) -> None:
+        """
+        Queue the row of an audit record
+        """
+        if not hasattr(record, 'method') or not hasattr(record, 'str_body') or getattr(record, 'warmup', False):
+            return
+        if self.connect_error is not None:
+            self.dropped += 1
+            return
+        self.writer.start()
+        row = (
+            record.created,
+            getattr(record, 'user', None),
+            record.method,
+            getattr(record, 'path', None),
+            getattr(record, 'query', None),
+            record.str_body,
+            getattr(record, 'correlation_id', None),
+        )
+        try:
+            self.rows.put_nowait(row)
+        except Full:
+            self.dropped += 1
+
+    def write_batches(self) -> None:
+        """
+        Insert queued rows in batches until stopped
+        """
+        try:
+            connection = connect(self.path)
+        except sqlite3.Error as error:
+            self.connect_error = error
+            log.exception('Could not open the audit database %s, audit records are dropped', self.path)
+            # Rows queued before the error was recorded
+            while True:
+                try:
+                    row = self.rows.get_nowait()
+                except Empty:
+                    return
+                if row is not None:
+                    self.dropped += 1
+        stopped = False
+        try:
+            while not stopped:
+                batch: list[tuple[Any, ...]] = []
+                deadline = monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    try:
+                        row = self.rows.get(timeout=max(deadline - monotonic(), 0))
+                    except Empty:
+                        break
+                    if row is None:
+                        stopped = True
+                        break
+                    batch.append(row)
+                if batch:
+                    try:
+                        with connection:
+                            connection.executemany(
+                                f'INSERT INTO audit ({", ".join(AUDIT_COLUMNS)}) VALUES ({", ".join("?" * 7)})', batch
+                            )
+                    except sqlite3.Error:
+                        log.exception('Could not write %s audit records to %s', len(batch), self.path)
+        finally:
+            connection.close()
+
+    def flush(self) -> None:
+        """
+        Write all queued rows and stop the writer thread. It's restarted by the next record.
+        """
+        self.writer.stop(lambda: self.rows.put(None))
+        if self.dropped:
+            reason = 'the audit sink was full' if self.connect_error is None else 'the database could not be opened'
+            log.warning('Dropped %s audit records, %s', self.dropped, reason)
+            self.dropped = 0
+
+    def close(self) -> None:
+        """
+        Flush when the handler is closed, e.g. on reconfiguration or interpreter shutdown
+        """
+        self.flush()
+        super().close()
+
+
+def query_audit_log(
+    path: str,
+    user: str | None = None,
+    method: str | None = None,
+    request_path: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    limit: int = 100,
+) -> list[sqlite3.Row]:
+    """
+    Return the newest audit records matching all given filters. `request_path` ending with `*` is a prefix.
+    The database is opened read-only, and a missing file raises `FileNotFoundError` rather than creating it.
+    """
+    conditions = []
+    parameters: list[Any] = []
+    if user is not None:
+        conditions.append('user = ?')
+        parameters.append(user)
+    if method is not None:
+        conditions.append('method = ?')
+        parameters.append(method.upper())
+    if request_path is not None and request_path.endswith('*'):
+        # A range rather than LIKE, so the index is used
+        prefix = request_path[:-1]
+        conditions.append('path >= ? AND path < ?')
+        parameters += [prefix, prefix + '\U0010ffff']
+    elif request_path is not None:
+        conditions.append('path = ?')
+        parameters.append(request_path)
+    if since is not None:
+        conditions.append('created >= ?')
+        parameters.append(since.timestamp())
+    if until is not None:
+        conditions.append('created < ?')
+        parameters.append(until.timestamp())
+    where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+
+    if not Path(path).is_file():
+        raise FileNotFoundError(f'No audit database at `{path}`')
+    connection = sqlite3.connect(f'{Path(path).absolute().as_uri()}?mode=ro', uri=True, timeout=30)
+    connection.row_factory = sqlite3.Row
+    try:
+        return connection.execute(
+            f'SELECT {", ".join(AUDIT_COLUMNS)} FROM audit {where} ORDER BY created DESC LIMIT ?', [*parameters, limit]
+        ).fetchall()
+    finally:
+        connection.close()
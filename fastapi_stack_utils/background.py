@@ -0,0 +1,44 @@
+from threading import Lock, Thread
+from typing import Callable
+
+
+class BackgroundThread:
+    """
+    Daemon thread running `target`, which is expected to loop until it's told to stop, e.g. by a sentinel on a queue.
+
+    The thread is started on demand, and `start` only checks whether it's alive rather than whether it was started:
+    threads do not survive a fork (e.g. gunicorn with `--preload`), so a forked worker starts its own.
+    """
+
+    def __init__(self, target: Callable[[], None], name: str) -> None:
+        self.target = target
+        self.name = name
+        self.thread: Thread | None = None
+        self.lock = Lock()
+
+    @property
+    def running(self) -> bool:
+        """
+        Whether the thread is alive
+        """
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self) -> None:
+        """
+        Start the thread, if it's not already running
+        """
+        if self.running:
+            return
+        with self.lock:
+            if not self.running:
+                self.thread = Thread(target=self.target, name=self.name, daemon=True)
+                self.thread.start()
+
+    def stop(self, signal: Callable[[], None]) -> None:
+        """
+        If the thread is running, call `signal`, which must make `target` return, and wait for the thread to end
+        """
+        with self.lock:
+            if self.running:
+                signal()
+                self.thread.join()  # type: ignore[union-attr]
@@ -0,0 +1,342 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+from time import monotonic
+from typing import TYPE_CHECKING, Iterable
+
+from fastapi_stack_utils.warmup import is_warmup_request
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.routing import Match
+
+if TYPE_CHECKING:  # pragma: no cover
+    from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+CacheKey = tuple[str, bytes, tuple[str, ...]]
+
+
+class CachedResponse:
+    __slots__ = ('status', 'headers', 'body', 'etag', 'expires', 'size')
+
+    def __init__(self, status: int, headers: list[tuple[bytes, bytes]], body: bytes, etag: str, ttl: float) -> None:
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.expires = monotonic() + ttl
+        self.size = len(body) + sum(len(name) + len(value) for name, value in headers)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Weak comparison of `If-None-Match` against an ETag, as required for GET/HEAD
+    """
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag.removeprefix('W/')
+    return any(candidate.strip().removeprefix('W/') == opaque for candidate in if_none_match.split(','))
+
+
+def _max_age(cache_control: str) -> float | None:
+    """
+    `s-maxage` or `max-age` of a `Cache-Control` header, if any
+    """
+    directives = {}
+    for directive in cache_control.lower().split(','):
+        name, _, value = directive.strip().partition('=')
+        directives[name] = value.strip('"')
+    for name in ('s-maxage', 'max-age'):
+        if directives.get(name, '').isdigit():
+            return float(directives[name])
+    return None
+
+
+class ResponseCacheMiddleware:
+    """
+    Pure ASGI middleware caching GET responses in memory, and serving GET and HEAD requests from the cache.
+
+    Responses are keyed by path, query string and the `vary` request headers, and cached for:
+    * the TTL of the route template in `route_ttls` (`0` disables caching the route), or else
+    * the `s-maxage`/`max-age` of the response's `Cache-Control` header, or else
+    * `ttl` seconds.
+    Only complete 200 responses without `Set-Cookie`, `Cache-Control: no-store` or `private` are cached, and
+    requests with `Authorization` or `Cookie` headers are not served from the cache, unless they are in `vary`.
+
+    The cache is an LRU bounded by `max_bytes`, and a response larger than `max_entry_bytes` is not cached.
+    Concurrent misses for the same key are coalesced: one request runs the app, and the others wait for its
+    response. Routes with a TTL of `0` are never coalesced, and as soon as a response turns out not to be cacheable,
+    the waiting requests are released to run the app themselves, and its key is not coalesced for
+    `uncacheable_ttl` seconds. Responses get an `ETag` (kept if the app set one), and requests with a matching
+    `If-None-Match` get a `304 Not Modified`.
+    """
+
+    def __init__(
+        self,
+        app: 'ASGIApp',
+        ttl: float = 60.0,
+        route_ttls: dict[str, float] | None = None,
+        vary: Iterable[str] = ('accept', 'accept-encoding'),
+        max_bytes: int = 64 * 1024 * 1024,
+        max_entry_bytes: int = 1024 * 1024,
+        uncacheable_ttl: float = 10.0,
+    ) -> None:
+        self.app = app
+        self.ttl = ttl
+        self.route_ttls = route_ttls or {}
+        self.vary = tuple(header.lower() for header in vary)
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.entries: OrderedDict[CacheKey, CachedResponse] = OrderedDict()
+        self.size = 0
+        self.uncacheable_ttl = uncacheable_ttl
+        self.in_flight: dict[CacheKey, asyncio.Event] = {}
+        # Keys whose last response could not be cached, and when to try caching them again
+        self.uncacheable: OrderedDict[CacheKey, float] = OrderedDict()
+        # Route TTLs resolved per path, for the routes with a TTL in `route_ttls`
+        self._path_ttls: dict[str, float | None] = {}
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key: CacheKey) -> CachedResponse | None:
+        """
+        Return the cached response, if it has not expired, and mark it as recently used
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= monotonic():
+            self.remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def remove(self, key: CacheKey) -> None:
+        """
+        Remove a response from the cache
+        """
+        entry = self.entries.pop(key)
+        self.size -= entry.size
+
+    def store(self, key: CacheKey, entry: CachedResponse) -> None:
+        """
+        Cache a response, evicting the least recently used responses to stay within `max_bytes`
+        """
+        if key in self.entries:
+            self.remove(key)
+        if entry.size > self.max_bytes:
+            return
+        self.entries[key] = entry
+        self.size += entry.size
+        while self.size > self.max_bytes:
+            self.remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        Remove all cached responses
+        """
+        self.entries.clear()
+        self.size = 0
+
+    def mark_uncacheable(self, key: CacheKey) -> None:
+        """
+        Send requests for this key straight to the app for `uncacheable_ttl` seconds
+        """
+        self.uncacheable[key] = monotonic() + self.uncacheable_ttl
+        self.uncacheable.move_to_end(key)
+        if len(self.uncacheable) > 10_000:
+            self.uncacheable.popitem(last=False)
+
+    def is_uncacheable(self, key: CacheKey) -> bool:
+        """
+        Whether the last response for this key could not be cached, recently
+        """
+        expires = self.uncacheable.get(key)
+        if expires is None:
+            return False
+        if expires <= monotonic():
+            del self.uncacheable[key]
+            return False
+        return True
+
+    def route_ttl(self, scope: 'Scope') -> float | None:
+        """
+        The TTL in `route_ttls` of the route matching the request, if any, resolved before the app runs
+        """
+        if not self.route_ttls or 'app' not in scope:
+            return None
+        path = scope['path']
+        if path in self._path_ttls:
+            return self._path_ttls[path]
+        ttl = None
+        for route in getattr(scope['app'], 'routes', ()):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                ttl = self.route_ttls.get(getattr(route, 'path', None))  # type: ignore[arg-type]
+                break
+        if len(self._path_ttls) < 10_000:
+            self._path_ttls[path] = ttl
+        return ttl
+
+    async def __call__(self, scope: 'Scope', receive: 'Receive', send: 'Send') -> None:
+        """
+        Serve the request from the cache, or run the app and cache its response
+        """
+        if scope['type'] != 'http' or scope['method'] not in ('GET', 'HEAD') or is_warmup_request(scope):
+            # Warmup requests should run the routes, and not fill the cache
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        if any(name in request_headers and name not in self.vary for name in ('authorization', 'cookie')):
+            await self.app(scope, receive, send)
+            return
+
+        key = (scope['path'], scope['query_string'], tuple(request_headers.get(name, '') for name in self.vary))
+        entry = self.get(key)
+        if entry is None and key in self.in_flight:
+            # Another request is already running the app for this key, wait for its response
+            self.coalesced += 1
+            await self.in_flight[key].wait()
+            entry = self.get(key)
+            if entry is None:
+                # The response could not be cached, so don't wait for another request
+                self.misses += 1
+                await self.app(scope, receive, send)
+                return
+        if entry is not None:
+            self.hits += 1
+            await self.send_cached(entry, scope['method'] == 'HEAD', request_headers.get('if-none-match'), send)
+            return
+
+        self.misses += 1
+        route_ttl = self.route_ttl(scope)
+        if scope['method'] == 'HEAD' or (route_ttl is not None and route_ttl <= 0) or self.is_uncacheable(key):
+            # HEAD responses have no body to cache, and uncacheable responses are not worth waiting for
+            await self.app(scope, receive, send)
+            return
+        done = self.in_flight[key] = asyncio.Event()
+        try:
+            await self.run_and_cache(key, scope, receive, send, request_headers.get('if-none-match'), done)
+        finally:
+            if self.in_flight.get(key) is done:
+                del self.in_flight[key]
+            done.set()
+
+    async def send_cached(self, entry: CachedResponse, head: bool, if_none_match: str | None, send: 'Send') -> None:
+        """
+        Send a cached response, or `304 Not Modified` if the client has it
+        """
+        if if_none_match is not None and _etag_matches(if_none_match, entry.etag):
+            headers = [(name, value) for name, value in entry.headers if name in (b'etag', b'cache-control', b'vary')]
+            await send({'type': 'http.response.start', 'status': 304, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        await send({'type': 'http.response.start', 'status': entry.status, 'headers': entry.headers})
+        await send({'type': 'http.response.body', 'body': b'' if head else entry.body})
+
+    async def run_and_cache(
+        self,
+        key: CacheKey,
+        scope: 'Scope',
+        receive: 'Receive',
+        send: 'Send',
+        if_none_match: str | None,
+        done: asyncio.Event,
+    ) -> None:
+        """
+        Run the app, passing the response on while capturing it, and cache it if it's cacheable.
+        The response start is held until the first body chunk, so a complete body gets its ETag before it's sent.
+        `done` is set as soon as the response turns out not to be cacheable, to release the waiting requests.
+        """
+        response_start: 'Message' = {}
+        held = False
+        chunks: list[bytes] = []
+        captured = 0
+        cacheable = False
+
+        def give_up() -> None:
+            nonlocal cacheable
+            cacheable = False
+            chunks.clear()
+            self.mark_uncacheable(key)
+            done.set()
+
+        async def send_wrapper(message: 'Message') -> None:
+            nonlocal response_start, held, captured, cacheable
+            if message['type'] == 'http.response.start':
+                response_start = message
+                held = True
+                headers = Headers(raw=message['headers'])
+                cache_control = headers.get('cache-control', '').lower()
+                if (
+                    message['status'] == 200
+                    and 'set-cookie' not in headers
+                    and 'no-store' not in cache_control
+                    and 'private' not in cache_control
+                ):
+                    cacheable = True
+                else:
+                    give_up()
+                return
+            if message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if cacheable:
+                captured += len(body)
+                if captured > self.max_entry_bytes:
+                    give_up()
+                else:
+                    chunks.append(body)
+            if held:
+                held = False
+                if cacheable and not more_body:
+                    # The whole body is known before anything is sent
+                    headers = MutableHeaders(raw=response_start['headers'])
+                    if 'etag' not in headers:
+                        headers['etag'] = self.etag(body)
+                    if if_none_match is not None and _etag_matches(if_none_match, headers['etag']):
+                        if not self.store_response(key, scope, response_start, chunks):
+                            give_up()
+                        etag = headers['etag'].encode('latin-1')
+                        await send({'type': 'http.response.start', 'status': 304, 'headers': [(b'etag', etag)]})
+                        await send({'type': 'http.response.body', 'body': b''})
+                        return
+                await send(response_start)
+            await send(message)
+            if cacheable and not more_body and not self.store_response(key, scope, response_start, chunks):
+                give_up()
+
+        await self.app(scope, receive, send_wrapper)
+
+    def store_response(self, key: CacheKey, scope: 'Scope', start: 'Message', chunks: list[bytes]) -> bool:
+        """
+        Cache a complete response, for the TTL of its route. Returns whether it was cached.
+        """
+        headers = MutableHeaders(raw=list(start['headers']))
+        route = getattr(scope.get('route'), 'path', None)
+        ttl = self.route_ttls.get(route) if route is not None else None
+        if ttl is None:
+            ttl = _max_age(headers.get('cache-control', ''))
+        if ttl is None:
+            ttl = self.ttl
+        if ttl <= 0:
+            return False
+        body = b''.join(chunks)
+        if 'etag' not in headers:
+            headers['etag'] = self.etag(body)
+        # The length of a streamed body is only known now
+        headers['content-length'] = str(len(body))
+        self.store(key, CachedResponse(start['status'], headers.raw, body, headers['etag'], ttl))
+        return key in self.entries
+
+    @staticmethod
+    def etag(body: bytes) -> str:
+        """
+        Strong ETag of a body
+        """
+        return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
@@ -1,17 +1,92 @@
-from fastapi_stack_utils.cli.load_docker_env import load_docker_env
-from typer import Typer
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from fastapi_stack_utils.cli.load_docker_env import DEFAULT_KEYS, DEFAULT_VAULT_ADDRESS, load_docker_env
+from typer import Exit, Option, Typer, echo
 
 cli = Typer()
 
 
 @cli.command()
-def load_env() -> None:
+def load_env(
+    environment: Optional[list[str]] = Option(
+        None, help='Environments to read, `ENVIRONMENT` or `dev` by default. Repeat for several, later ones win'
+    ),
+    path: Optional[list[str]] = Option(None, help='Extra secret paths to read, e.g. `kv-nsa/data/shared/dev`'),
+    key: list[str] = Option(list(DEFAULT_KEYS), help='Keys to write, `*` patterns allowed. Repeat for several'),
+    output: Path = Option(Path('.env'), help='File to write'),
+    vault_address: Optional[str] = Option(
+        None, envvar='VAULT_ADDR', help=f'Vault URL, {DEFAULT_VAULT_ADDRESS} by default'
+    ),
+    project: Optional[str] = Option(None, help='Project name, from the git remote by default'),
+) -> None:
     """
     Loads environment variables for Docker from Vault and writes to `.env`.
     Warning: Will overwrite `.env` file.
-    Requires `vault` to be installed
+    Requires `vault` to be installed, unless `VAULT_TOKEN` or `~/.vault-token` holds a valid token
+    """
+    # Imported here, as they load the Vault client, which the other commands don't need
+    from hvac.exceptions import VaultError  # type: ignore[import]
+    from requests import RequestException
+
+    try:
+        secrets = load_docker_env(
+            environments=environment or None,
+            paths=path or (),
+            keys=key,
+            output=output,
+            vault_address=vault_address,
+            project_name=project,
+        )
+    except ValueError as error:
+        echo(str(error), err=True)
+        raise Exit(1)
+    except (VaultError, RequestException) as error:
+        # Vault's error messages span several lines
+        echo(f'Could not read the secrets from Vault: {" ".join(str(error).split())}', err=True)
+        raise Exit(1)
+    echo(f'Wrote {len(secrets)} variables to {output}')
+
+
+@cli.command()
+def clear_vault_cache() -> None:
     """
-    load_docker_env()
+    Deletes the local cache of Vault secrets used by `CustomBaseSettings`, forcing them to be fetched again.
+    """
+    # Imported here, as it loads the Vault client, which the other commands don't need
+    from fastapi_stack_utils.vault_cache import invalidate_vault_cache
+
+    invalidate_vault_cache()
+
+
+@cli.command()
+def audit(
+    db: str = Option('audit.db', envvar='FSU_AUDIT_DB', help='SQLite database written by `SqliteAuditHandler`'),
+    user: Optional[str] = Option(None, help='Remote user'),
+    method: Optional[str] = Option(None, help='HTTP method'),
+    path: Optional[str] = Option(None, help='Request path, ending with `*` to match a prefix'),
+    since: Optional[datetime] = Option(None, help='Only requests at or after this time (local time)'),
+    until: Optional[datetime] = Option(None, help='Only requests before this time (local time)'),
+    limit: int = Option(100, help='Maximum number of requests, newest first'),
+) -> None:
+    """
+    Query the audit log stored by `SqliteAuditHandler`
+    """
+    # Imported here, so the other commands don't load sqlite
+    import sqlite3
+
+    from fastapi_stack_utils.audit_sink import query_audit_log
+
+    try:
+        rows = query_audit_log(db, user=user, method=method, request_path=path, since=since, until=until, limit=limit)
+    except (OSError, sqlite3.DatabaseError) as error:
+        echo(str(error), err=True)
+        raise Exit(1)
+    for row in rows:
+        created = datetime.fromtimestamp(row['created']).isoformat(sep=' ', timespec='milliseconds')
+        details = ' | '.join(filter(None, [row['path'], row['query'], row['body']]))
+        echo(f'{created} [{row["correlation_id"] or "-"}] {row["user"]} > [{row["method"]}] | {details}')
 
 
 @cli.command()
@@ -1,62 +1,153 @@
+import json
 import os
+import re
 import subprocess
-from subprocess import CalledProcessError
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Iterable
 
+if TYPE_CHECKING:  # pragma: no cover
+    import hvac  # type: ignore[import]
 
-def load_docker_env() -> None:
+DEFAULT_VAULT_ADDRESS = 'https://vault.intility.com'
+DEFAULT_MOUNT = 'kv-nsa'
+DEFAULT_KEYS = ('POSTGRES_PASSWORD', 'REDIS_PASSWORD')
+# Values which can be written to `.env` without quotes
+_PLAIN_VALUE = re.compile(r'[\w./:@+,-]*')
+
+
+def project_name_from_git(cwd: Path | None = None) -> str:
     """
-    Reads secrets from Vault for project and writes docker specific environment variables to `.env`
-    Checks if user has valid token, if not, triggers loging flow for Vault CLI
-    Uses repo name from git as path for Vault
+    The project name, from the URL of the `origin` remote (or the first remote) of the git repository at `cwd`.
+    Both `git@host:group/project.git` and `https://host/group/project.git` are supported, and `-backend`/`-build`
+    suffixes are removed.
     """
-    git_remote = subprocess.run(['git', 'remote', '-v'], check=True, stdout=subprocess.PIPE).stdout.decode('utf-8')
+    try:
+        result = subprocess.run(
+            ['git', 'config', '--get-regexp', r'^remote\..*\.url$'], cwd=cwd, capture_output=True, text=True
+        )
+    except FileNotFoundError:
+        raise ValueError('git is not installed, pass the project name') from None
+    urls = dict(line.split(maxsplit=1) for line in result.stdout.splitlines() if ' ' in line)
+    if not urls:
+        raise ValueError('No git remote found, pass the project name')
+    url = urls.get('remote.origin.url') or next(iter(urls.values()))
+    repository = url.strip().rstrip('/').rsplit('/', 1)[-1].rsplit(':', 1)[-1]
+    return repository.removesuffix('.git').removesuffix('-backend').removesuffix('-build')
 
-    project_name = (
-        git_remote.split('\n')[0]
-        .split()[1]
-        .split('@')[1]
-        .split(':')[1]
-        .split('/')[-1]
-        .removesuffix('.git')
-        .strip()
-        .removesuffix('-backend')
-        .removesuffix('-build')
-    )
 
-    vault_address = os.environ.get('VAULT_ADDR', 'https://vault.intility.com')
-    vault_env = os.environ.get('ENVIRONMENT', 'dev')
+def get_vault_client(vault_address: str) -> 'hvac.Client':
+    """
+    A Vault client with a valid token, from `VAULT_TOKEN` or the token file of the Vault CLI.
+    Without a valid token, the login flow of the Vault CLI is started.
+    """
+    # Imported here, so the other commands don't load the Vault client
+    import hvac
 
-    try:
-        subprocess.run(
-            ['vault', 'token', 'lookup', f'-address={vault_address}'], check=True, stdout=subprocess.PIPE
-        ).stdout.decode('utf-8')
-    except CalledProcessError:
+    token_file = Path.home() / '.vault-token'
+    token = os.environ.get('VAULT_TOKEN') or (token_file.read_text().strip() if token_file.exists() else None)
+    client = hvac.Client(url=vault_address, token=token)
+    if not client.is_authenticated():
         subprocess.run(
             ['vault', 'login', f'-address={vault_address}', '-method=oidc', '-path=aa'],
             check=True,
             stdout=subprocess.PIPE,
-        ).stdout.decode('utf-8')
-
-    secrets = (
-        subprocess.run(
-            [
-                'vault',
-                'read',
-                f'-address={vault_address}',
-                '-field=data',
-                '-format=yaml',
-                f'kv-nsa/data/{project_name}/{vault_env}/',
-            ],
-            check=True,
-            stdout=subprocess.PIPE,
         )
-        .stdout.decode('utf-8')
-        .replace(': ', '=')
-    )
+        client.token = token_file.read_text().strip()
+    return client
+
+
+def fetch_secrets(client: 'hvac.Client', paths: Iterable[str], max_workers: int = 8) -> dict[str, dict[str, Any]]:
+    """
+    Read the KV v2 secrets at all paths concurrently, over the pooled connections of the client
+    """
+    paths = list(paths)
+
+    def read(path: str) -> dict[str, Any]:
+        response = client.read(path)
+        if response is None:
+            raise ValueError(f'Vault has no secrets at `{path}`')
+        return response['data']['data']  # type: ignore[no-any-return]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths) or 1)) as executor:
+        return dict(zip(paths, executor.map(read, paths)))
 
-    docker_secrets = '\n'.join(
-        [secret for secret in secrets.split('\n') if secret.split('=')[0] in ['POSTGRES_PASSWORD', 'REDIS_PASSWORD']]
-    )
 
-    with open('.env', 'w') as docker_env:
-        docker_env.write(docker_secrets + '\n')
+def filter_secrets(secrets: dict[str, Any], keys: Iterable[str]) -> dict[str, Any]:
+    """
+    The secrets whose key matches one of the `keys` patterns, e.g. `POSTGRES_*` or `*`
+    """
+    keys = list(keys)
+    return {key: value for key, value in secrets.items() if any(fnmatchcase(key, pattern) for pattern in keys)}
+
+
+def format_env_value(value: Any) -> str:
+    """
+    Format a value for a docker compose `.env` file, quoting it if needed
+    """
+    if isinstance(value, str):
+        text = value
+    else:
+        text = json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+    if _PLAIN_VALUE.fullmatch(text):
+        return text
+    if "'" not in text and '\n' not in text:
+        # Single quoted values are used as they are
+        return f"'{text}'"
+    escaped = text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('$', '$$')
+    return f'"{escaped}"'
+
+
+def write_env_file(path: Path, secrets: dict[str, Any]) -> None:
+    """
+    Write the secrets to a `.env` file readable by the owner only, replacing it atomically
+    """
+    content = ''.join(f'{key}={format_env_value(value)}\n' for key, value in secrets.items())
+    fd, temporary_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as env_file:
+            env_file.write(content)
+            env_file.flush()
+            os.fsync(env_file.fileno())
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+def load_docker_env(
+    environments: Iterable[str] | None = None,
+    paths: Iterable[str] = (),
+    keys: Iterable[str] = DEFAULT_KEYS,
+    output: Path = Path('.env'),
+    vault_address: str | None = None,
+    mount: str = DEFAULT_MOUNT,
+    project_name: str | None = None,
+) -> dict[str, Any]:
+    """
+    Reads secrets from Vault for project and writes docker specific environment variables to `.env`
+    Checks if user has valid token, if not, triggers loging flow for Vault CLI
+    Uses repo name from git as path for Vault
+
+    The secrets of all `environments` (`ENVIRONMENT` or `dev` by default, unless `paths` are given) and `paths` are
+    fetched concurrently, and merged in that order, so later ones win. Only keys matching the `keys` patterns are
+    written.
+    """
+    vault_address = vault_address or os.environ.get('VAULT_ADDR') or DEFAULT_VAULT_ADDRESS
+    paths = list(paths)
+    if environments is None:
+        environments = [] if paths else [os.environ.get('ENVIRONMENT', 'dev')]
+    secret_paths = []
+    for environment in environments:
+        project_name = project_name or project_name_from_git()
+        secret_paths.append(f'{mount}/data/{project_name}/{environment}')
+    secret_paths += paths
+
+    fetched = fetch_secrets(get_vault_client(vault_address), secret_paths)
+    secrets = {}
+    for path in secret_paths:
+        secrets.update(filter_secrets(fetched[path], keys))
+    write_env_file(output, secrets)
+    return secrets
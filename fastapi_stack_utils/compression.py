@@ -0,0 +1,258 @@
+import zlib
+from typing import TYPE_CHECKING, Callable, Iterable, Protocol
+
+from starlette.datastructures import Headers, MutableHeaders
+
+if TYPE_CHECKING:  # pragma: no cover
+    from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli  # type: ignore[import]
+except ModuleNotFoundError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard  # type: ignore[import]
+except ModuleNotFoundError:  # pragma: no cover
+    zstandard = None
+
+# Media types which are already compressed, or streamed to the client event by event
+SKIPPED_MEDIA_TYPES = (
+    'image/',
+    'video/',
+    'audio/',
+    'font/woff',
+    'application/zip',
+    'application/gzip',
+    'application/x-gzip',
+    'application/zstd',
+    'application/octet-stream',
+    'text/event-stream',
+)
+DEFAULT_LEVELS = {'br': 4, 'zstd': 3, 'gzip': 6, 'deflate': 6}
+
+
+class Compressor(Protocol):
+    def compress(self, data: bytes) -> bytes:
+        """
+        Compress a chunk, flushing it so the client can decompress it without waiting for the next one
+        """
+
+    def finish(self, data: bytes = b'') -> bytes:
+        """
+        Compress the last chunk, and end the stream
+        """
+
+
+class ZlibCompressor:
+    """
+    `zlib` compressor, in the `wbits` format
+    """
+
+    def __init__(self, level: int, wbits: int) -> None:
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def compress(self, data: bytes) -> bytes:
+        """
+        Compress the chunk, ending with a sync flush
+        """
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b'') -> bytes:
+        """
+        Compress the last chunk, and write the end of the stream
+        """
+        return self.compressor.compress(data) + self.compressor.flush()
+
+
+class BrotliCompressor:
+    """
+    `brotli.Compressor`
+    """
+
+    def __init__(self, level: int) -> None:
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        """
+        Compress the chunk, and flush the brotli stream
+        """
+        return self.compressor.process(data) + self.compressor.flush()  # type: ignore[no-any-return]
+
+    def finish(self, data: bytes = b'') -> bytes:
+        """
+        Compress the last chunk, and finish the brotli stream
+        """
+        return self.compressor.process(data) + self.compressor.finish()  # type: ignore[no-any-return]
+
+
+class ZstdCompressor:
+    """
+    `zstandard` compression object
+    """
+
+    def __init__(self, level: int) -> None:
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        """
+        Compress the chunk, and flush the current zstd block
+        """
+        return self.compressor.compress(data) + self.compressor.flush(  # type: ignore[no-any-return]
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self, data: bytes = b'') -> bytes:
+        """
+        Compress the last chunk, and end the zstd frame
+        """
+        return self.compressor.compress(data) + self.compressor.flush()  # type: ignore[no-any-return]
+
+
+COMPRESSORS: dict[str, Callable[[int], Compressor]] = {
+    'gzip': lambda level: ZlibCompressor(level, zlib.MAX_WBITS | 16),
+    # HTTP `deflate` is the zlib format, not raw deflate
+    'deflate': lambda level: ZlibCompressor(level, zlib.MAX_WBITS),
+}
+if brotli is not None:  # pragma: no cover
+    COMPRESSORS['br'] = BrotliCompressor
+if zstandard is not None:  # pragma: no cover
+    COMPRESSORS['zstd'] = ZstdCompressor
+
+
+def parse_accept_encoding(accept_encoding: str) -> dict[str, float]:
+    """
+    Encodings and their quality values from an `Accept-Encoding` header
+    """
+    encodings = {}
+    for part in accept_encoding.lower().split(','):
+        encoding, *parameters = (value.strip() for value in part.split(';'))
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if encoding:
+            encodings[encoding] = quality
+    return encodings
+
+
+class CompressionMiddleware:
+    """
+    Pure ASGI middleware compressing responses, chunk by chunk, with the best encoding in `Accept-Encoding`.
+    `encodings` is the order of preference: brotli and zstd are only used if `brotli`/`zstandard` are installed.
+
+    Unlike Starlette's `GZipMiddleware`, it's meant for `patch_fastapi_middlewares`, outside `ServerErrorMiddleware`,
+    so error responses rendered there go through the same rules as other responses. Streamed responses are never
+    buffered: every chunk is compressed and flushed, so it's sent as soon as the app sends it. A strong `ETag` is
+    made weak, since the body is re-encoded. Responses with a body smaller than `minimum_size` sent in a single chunk,
+    which includes most `ErrorResponse` bodies, an existing `Content-Encoding`, or a `SKIPPED_MEDIA_TYPES` media type
+    are sent as they are.
+    """
+
+    def __init__(
+        self,
+        app: 'ASGIApp',
+        minimum_size: int = 500,
+        encodings: Iterable[str] = ('br', 'zstd', 'gzip', 'deflate'),
+        levels: dict[str, int] | None = None,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = tuple(encoding for encoding in encodings if encoding in COMPRESSORS)
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+        # Clients send a handful of distinct headers, so remember the encoding chosen for each one
+        self._negotiated: dict[str, str | None] = {}
+
+    def negotiate(self, accept_encoding: str) -> str | None:
+        """
+        The preferred encoding accepted by the client, if any
+        """
+        if accept_encoding in self._negotiated:
+            return self._negotiated[accept_encoding]
+        accepted = parse_accept_encoding(accept_encoding)
+        wildcard = accepted.get('*', 0.0)
+        candidates = [encoding for encoding in self.encodings if accepted.get(encoding, wildcard) > 0]
+        encoding = max(candidates, key=lambda candidate: accepted.get(candidate, wildcard), default=None)
+        if len(self._negotiated) < 1000:
+            self._negotiated[accept_encoding] = encoding
+        return encoding
+
+    def should_compress(self, headers: Headers) -> bool:
+        """
+        Whether a response with these headers is compressed
+        """
+        if 'content-encoding' in headers:
+            return False
+        return not headers.get('content-type', '').lower().startswith(SKIPPED_MEDIA_TYPES)
+
+    async def __call__(self, scope: 'Scope', receive: 'Receive', send: 'Send') -> None:
+        """
+        Compress the response, if the client accepts an encoding
+        """
+        if scope['type'] != 'http' or scope['method'] == 'HEAD':
+            await self.app(scope, receive, send)
+            return
+        encoding = self.negotiate(Headers(scope=scope).get('accept-encoding', ''))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        response_start: 'Message' = {}
+        compressor: Compressor | None = None
+        started = False
+
+        async def send_wrapper(message: 'Message') -> None:
+            nonlocal response_start, compressor, started
+            if message['type'] == 'http.response.start':
+                # Hold the start until the first chunk, to know whether the body is worth compressing
+                response_start = message
+                return
+            if message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if not started:
+                started = True
+                headers = MutableHeaders(raw=response_start['headers'])
+                if (
+                    response_start['status'] in (204, 304)
+                    or (not more_body and len(body) < self.minimum_size)
+                    or not self.should_compress(headers)
+                ):
+                    await send(response_start)
+                    await send(message)
+                    return
+                compressor = COMPRESSORS[encoding](self.levels[encoding])
+                headers['content-encoding'] = encoding
+                if 'accept-encoding' not in headers.get('vary', '').lower():
+                    headers.add_vary_header('Accept-Encoding')
+                del headers['content-length']
+                etag = headers.get('etag')
+                if etag is not None and not etag.startswith('W/'):
+                    headers['etag'] = f'W/{etag}'
+                if not more_body:
+                    body = compressor.finish(body)
+                    headers['content-length'] = str(len(body))
+                    await send(response_start)
+                    await send({'type': 'http.response.body', 'body': body})
+                    return
+                await send(response_start)
+
+            if compressor is None:
+                await send(message)
+                return
+            if not more_body:
+                body = compressor.finish(body)
+            elif not body:
+                return
+            else:
+                body = compressor.compress(body)
+            await send({'type': 'http.response.body', 'body': body, 'more_body': more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,141 @@
+import json
+from time import perf_counter
+from typing import TYPE_CHECKING, Iterable
+
+from fastapi_stack_utils.exception_handler import error_response_content
+from fastapi_stack_utils.metrics import REGISTRY, MetricsRegistry
+from fastapi_stack_utils.middleware import PathRules
+
+if TYPE_CHECKING:  # pragma: no cover
+    from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+class AdaptiveLimit:
+    """
+    AIMD concurrency limit driven by latency.
+
+    Latencies are averaged over windows of `window_size` completed requests, and compared with the lowest window
+    average seen (the latency without queueing). If a window is more than `tolerance` times slower, the limit is
+    multiplied by `backoff`. Otherwise, if requests were rejected or the limit was reached during the window, it's
+    increased by one. The lowest average is forgotten every `baseline_windows` windows, so it follows real changes
+    in latency, e.g. a slower database.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 100,
+        min_limit: int = 10,
+        max_limit: int = 1000,
+        window_size: int = 50,
+        tolerance: float = 2.0,
+        backoff: float = 0.9,
+        baseline_windows: int = 100,
+    ) -> None:
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.window_size = window_size
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.baseline_windows = baseline_windows
+        self.baseline: float | None = None
+        self.windows = 0
+        self.samples = 0
+        self.total_latency = 0.0
+        self.saturated = False
+
+    def observe(self, latency: float, in_flight: int) -> None:
+        """
+        Record the latency of a completed request, with the number of requests which were in flight with it
+        """
+        self.samples += 1
+        self.total_latency += latency
+        if in_flight >= int(self.limit):
+            self.saturated = True
+        if self.samples >= self.window_size:
+            self.update(self.total_latency / self.samples)
+
+    def update(self, average: float) -> None:
+        """
+        Adjust the limit at the end of a window
+        """
+        self.windows += 1
+        if self.baseline is None or average < self.baseline or self.windows % self.baseline_windows == 0:
+            self.baseline = average
+        if average > self.baseline * self.tolerance:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+        elif self.saturated:
+            self.limit = min(self.max_limit, self.limit + 1)
+        self.samples = 0
+        self.total_latency = 0.0
+        self.saturated = False
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    Pure ASGI middleware capping the number of requests in flight at an `AdaptiveLimit`. Requests over the limit are
+    rejected right away with a `503` in the `ErrorResponse` schema and a `Retry-After` header, rather than queued in
+    the event loop until they time out. Requests to `exempt_paths` (e.g. health probes) are never rejected, and not
+    counted. Add it last in `patch_fastapi_middlewares`, so rejected requests skip all other middlewares.
+
+    The limit, the requests in flight and the number of rejected requests are added to the metrics, as
+    `<metrics_prefix>_limit`, `<metrics_prefix>_in_flight` and `<metrics_prefix>_rejected_total`. The last middleware
+    created with a prefix is reported, e.g. when the middleware stack is rebuilt, so give each limited app its own.
+    """
+
+    def __init__(
+        self,
+        app: 'ASGIApp',
+        limit: AdaptiveLimit | None = None,
+        exempt_paths: Iterable[str] = (),
+        retry_after: int = 1,
+        registry: MetricsRegistry = REGISTRY,
+        metrics_prefix: str = 'concurrency',
+    ) -> None:
+        self.app = app
+        self.limit = limit or AdaptiveLimit()
+        self.exempt_paths = PathRules(exempt_paths)
+        self.in_flight = 0
+        self.rejected = 0
+        body = json.dumps(
+            error_response_content([('Service Unavailable', 'Too many concurrent requests, try again later')]),
+            separators=(',', ':'),
+        ).encode()
+        self.rejection_headers = [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            (b'retry-after', str(retry_after).encode()),
+        ]
+        self.rejection_body = body
+        registry.add_gauge(
+            f'{metrics_prefix}_limit', 'Current adaptive concurrency limit', lambda: int(self.limit.limit)
+        )
+        registry.add_gauge(
+            f'{metrics_prefix}_in_flight', 'Requests in flight, counted by the limit', lambda: self.in_flight
+        )
+        registry.add_counter(
+            f'{metrics_prefix}_rejected_total', 'Requests rejected by the concurrency limit', lambda: self.rejected
+        )
+
+    async def __call__(self, scope: 'Scope', receive: 'Receive', send: 'Send') -> None:
+        """
+        Run the request if it's below the limit, and reject it otherwise
+        """
+        if scope['type'] != 'http' or self.exempt_paths.match(scope['path']):
+            await self.app(scope, receive, send)
+            return
+        if self.in_flight >= int(self.limit.limit):
+            self.rejected += 1
+            self.limit.saturated = True
+            await send({'type': 'http.response.start', 'status': 503, 'headers': self.rejection_headers})
+            await send({'type': 'http.response.body', 'body': self.rejection_body})
+            return
+
+        self.in_flight += 1
+        in_flight = self.in_flight
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+            self.limit.observe(perf_counter() - start, in_flight)
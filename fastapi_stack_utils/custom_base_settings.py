@@ -1,25 +1,43 @@
-import contextlib
-from typing import Literal
+import sys
+from functools import lru_cache
+from typing import Any, Literal
 
 from pydantic import BaseSettings, Field, HttpUrl
-from pydantic.env_settings import SettingsSourceCallable
-from pydantic_vault import vault_config_settings_source
+from pydantic.env_settings import EnvSettingsSource, SettingsSourceCallable
+
+Environment = Literal['dev', 'lab', 'prod', 'qa', 'test']
+
+
+class _AzureCredentialType(type):
+    def __instancecheck__(cls, instance: Any) -> bool:
+        """
+        Match `ClientSecretCredential` (sync and async) from `azure.identity`, without importing it.
+        A credential can only exist once its module is imported, so only already imported modules are checked.
+        """
+        for module_name in ('azure.identity', 'azure.identity.aio'):
+            module = sys.modules.get(module_name)
+            if module is not None and isinstance(instance, module.ClientSecretCredential):
+                return True
+        return False
+
+
+class AzureClientSecretCredential(metaclass=_AzureCredentialType):
+    """
+    Stand-in for the `azure.identity` credentials in `keep_untouched`, so they can be class attributes of settings
+    """
 
 
 class SettingsConfig(BaseSettings.Config):
     env_file = '.env.override'
     env_file_encoding = 'utf-8'
     vault_url: HttpUrl = HttpUrl('https://vault.intility.com', scheme='https')
-
-    with contextlib.suppress(ModuleNotFoundError):
-        from azure.identity import ClientSecretCredential
-        from azure.identity.aio import ClientSecretCredential as AsyncClientSecretCredential
-
-        keep_untouched = (AsyncClientSecretCredential, ClientSecretCredential)
+    # Seconds to cache Vault secrets encrypted on disk, `None` only shares them within the process
+    vault_cache_ttl: int | None = None
+    keep_untouched = (AzureClientSecretCredential,)
 
 
 class Env(BaseSettings):
-    ENVIRONMENT: Literal['dev', 'lab', 'prod', 'qa', 'test'] = Field('dev', env='ENVIRONMENT')
+    ENVIRONMENT: Environment = Field('dev', env='ENVIRONMENT')
 
     class Config(SettingsConfig):
         """
@@ -29,20 +47,31 @@ class Env(BaseSettings):
         pass
 
 
-env = Env()
+@lru_cache(maxsize=None)
+def get_env() -> Env:
+    """
+    Read the environment on first use instead of on import
+    """
+    return Env()
+
+
+def __getattr__(name: str) -> Any:
+    """
+    Keep `from fastapi_stack_utils.custom_base_settings import env` working, resolving it lazily
+    """
+    if name == 'env':
+        return get_env()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 class CustomBaseSettings(BaseSettings):
-    ENVIRONMENT = env.ENVIRONMENT
+    ENVIRONMENT: Environment = Field(default_factory=lambda: get_env().ENVIRONMENT)
 
     class Config(SettingsConfig):
         """
         Inherit the shared settings and override the custom source to add vault if in dev
         """
 
-        if env.ENVIRONMENT == 'test':
-            env_file = '.env'
-
         @classmethod
         def customise_sources(
             cls,
@@ -53,7 +82,18 @@ class CustomBaseSettings(BaseSettings):
             """
             Adds inn vault as pydantic config source if in dev
             """
-            if env.ENVIRONMENT == 'dev':
-                return init_settings, env_settings, vault_config_settings_source, file_secret_settings
+            environment = get_env().ENVIRONMENT
+            if (
+                environment == 'test'
+                and isinstance(env_settings, EnvSettingsSource)
+                and env_settings.env_file == SettingsConfig.env_file
+            ):
+                # Tests read `.env`, unless another file is configured
+                env_settings.env_file = '.env'
+            if environment == 'dev':
+                # Imported here, as it loads the Vault client
+                from fastapi_stack_utils.vault_cache import cached_vault_config_settings_source
+
+                return init_settings, env_settings, cached_vault_config_settings_source, file_secret_settings
             else:
                 return init_settings, env_settings, file_secret_settings
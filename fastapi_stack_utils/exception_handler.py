@@ -3,6 +3,7 @@ from typing import Any
 
 from fastapi import HTTPException, Request
 from fastapi.responses import JSONResponse
+from fastapi_stack_utils.metrics import REGISTRY
 from fastapi_stack_utils.schemas.http_exceptions import ErrorResponse, ServerError
 
 log = logging.getLogger('fastapi_stack_utils')
@@ -17,6 +18,35 @@ def generate_json_response(
     return JSONResponse(content=response_body.dict(), status_code=status_code, headers=headers)
 
 
+class ErrorJSONResponse(JSONResponse):
+    """
+    JSONResponse which also accepts an already rendered body
+    """
+
+    def render(self, content: Any) -> bytes:
+        """
+        Pass pre-rendered bytes through untouched
+        """
+        if isinstance(content, bytes):
+            return content
+        return super().render(content)
+
+
+def error_response_content(errors: list[tuple[str, str]]) -> dict[str, list[dict[str, str]]]:
+    """
+    Build the `ErrorResponse` schema from (description, error) pairs as plain dicts, skipping pydantic validation.
+    The values must already be strings.
+    """
+    return {'detail': [{'description': description, 'error': error} for description, error in errors]}
+
+
+# The public 500 body never changes, so render it once
+PUBLIC_SERVER_ERROR_BODY = generate_json_response(
+    ErrorResponse(detail=[ServerError(description='Internal Server Error', error='Internal Server Error')]),
+    status_code=500,
+).body
+
+
 async def http_exception_handler(request: Request, exc: HTTPException) -> JSONResponse:
     """
     Forces the HTTPException output to be of the correct format. Respects status_code raised.
@@ -25,14 +55,14 @@ async def http_exception_handler(request: Request, exc: HTTPException) -> JSONRe
     # Starlette only allows Optional[str].....
     # https://github.com/tiangolo/fastapi/blob/c5be1b0550f17d827721a5be1dc4344e73b1993f
     # /docs_src/custom_request_and_route/tutorial002.py#L17-L18
-    formatted_errors: list[ServerError]
+    formatted_errors: list[tuple[str, str]]
     detail: Any = exc.detail
     if isinstance(detail, (list, tuple)):
-        formatted_errors = [ServerError(description=str(element), error=str(element)) for element in detail]
+        formatted_errors = [(str(element), str(element)) for element in detail]
     else:
-        formatted_errors = [ServerError(description=str(detail), error=str(detail))]
-    return generate_json_response(
-        response_body=ErrorResponse(detail=formatted_errors),
+        formatted_errors = [(str(detail), str(detail))]
+    return ErrorJSONResponse(
+        content=error_response_content(formatted_errors),
         status_code=exc.status_code,
         headers=getattr(exc, 'headers', None) or {},
     )
@@ -45,8 +75,8 @@ async def format_and_log_exception_internal(request: Request, exc: Exception) ->
     For customer facing errors, please use `format_and_log_exception_public`
     """
     log.exception('Unhandled exception raised in endpoint: %s', exc)
-    response_body = ErrorResponse(detail=[ServerError(description='Internal Server Error', error=str(exc))])
-    return generate_json_response(response_body=response_body, status_code=500)
+    REGISTRY.count_exception(exc)
+    return ErrorJSONResponse(content=error_response_content([('Internal Server Error', str(exc))]), status_code=500)
 
 
 async def format_and_log_exception_public(request: Request, exc: Exception) -> JSONResponse:
@@ -56,7 +86,5 @@ async def format_and_log_exception_public(request: Request, exc: Exception) -> J
     For customer facing errors, please use `format_and_log_exception_public`
     """
     log.exception('Unhandled exception raised in endpoint: %s', exc)
-    response_body = ErrorResponse(
-        detail=[ServerError(description='Internal Server Error', error='Internal Server Error')]
-    )
-    return generate_json_response(response_body=response_body, status_code=500)
+    REGISTRY.count_exception(exc)
+    return ErrorJSONResponse(content=PUBLIC_SERVER_ERROR_BODY, status_code=500)
@@ -0,0 +1,168 @@
+import logging
+from time import perf_counter
+from typing import TYPE_CHECKING, Any
+
+from asgi_correlation_id.context import correlation_id
+from fastapi import Request
+
+try:
+    import httpx
+
+    httpx_installed = True
+except ModuleNotFoundError:  # pragma: no cover
+    httpx_installed = False
+
+if TYPE_CHECKING:  # pragma: no cover
+    from fastapi import FastAPI
+
+log = logging.getLogger('fastapi_stack_utils.http_client')
+
+
+class CorrelatedTransport(httpx.AsyncBaseTransport if httpx_installed else object):  # type: ignore[misc]
+    """
+    Wraps a transport, adding the correlation ID of the current request to outbound requests, and logging the method,
+    URL (without the query), status and time until the response headers of every request
+    """
+
+    def __init__(self, transport: 'httpx.AsyncBaseTransport', header_name: str, log_level: int) -> None:
+        self.transport = transport
+        self.header_name = header_name
+        self.log_level = log_level
+
+    async def handle_async_request(self, request: 'httpx.Request') -> 'httpx.Response':
+        """
+        Send the request with the correlation ID, and log its timing
+        """
+        current_correlation_id = correlation_id.get()
+        if current_correlation_id and self.header_name not in request.headers:
+            request.headers[self.header_name] = current_correlation_id
+        url = str(request.url.copy_with(query=None))
+        start = perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except Exception as exc:
+            duration = perf_counter() - start
+            log.warning(
+                '%s %s failed after %.1f ms: %r',
+                request.method,
+                url,
+                duration * 1000,
+                exc,
+                extra={'outbound_method': request.method, 'outbound_url': url, 'outbound_duration': duration},
+            )
+            raise
+        duration = perf_counter() - start
+        log.log(
+            self.log_level,
+            '%s %s %s in %.1f ms',
+            request.method,
+            url,
+            response.status_code,
+            duration * 1000,
+            extra={
+                'outbound_method': request.method,
+                'outbound_url': url,
+                'outbound_status': response.status_code,
+                'outbound_duration': duration,
+            },
+        )
+        return response
+
+    async def aclose(self) -> None:
+        """
+        Close the wrapped transport, and its connection pool
+        """
+        await self.transport.aclose()
+
+
+class HttpClient:
+    """
+    One pooled `httpx.AsyncClient` per app, for calls to other services. Requires `httpx` (and `h2` for `http2=True`).
+
+    Connections are reused between requests, up to `max_connections`, and kept alive for `keepalive_expiry` seconds.
+    The correlation ID of the current request is sent in the `header_name` header (`CorrelationIdMiddleware`'s
+    default), and every call is logged with its timing. Create it on startup and close it on shutdown:
+      http_client = HttpClient(base_url='https://other-service', timeout=5)
+      app = FastAPI(on_startup=[http_client.start], on_shutdown=[http_client.stop])
+      response = await http_client.client.get('/items')
+    Or use `add_http_client` and the `get_http_client` dependency.
+    """
+
+    def __init__(
+        self,
+        base_url: str = '',
+        timeout: float = 10.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 5.0,
+        http2: bool = False,
+        header_name: str = 'X-Request-ID',
+        log_level: int = logging.INFO,
+        transport: 'httpx.AsyncBaseTransport | None' = None,
+        **client_options: Any,
+    ) -> None:
+        if not httpx_installed:
+            raise RuntimeError('`HttpClient` requires httpx, install it with `pip install httpx`')
+        self.base_url = base_url
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2
+        self.header_name = header_name
+        self.log_level = log_level
+        self.transport = transport
+        self.client_options = client_options
+        self._client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self) -> 'httpx.AsyncClient':
+        """
+        The pooled client, once started
+        """
+        if self._client is None:
+            raise RuntimeError('The HTTP client is not started, add `HttpClient.start` to the startup handlers')
+        return self._client
+
+    async def start(self) -> None:
+        """
+        Create the client and its connection pool
+        """
+        if self._client is not None:
+            return
+        transport = self.transport or httpx.AsyncHTTPTransport(limits=self.limits, http2=self.http2)
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            transport=CorrelatedTransport(transport, self.header_name, self.log_level),
+            **self.client_options,
+        )
+
+    async def stop(self) -> None:
+        """
+        Close the client and its connections
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def add_http_client(app: 'FastAPI', **options: Any) -> HttpClient:
+    """
+    Create an `HttpClient` for the app, started and stopped with it, and available from `get_http_client`
+    """
+    http_client = HttpClient(**options)
+    app.state.http_client = http_client
+    app.router.add_event_handler('startup', http_client.start)
+    app.router.add_event_handler('shutdown', http_client.stop)
+    return http_client
+
+
+def get_http_client(request: Request) -> 'httpx.AsyncClient':
+    """
+    Dependency returning the pooled client added by `add_http_client`:
+      async def view(client: httpx.AsyncClient = Depends(get_http_client)): ...
+    """
+    return request.app.state.http_client.client  # type: ignore[no-any-return]
@@ -0,0 +1,241 @@
+import multiprocessing
+import os
+import selectors
+import signal
+import socket
+import sys
+from logging import Handler, LogRecord
+from threading import Event
+from time import monotonic
+from typing import TextIO
+
+# Every log line is sent as a 4 byte big endian length followed by the line
+HEADER_SIZE = 4
+
+
+class LogWriterServer:
+    """
+    Reads log lines sent by `SocketLineHandler`s over a Unix socket, and writes them to `fd` in batches.
+
+    Lines are only written once they're received in full, so lines from different workers never interleave, and
+    one write holds up to `buffer_size` bytes or `flush_interval` seconds of lines from all workers.
+    """
+
+    def __init__(self, path: str, fd: int = 1, flush_interval: float = 0.05, buffer_size: int = 64 * 1024) -> None:
+        self.path = path
+        self.fd = fd
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+        self.stopping = Event()
+        # Statistics, to verify the batching
+        self.lines = 0
+        self.writes = 0
+
+    def write(self, output: bytearray) -> None:
+        """
+        Write and clear the buffered lines
+        """
+        with memoryview(output) as view:
+            written = 0
+            while written < len(view):
+                written += os.write(self.fd, view[written:])
+        self.writes += 1
+        output.clear()
+
+    def serve(self, ready: Event | None = None, stop_timeout: float = 5.0) -> None:
+        """
+        Accept workers and write their lines until `stopping` is set. Then, wait up to `stop_timeout` seconds
+        for the connected workers to disconnect, and write everything they sent.
+        """
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.path)
+        server.listen(128)
+        server.setblocking(False)
+        selector = selectors.DefaultSelector()
+        selector.register(server, selectors.EVENT_READ)
+        if ready is not None:
+            ready.set()
+
+        partial_lines: dict[socket.socket, bytearray] = {}
+        output = bytearray()
+        last_write = monotonic()
+        deadline: float | None = None
+        try:
+            while deadline is None or (partial_lines and monotonic() < deadline):
+                if deadline is None and self.stopping.is_set():
+                    # Stop accepting, and drain the workers which are still connected
+                    selector.unregister(server)
+                    deadline = monotonic() + stop_timeout
+                for key, _ in selector.select(timeout=self.flush_interval):
+                    if key.fileobj is server:
+                        connection, _ = server.accept()
+                        connection.setblocking(False)
+                        selector.register(connection, selectors.EVENT_READ)
+                        partial_lines[connection] = bytearray()
+                        continue
+                    connection = key.fileobj  # type: ignore[assignment]
+                    try:
+                        data = connection.recv(256 * 1024)
+                    except (BlockingIOError, InterruptedError):
+                        continue
+                    except OSError:
+                        data = b''
+                    if not data:
+                        selector.unregister(connection)
+                        connection.close()
+                        del partial_lines[connection]
+                        continue
+                    received = partial_lines[connection]
+                    received += data
+                    self.lines += self.move_lines(received, output)
+                if output and (len(output) >= self.buffer_size or monotonic() - last_write >= self.flush_interval):
+                    self.write(output)
+                    last_write = monotonic()
+        finally:
+            if output:
+                self.write(output)
+            for connection in partial_lines:
+                connection.close()
+            selector.close()
+            server.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    @staticmethod
+    def move_lines(received: bytearray, output: bytearray) -> int:
+        """
+        Move all complete lines from the received bytes to the output, returning the number of lines
+        """
+        offset = 0
+        lines = 0
+        while len(received) - offset >= HEADER_SIZE:
+            size = int.from_bytes(received[offset : offset + HEADER_SIZE], 'big')
+            end = offset + HEADER_SIZE + size
+            if end > len(received):
+                break
+            output += received[offset + HEADER_SIZE : end]
+            offset = end
+            lines += 1
+        del received[:offset]
+        return lines
+
+
+def _run_log_writer(path: str, fd: int, flush_interval: float, ready: 'multiprocessing.synchronize.Event') -> None:
+    """
+    Entry point of the writer process. SIGTERM stops it gracefully, SIGINT is ignored, as the workers may still be
+    logging while they shut down.
+    """
+    server = LogWriterServer(path, fd=fd, flush_interval=flush_interval)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.stopping.set())
+    server.serve(ready=ready)  # type: ignore[arg-type]
+
+
+class LogWriter:
+    """
+    Runs a `LogWriterServer` in its own process, e.g. started by the gunicorn master before the workers:
+      writer = LogWriter('/tmp/app-logs.sock')
+      def on_starting(server): writer.start()
+      def on_exit(server): writer.stop()
+    """
+
+    def __init__(self, path: str, fd: int = 1, flush_interval: float = 0.05) -> None:
+        self.path = path
+        self.fd = fd
+        self.flush_interval = flush_interval
+        self.process: multiprocessing.Process | None = None
+
+    def start(self) -> None:
+        """
+        Start the writer process, and wait until it accepts connections
+        """
+        ready = multiprocessing.Event()
+        self.process = multiprocessing.Process(
+            target=_run_log_writer,
+            args=(self.path, self.fd, self.flush_interval, ready),
+            name='log-writer',
+            daemon=False,
+        )
+        self.process.start()
+        ready.wait(timeout=10)
+
+    def stop(self, timeout: float = 10) -> None:
+        """
+        Write everything the workers sent, and stop the writer process
+        """
+        if self.process is None:
+            return
+        self.process.terminate()
+        self.process.join(timeout)
+        self.process = None
+
+
+class SocketLineHandler(Handler):
+    """
+    Sends each formatted record as one line to a `LogWriter`. Reconnects after a fork, so every worker has its own
+    connection. If the writer can't be reached, lines are written to `fallback` (stdout by default) instead.
+    """
+
+    # Seconds between attempts to reconnect to the writer
+    retry_interval = 5.0
+
+    def __init__(self, path: str, fallback: TextIO | None = None) -> None:
+        super().__init__()
+        self.path = path
+        self.fallback = fallback
+        self.sock: socket.socket | None = None
+        self.pid = os.getpid()
+        self.retry_at = 0.0
+
+    def connect(self) -> socket.socket | None:
+        """
+        Return the connection to the writer, connecting if needed
+        """
+        if self.pid != os.getpid():
+            # The connection of the parent process is shared after a fork, so this process needs its own
+            self.sock = None
+            self.pid = os.getpid()
+            self.retry_at = 0.0
+        if self.sock is None and monotonic() >= self.retry_at:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                self.retry_at = monotonic() + self.retry_interval
+            else:
+                self.sock = sock
+        return self.sock
+
+    def emit(self, record: LogRecord) -> None:
+        """
+        Send the formatted record as a line
+        """
+        try:
+            line = (self.format(record) + '\n').encode()
+            sock = self.connect()
+            if sock is not None:
+                try:
+                    sock.sendall(len(line).to_bytes(HEADER_SIZE, 'big') + line)
+                    return
+                except OSError:
+                    sock.close()
+                    self.sock = None
+                    self.retry_at = monotonic() + self.retry_interval
+            stream = self.fallback or sys.stdout
+            stream.write(line.decode())
+            stream.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close(self) -> None:
+        """
+        Close the connection. Everything sent is written by the writer, even if the worker exits right after.
+        """
+        with self.lock:  # type: ignore[union-attr]
+            if self.sock is not None and self.pid == os.getpid():
+                self.sock.close()
+            self.sock = None
+        super().close()
@@ -1,20 +1,49 @@
-from datetime import datetime
-from logging import Filter, LogRecord
-from time import time_ns
-from typing import Protocol
+import atexit
+import copy
+import json
+import logging
+import traceback
+from collections import OrderedDict
+from datetime import date, datetime, time
+from inspect import istraceback
+from logging import WARNING, Filter, Formatter, LogRecord, StreamHandler, getLevelName, makeLogRecord
+from logging.handlers import QueueHandler
+from queue import Empty, Full, Queue
+from threading import Lock, Timer
+from time import gmtime, monotonic, strftime, time_ns
+from types import TracebackType
+from typing import Any, Literal, Protocol, TextIO
+from weakref import WeakSet
 
-import pytz
+from fastapi_stack_utils.background import BackgroundThread
+
+try:
+    import orjson
+except ModuleNotFoundError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment]
+
+log = logging.getLogger('fastapi_stack_utils.logging_config')
+
+OverflowPolicy = Literal['block', 'drop_oldest', 'drop']
+
+
+# (seconds since epoch, formatted seconds) of the last call, swapped as one tuple to stay thread safe
+_cached_seconds: tuple[int, str] = (-1, '')
 
 
 def get_time_in_nano_seconds() -> str:
     """
-    Return timestamp in nanoseconds
+    Return timestamp in nanoseconds, e.g. `2023-01-31T12:00:00.123456789`.
+    The formatted seconds are cached, and only recomputed when the second changes.
     """
-    # Get timestamp as nanoseconds
-    nano_timestamp = time_ns()
-    # Remove nanoseconds and convert into seconds with UTZ format
-    date_time = datetime.fromtimestamp(nano_timestamp // 1000000000, tz=pytz.utc)
-    return date_time.strftime(f'%Y-%m-%dT%H:%M:%S.{str(int(nano_timestamp % 1000000000)).zfill(9)}')
+    global _cached_seconds
+    # Split the timestamp in nanoseconds into seconds and the nanoseconds within that second
+    seconds, nanoseconds = divmod(time_ns(), 1_000_000_000)
+    cached_seconds, formatted_seconds = _cached_seconds
+    if seconds != cached_seconds:
+        formatted_seconds = strftime('%Y-%m-%dT%H:%M:%S', gmtime(seconds))
+        _cached_seconds = (seconds, formatted_seconds)
+    return f'{formatted_seconds}.{nanoseconds:09d}'
 
 
 class NanoStamp(Filter):
@@ -26,14 +55,436 @@ class NanoStamp(Filter):
         return True
 
 
+class _Fingerprint:
+    __slots__ = ('window_start', 'logged', 'suppressed')
+
+    def __init__(self, window_start: float) -> None:
+        self.window_start = window_start
+        self.logged = 0
+        self.suppressed = 0
+
+
+class ExceptionRateLimit(Filter):
+    """
+    Filter to stop error storms from flooding the logs with identical tracebacks.
+
+    Records with an exception are fingerprinted by exception type and the innermost `frames` frames of the traceback.
+    Only the first `limit` records per fingerprint are let through per `window` seconds. When the window of a
+    fingerprint with suppressed records expires, a summary with the number of suppressed records is logged from a
+    timer thread, even if the exception is not raised again. Pending summaries are logged on exit.
+    At most `max_fingerprints` fingerprints are tracked, the least recently seen are evicted (and summarized) first.
+    """
+
+    def __init__(
+        self, limit: int = 10, window: float = 60, frames: int = 5, max_fingerprints: int = 1000, name: str = ''
+    ) -> None:
+        super().__init__(name)
+        self.limit = limit
+        self.window = window
+        self.frames = frames
+        self.max_fingerprints = max_fingerprints
+        self.fingerprints: OrderedDict[tuple[Any, ...], _Fingerprint] = OrderedDict()
+        self.lock = Lock()
+        self.timer: Timer | None = None
+        _rate_limits.add(self)
+
+    def fingerprint(self, exc_type: type[BaseException], tb: TracebackType | None) -> tuple[Any, ...]:
+        """
+        Exception type and (filename, line number) of the innermost frames. Cheap, no source lines are read.
+        """
+        frames = [(frame.f_code.co_filename, lineno) for frame, lineno in traceback.walk_tb(tb)]
+        return exc_type, *frames[-self.frames :]
+
+    def filter(self, record: LogRecord) -> bool:
+        """
+        Let records through, unless they are repeats of the same exception within the window
+        """
+        if not record.exc_info or record.exc_info[0] is None:
+            return True
+        fingerprint = self.fingerprint(record.exc_info[0], record.exc_info[2])
+        now = monotonic()
+        summaries = []
+        with self.lock:
+            state = self.fingerprints.get(fingerprint)
+            if state is not None and now - state.window_start < self.window:
+                self.fingerprints.move_to_end(fingerprint)
+            else:
+                if state is not None:
+                    summaries.append((fingerprint, state, now))
+                state = self.fingerprints[fingerprint] = _Fingerprint(window_start=now)
+                self.fingerprints.move_to_end(fingerprint)
+                if len(self.fingerprints) > self.max_fingerprints:
+                    evicted_fingerprint, evicted_state = self.fingerprints.popitem(last=False)
+                    summaries.append((evicted_fingerprint, evicted_state, now))
+            if state.logged < self.limit:
+                state.logged += 1
+                allowed = True
+            else:
+                state.suppressed += 1
+                allowed = False
+                if self.timer is None:
+                    self.schedule_summaries(state.window_start + self.window - now)
+        # Log outside the lock, the summaries pass through this filter again
+        for summary in summaries:
+            self.log_summary(*summary)
+        return allowed
+
+    def schedule_summaries(self, delay: float) -> None:
+        """
+        Summarize the expired windows in `delay` seconds. Called with the lock held.
+        """
+        self.timer = Timer(max(delay, 0), self.summarize_expired)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def summarize_expired(self) -> None:
+        """
+        Log summaries of the fingerprints whose window with suppressed records expired, and forget them
+        """
+        now = monotonic()
+        with self.lock:
+            self.timer = None
+            expired = [
+                (fingerprint, state)
+                for fingerprint, state in self.fingerprints.items()
+                if state.suppressed and now - state.window_start >= self.window
+            ]
+            for fingerprint, _ in expired:
+                del self.fingerprints[fingerprint]
+            pending = [
+                state.window_start + self.window - now for state in self.fingerprints.values() if state.suppressed
+            ]
+            if pending:
+                self.schedule_summaries(min(pending))
+        for fingerprint, state in expired:
+            self.log_summary(fingerprint, state, now)
+
+    def log_summary(self, fingerprint: tuple[Any, ...], state: _Fingerprint, now: float) -> None:
+        """
+        Log how many records of a fingerprint were suppressed, if any
+        """
+        if not state.suppressed:
+            return
+        exc_type, *frames = fingerprint
+        filename, lineno = frames[-1] if frames else ('<unknown>', 0)
+        log.warning(
+            'Suppressed %s log records of %s raised at %s:%s in the last %.0f seconds',
+            state.suppressed,
+            exc_type.__qualname__,
+            filename,
+            lineno,
+            now - state.window_start,
+            extra={'suppressed': state.suppressed, 'exception_type': exc_type.__qualname__},
+        )
+
+    def flush(self) -> None:
+        """
+        Log summaries of all fingerprints with suppressed records, e.g. on shutdown
+        """
+        now = monotonic()
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            summaries = list(self.fingerprints.items())
+            self.fingerprints.clear()
+        for fingerprint, state in summaries:
+            self.log_summary(fingerprint, state, now)
+
+
+_rate_limits: WeakSet[ExceptionRateLimit] = WeakSet()
+
+
+@atexit.register
+def _flush_rate_limits() -> None:
+    """
+    Log the pending summaries on exit, before `logging.shutdown` closes the handlers
+    """
+    for rate_limit in list(_rate_limits):
+        rate_limit.flush()
+
+
+# Fields always included in JSON logs, in order. These are the keys Logstash pipelines expect.
+JSON_LOG_FIELDS = (
+    'asctime',
+    'created',
+    'filename',
+    'funcName',
+    'levelname',
+    'levelno',
+    'lineno',
+    'message',
+    'module',
+    'msecs',
+    'name',
+    'pathname',
+    'process',
+    'processName',
+    'relativeCreated',
+    'thread',
+    'threadName',
+    'exc_info',
+    'correlation_id',
+    'nanostamp',
+)
+# Attributes of a LogRecord which are not added to JSON logs as `extra` fields
+_RESERVED_LOG_RECORD_ATTRIBUTES = frozenset(
+    JSON_LOG_FIELDS + ('args', 'exc_text', 'msg', 'stack_info', 'taskName')  # taskName is added in 3.12
+)
+
+
+def json_default(obj: Any) -> Any:
+    """
+    Serialize objects the JSON encoders don't support, the same way `python-json-logger` does
+    """
+    if isinstance(obj, (date, datetime, time)):
+        return obj.isoformat()
+    if istraceback(obj):
+        return ''.join(traceback.format_tb(obj)).strip()
+    try:
+        return str(obj)
+    except Exception:
+        return None
+
+
+class JsonFormatter(Formatter):
+    """
+    Format log records as one JSON object per line, with the `JSON_LOG_FIELDS` and any `extra` fields.
+
+    Output is key-for-key compatible with the `python-json-logger` formatter previously used, but the field list is
+    fixed instead of parsed from a format string, tracebacks are only formatted once per record, and records are
+    serialized with `orjson` when it is installed.
+    """
+
+    def format(self, record: LogRecord) -> str:
+        """
+        Serialize the record to JSON
+        """
+        record.message = record.getMessage()
+        record.asctime = self.formatTime(record, self.datefmt)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        attributes = record.__dict__
+        log_record = {field: attributes.get(field) for field in JSON_LOG_FIELDS}
+        if record.exc_text:
+            log_record['exc_info'] = record.exc_text
+        if record.stack_info:
+            log_record['stack_info'] = self.formatStack(record.stack_info)
+        for key, value in attributes.items():
+            if key not in _RESERVED_LOG_RECORD_ATTRIBUTES and not key.startswith('_'):
+                log_record[key] = value
+        return self.serialize(log_record)
+
+    @staticmethod
+    def serialize(log_record: dict[str, Any]) -> str:
+        """
+        Serialize with orjson if available, falling back to the standard library for what orjson refuses,
+        e.g. integers larger than 64 bits
+        """
+        if orjson is not None:
+            try:
+                return orjson.dumps(log_record, default=json_default, option=orjson.OPT_NON_STR_KEYS).decode()
+            except TypeError:  # orjson.JSONEncodeError
+                pass
+        return json.dumps(log_record, default=json_default)
+
+
+_queue_handlers: WeakSet['QueueStreamHandler'] = WeakSet()
+
+
+class QueueStreamHandler(QueueHandler):
+    """
+    Replacement for `logging.StreamHandler` which does as little work as possible on the logging thread.
+
+    Filters (correlation ID, nanostamp) still run on the calling thread, since they depend on context variables,
+    but formatting and writing to the stream is done by the stream handler in a background thread.
+    The queue is bounded by `maxsize`, and `overflow` decides what happens when it is full:
+    * `block`: wait for the listener to catch up
+    * `drop_oldest`: discard the oldest queued record to make room
+    * `drop`: discard the new record
+    Discarded records are counted in `dropped`, and reported when the handler is stopped.
+    The listener thread is started by the first record, so a configured but unused handler (e.g. `console` outside
+    `dev`) has none. After `stop`, and until `start`, records are written to the stream directly instead, so they are
+    neither lost nor blocked on a queue nobody reads.
+    """
+
+    def __init__(self, stream: TextIO | None = None, maxsize: int = 10_000, overflow: OverflowPolicy = 'block') -> None:
+        self.record_queue: Queue[LogRecord | None] = Queue(maxsize)
+        super().__init__(self.record_queue)
+        self.overflow = overflow
+        self.dropped = 0
+        self.stream_handler = StreamHandler(stream)
+        self.listener = BackgroundThread(self.write_records, 'logging-queue')
+        self.stopped = False
+        _queue_handlers.add(self)
+
+    def setFormatter(self, fmt: Formatter | None) -> None:  # noqa: N802
+        """
+        Formatting is done by the stream handler in the listener thread
+        """
+        self.stream_handler.setFormatter(fmt)
+
+    def write_records(self) -> None:
+        """
+        Format and write queued records until stopped
+        """
+        while (record := self.record_queue.get()) is not None:
+            self.stream_handler.handle(record)
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        """
+        Merge the message and arguments, since arguments may be mutated after the call returns,
+        but leave the (expensive) formatting to the listener thread
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: LogRecord) -> None:
+        """
+        Put the record on the queue, applying the overflow policy if the queue is full.
+        Called with the handler lock held, so `stop` can't stop the listener in between.
+        """
+        if not self.running:
+            if self.stopped:
+                self.stream_handler.handle(record)
+                return
+            self.listener.start()
+        if self.overflow == 'block':
+            self.record_queue.put(record)
+            return
+        while True:
+            try:
+                self.record_queue.put_nowait(record)
+                return
+            except Full:
+                self.dropped += 1
+                if self.overflow == 'drop':
+                    return
+            try:
+                self.record_queue.get_nowait()
+            except Empty:
+                pass
+
+    @property
+    def running(self) -> bool:
+        """
+        Whether the listener thread is alive
+        """
+        return self.listener.running
+
+    def start(self) -> None:
+        """
+        Queue records again after `stop`. The listener thread is started by the next record.
+        """
+        self.stopped = False
+
+    def stop(self) -> None:
+        """
+        Flush all queued records and stop the listener thread. Later records are written directly.
+        """
+        # Hold the handler lock, so no record is queued after the listener has stopped
+        self.acquire()
+        try:
+            self.stopped = True
+            # Blocks rather than `put_nowait`, which would raise if the bounded queue is full
+            self.listener.stop(lambda: self.record_queue.put(None))
+            # Records queued while the listener was not running
+            while True:
+                try:
+                    record = self.record_queue.get_nowait()
+                except Empty:
+                    break
+                if record is not None:
+                    self.stream_handler.handle(record)
+        finally:
+            self.release()
+        if self.dropped:
+            self.stream_handler.handle(
+                makeLogRecord(
+                    {
+                        'name': __name__,
+                        'levelno': WARNING,
+                        'levelname': getLevelName(WARNING),
+                        'msg': 'Dropped %s log records, the logging queue was full',
+                        'args': (self.dropped,),
+                        'correlation_id': None,
+                        'nanostamp': get_time_in_nano_seconds(),
+                    }
+                )
+            )
+            self.dropped = 0
+
+    def close(self) -> None:
+        """
+        Stop the listener when the handler is closed, e.g. on reconfiguration or interpreter shutdown
+        """
+        self.stop()
+        super().close()
+
+
+def start_queue_logging() -> None:
+    """
+    Queue the records of all queue handlers again after `stop_queue_logging`. Add to the app startup events:
+    `FastAPI(on_startup=[start_queue_logging], on_shutdown=[stop_queue_logging])`
+    """
+    for handler in list(_queue_handlers):
+        handler.start()
+
+
+def stop_queue_logging() -> None:
+    """
+    Flush and stop the listener threads of all queue handlers. Add to the app shutdown events.
+    """
+    for handler in list(_queue_handlers):
+        handler.stop()
+
+
 class Settings(Protocol):
     ENVIRONMENT: str
 
 
-def generate_base_logging_config(settings: Settings) -> dict:
+def generate_base_logging_config(
+    settings: Settings,
+    queue: bool = False,
+    queue_size: int = 10_000,
+    overflow: OverflowPolicy = 'block',
+    rate_limit_exceptions: bool = False,
+    audit_db: str | None = None,
+    log_socket: str | None = None,
+) -> dict:
     """
-    Generate a base logging config
+    Generate a base logging config.
+    With `queue=True`, records are formatted and written in a background thread, see `QueueStreamHandler`.
+    With `rate_limit_exceptions=True`, repeated tracebacks are suppressed and summarized, see `ExceptionRateLimit`.
+    With `audit_db`, `AuditLog` requests are also stored in that SQLite database, see `SqliteAuditHandler`.
+    With `log_socket`, lines are sent to a single `LogWriter` process listening on that Unix socket, which writes
+    the lines of all workers to stdout in batches, see `SocketLineHandler`.
     """
+    handler_filters = ['correlation_id', 'nanostamp']
+    if rate_limit_exceptions:
+        handler_filters.insert(0, 'exception_rate_limit')
+    handler: dict[str, Any] = {'class': 'logging.StreamHandler'}
+    if queue and log_socket is not None:
+        raise ValueError('`queue` and `log_socket` can not be combined')
+    if log_socket is not None:
+        handler = {'()': 'fastapi_stack_utils.log_aggregation.SocketLineHandler', 'path': log_socket}
+    if queue:
+        handler = {
+            '()': 'fastapi_stack_utils.logging_config.QueueStreamHandler',
+            'maxsize': queue_size,
+            'overflow': overflow,
+        }
+    handlers: dict[str, Any] = {}
+    loggers: dict[str, Any] = {}
+    if audit_db is not None:
+        handlers['audit'] = {
+            '()': 'fastapi_stack_utils.audit_sink.SqliteAuditHandler',
+            'path': audit_db,
+            'filters': ['correlation_id'],
+        }
+        loggers['fastapi_stack_utils.route'] = {'handlers': ['audit']}
     return {
         'version': 1,
         'disable_existing_loggers': False,
@@ -43,50 +494,29 @@ def generate_base_logging_config(settings: Settings) -> dict:
                 'uuid_length': 8 if settings.ENVIRONMENT == 'dev' else 36,
             },
             'nanostamp': {'()': 'fastapi_stack_utils.logging_config.NanoStamp'},
+            'exception_rate_limit': {'()': 'fastapi_stack_utils.logging_config.ExceptionRateLimit'},
         },
         'formatters': {
             'console': {
                 'format': '%(levelname)-8s  [%(correlation_id)s] %(name)s:%(lineno)d    %(message)s',
             },
             'json': {
-                '()': 'pythonjsonlogger.jsonlogger.JsonFormatter',
-                'format': """
-                    asctime: %(asctime)s
-                    created: %(created)f
-                    file_name: %(filename)s
-                    func_Name: %(funcName)s
-                    level_name: %(levelname)s
-                    level: %(levelname)s
-                    level_no: %(levelno)s
-                    lineno: %(lineno)d
-                    message: %(message)s
-                    module: %(module)s
-                    msec: %(msecs)d
-                    name: %(name)s
-                    pathname: %(pathname)s
-                    process: %(process)d
-                    process_name: %(processName)s
-                    relative_created: %(relativeCreated)d
-                    thread: %(thread)d
-                    thread_name: %(threadName)s
-                    exc_info: %(exc_info)s
-                    correlation_id: %(correlation_id)s
-                    nanostamp: %(nanostamp)s
-                """,
+                '()': 'fastapi_stack_utils.logging_config.JsonFormatter',
                 'datefmt': '%Y-%m-%d %H:%M:%S',
             },
         },
         'handlers': {
             'console': {
-                'class': 'logging.StreamHandler',
-                'filters': ['correlation_id', 'nanostamp'],
+                **handler,
+                'filters': handler_filters,
                 'formatter': 'console',
             },
             'json': {
-                'class': 'logging.StreamHandler',
-                'filters': ['correlation_id', 'nanostamp'],
+                **handler,
+                'filters': handler_filters,
                 'formatter': 'json',
             },
+            **handlers,
         },
         'loggers': {
             # third-party packages
@@ -94,6 +524,7 @@ def generate_base_logging_config(settings: Settings) -> dict:
             'fastapi_audit_log': {'level': 'INFO'},
             'gunicorn': {'level': 'INFO'},
             'uvicorn': {'level': 'WARNING'},
+            **loggers,
         },
         'root': {
             'handlers': ['console'] if settings.ENVIRONMENT in ['dev', 'test'] else ['json'],
@@ -0,0 +1,175 @@
+import asyncio
+import contextlib
+import logging
+import signal
+import sys
+import threading
+import traceback
+from threading import Event, Thread
+from time import monotonic
+from types import FrameType
+from typing import Any
+
+from asgi_correlation_id.context import correlation_id
+from fastapi_stack_utils.metrics import REGISTRY, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class LoopMonitor:
+    """
+    Measures event loop lag, and captures what blocks the loop. Works with uvloop and the default loop.
+
+    A task sleeps for `interval` seconds at a time, and records how late it wakes up as the loop lag.
+    A watchdog thread checks that task's heartbeat: if the loop has been blocked for more than `threshold` seconds,
+    it captures the stack of the blocking code. When the loop runs in the main thread, the stack is captured by a
+    `capture_signal` handler, which runs in the blocked code's context, so the correlation ID of the request is
+    captured too. Otherwise, or on platforms without `SIGURG` (Windows), the stack is read from another thread,
+    without the correlation ID. Stalls are logged as warnings once the loop is running again.
+
+    A Python signal handler makes blocking system calls in C extensions fail with `EINTR`, so the handler is installed
+    with `signal.siginterrupt(capture_signal, False)`, restarting interrupted calls instead. Pass `capture_signal=None`
+    if the app uses the signal.
+
+    Start and stop it with the app, and expose the stats with the metrics:
+      monitor = LoopMonitor()
+      app = FastAPI(on_startup=[configure_uvloop, monitor.start], on_shutdown=[monitor.stop])
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.25,
+        threshold: float = 0.1,
+        capture_signal: int | None = getattr(signal, 'SIGURG', None),
+        registry: MetricsRegistry = REGISTRY,
+    ) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.capture_signal = capture_signal
+        self.registry = registry
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.heartbeat = monotonic()
+        self.captured: tuple[str | None, str | None, list[str]] | None = None
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.loop_thread_id: int | None = None
+        self.task: asyncio.Task | None = None
+        self.watchdog: Thread | None = None
+        self.stopping = Event()
+        self.previous_handler: Any = None
+
+    async def start(self) -> None:
+        """
+        Start measuring the lag of the running loop, and watching for stalls
+        """
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = monotonic()
+        self.stopping.clear()
+        if (
+            self.capture_signal is not None
+            and hasattr(signal, 'pthread_kill')
+            and threading.current_thread() is threading.main_thread()
+        ):
+            self.previous_handler = signal.signal(self.capture_signal, self.capture_blocked_stack)
+            # Restart system calls interrupted by the signal, rather than failing them with `EINTR`
+            signal.siginterrupt(self.capture_signal, False)
+        else:
+            self.capture_signal = None
+        self.registry.add_gauge('event_loop_lag_seconds', 'Event loop lag at the last measurement', lambda: self.lag)
+        self.registry.add_gauge(
+            'event_loop_lag_max_seconds', 'Largest event loop lag since the last scrape', self.pop_max_lag
+        )
+        self.registry.add_gauge('event_loop_stalls', 'Number of times the event loop was blocked', lambda: self.stalls)
+        self.task = self.loop.create_task(self.measure_lag())
+        self.watchdog = Thread(target=self.watch, name='loop-monitor', daemon=True)
+        self.watchdog.start()
+
+    async def stop(self) -> None:
+        """
+        Stop the task and the watchdog thread
+        """
+        self.stopping.set()
+        if self.task is not None:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+            self.task = None
+        if self.watchdog is not None:
+            self.watchdog.join()
+            self.watchdog = None
+        if self.capture_signal is not None:
+            signal.signal(self.capture_signal, self.previous_handler)
+
+    def pop_max_lag(self) -> float:
+        """
+        Return the largest lag since the last call, and reset it
+        """
+        max_lag, self.max_lag = self.max_lag, self.lag
+        return max_lag
+
+    async def measure_lag(self) -> None:
+        """
+        Sleep for `interval` at a time, measuring how much later than expected the loop wakes up
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.heartbeat = monotonic()
+            self.lag = max(loop.time() - expected, 0.0)
+            self.max_lag = max(self.max_lag, self.lag)
+            if self.lag > self.threshold:
+                self.stalls += 1
+                self.report_stall()
+
+    def report_stall(self) -> None:
+        """
+        Log the stall, with the stack captured while the loop was blocked
+        """
+        captured, self.captured = self.captured, None
+        if captured is None:
+            logger.warning('Event loop was blocked for %.0fms', self.lag * 1000, extra={'loop_lag': self.lag})
+            return
+        correlation_id, task_name, stack = captured
+        logger.warning(
+            'Event loop was blocked for %.0fms in task %s (correlation ID %s):\n%s',
+            self.lag * 1000,
+            task_name,
+            correlation_id,
+            ''.join(stack),
+            extra={'loop_lag': self.lag, 'blocked_correlation_id': correlation_id, 'blocked_task': task_name},
+        )
+
+    def watch(self) -> None:
+        """
+        Watchdog thread, capturing the stack once per stall when the heartbeat is late
+        """
+        captured_heartbeat = None
+        while not self.stopping.wait(self.threshold / 2):
+            heartbeat = self.heartbeat
+            if heartbeat == captured_heartbeat or monotonic() - heartbeat < self.interval + self.threshold:
+                continue
+            captured_heartbeat = heartbeat
+            if self.capture_signal is not None:
+                signal.pthread_kill(self.loop_thread_id, self.capture_signal)  # type: ignore[arg-type]
+            else:
+                frame = sys._current_frames().get(self.loop_thread_id)  # type: ignore[arg-type]
+                if frame is not None:
+                    self.captured = (None, self.current_task_name(), traceback.format_stack(frame))
+
+    def capture_blocked_stack(self, signum: int, frame: FrameType | None) -> None:
+        """
+        Signal handler, run in the loop thread between two bytecodes of the blocking code, and in its context
+        """
+        self.captured = (correlation_id.get(), self.current_task_name(), traceback.format_stack(frame))
+        if callable(self.previous_handler):
+            self.previous_handler(signum, frame)
+
+    def current_task_name(self) -> str | None:
+        """
+        Name of the task running on the monitored loop, if any
+        """
+        task = asyncio.current_task(self.loop) if self.loop is not None else None
+        return task.get_name() if task is not None else None
@@ -0,0 +1,389 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import weakref
+from array import array
+from bisect import bisect_left
+from time import monotonic, perf_counter
+from typing import TYPE_CHECKING, Any, Callable
+
+from fastapi_stack_utils.middleware import ResponseRecorder
+from fastapi_stack_utils.warmup import is_warmup_request
+
+if TYPE_CHECKING:  # pragma: no cover
+    from starlette.types import ASGIApp, Receive, Scope, Send
+
+log = logging.getLogger('fastapi_stack_utils.metrics')
+
+# Upper bounds of the latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+# Route label for requests which did not match a route, so random paths can't blow up the number of series
+UNMATCHED_ROUTE = '<unmatched>'
+# Scope key holding the registry recording the request, so the middleware of a mounted FastAPI app doesn't record it
+# again, since `patch_fastapi_middlewares` also applies to mounted apps
+RECORDING_SCOPE_KEY = 'fsu.metrics'
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram, storing the count per bucket in an array. Observing a value allocates nothing.
+    The last slot counts values above the largest bucket (`+Inf`).
+    """
+
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = array('Q', bytes(8 * (len(buckets) + 1)))
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """
+        Count the value in the first bucket it is less than or equal to
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def merge(self, counts: list[int], total: float) -> None:
+        """
+        Add the counts and sum of another histogram with the same buckets
+        """
+        for index, count in enumerate(counts):
+            self.counts[index] += count
+        self.sum += total
+
+
+class MetricsRegistry:
+    """
+    In-process request metrics: request counts per method, route template and status class, latency histograms per
+    method and route template, and unhandled exceptions per exception type. Routes are labeled with their template
+    (`/items/{item_id}`), not the raw path, to bound the number of series.
+
+    With multiple worker processes (gunicorn), give all workers the same `directory` (or set `FSU_METRICS_DIR`).
+    Each worker then writes its metrics to its own file, named after its PID, within `flush_interval` seconds of a
+    request and on exit, and the exposition endpoint sums the files of all workers. Forked processes (gunicorn
+    `--preload`) start with empty metrics, so the requests of the parent process are not counted twice.
+    Gauges (`add_gauge`) and callback counters (`add_counter`) are always reported for the process serving the
+    scrape only.
+    """
+
+    def __init__(
+        self,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+        directory: str | None = None,
+        flush_interval: float = 5.0,
+        process_id: str | None = None,
+    ) -> None:
+        self.buckets = buckets
+        self.directory = directory or os.environ.get('FSU_METRICS_DIR')
+        self.flush_interval = flush_interval
+        self._process_id = process_id
+        self.requests: dict[tuple[str, str, str], int] = {}
+        self.latency: dict[tuple[str, str], Histogram] = {}
+        self.exceptions: dict[str, int] = {}
+        # Metrics read from a callback on every scrape: name to (documentation, callback, type)
+        self.gauges: dict[str, tuple[str, Callable[[], float], str]] = {}
+        self.last_flush = monotonic()
+        self._flush_timer: threading.Timer | None = None
+        self._flush_lock = threading.Lock()
+        _registries.add(self)
+
+    @property
+    def process_id(self) -> str:
+        """
+        Name of the snapshot file of this process, resolved on every flush, since workers are forked after import
+        """
+        return self._process_id or str(os.getpid())
+
+    def reset(self) -> None:
+        """
+        Forget the counters and histograms, e.g. in a forked worker
+        """
+        self.requests = {}
+        self.latency = {}
+        self.exceptions = {}
+        self.last_flush = monotonic()
+        self._flush_timer = None
+        self._flush_lock = threading.Lock()
+
+    def schedule_flush(self) -> None:
+        """
+        Flush now if the last flush is `flush_interval` seconds old, or else in a background thread once it is,
+        so the metrics of an idle worker are written too
+        """
+        if self.directory is None:
+            return
+        if monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+        elif self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.flush_interval, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def observe_request(self, method: str, route: str, status_code: int, duration: float) -> None:
+        """
+        Record a completed request, with its duration in seconds
+        """
+        key = (method, route, f'{status_code // 100}xx')
+        self.requests[key] = self.requests.get(key, 0) + 1
+        histogram = self.latency.get((method, route))
+        if histogram is None:
+            histogram = self.latency[(method, route)] = Histogram(self.buckets)
+        histogram.observe(duration)
+        self.schedule_flush()
+
+    def count_exception(self, exc: BaseException) -> None:
+        """
+        Count an unhandled exception by type
+        """
+        name = type(exc).__qualname__
+        self.exceptions[name] = self.exceptions.get(name, 0) + 1
+        self.schedule_flush()
+
+    def add_gauge(self, name: str, documentation: str, function: Callable[[], float]) -> None:
+        """
+        Report the return value of `function` as a gauge on every scrape
+        """
+        self.gauges[name] = (documentation, function, 'gauge')
+
+    def add_counter(self, name: str, documentation: str, function: Callable[[], float]) -> None:
+        """
+        Report the return value of `function`, a count which only increases, as a counter on every scrape
+        """
+        self.gauges[name] = (documentation, function, 'counter')
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        JSON serializable copy of the counters and histograms
+        """
+        # Copying a dict is atomic, so a flush from the timer thread can't see it change size
+        return {
+            'buckets': list(self.buckets),
+            'requests': [[*key, count] for key, count in self.requests.copy().items()],
+            'latency': [
+                [*key, list(histogram.counts), histogram.sum] for key, histogram in self.latency.copy().items()
+            ],
+            'exceptions': [[name, count] for name, count in self.exceptions.copy().items()],
+        }
+
+    def flush(self) -> None:
+        """
+        Atomically write the snapshot of this process to the shared directory
+        """
+        if self.directory is None:
+            return
+        with self._flush_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            self.last_flush = monotonic()
+            path = os.path.join(self.directory, f'{self.process_id}.json')
+            with open(f'{path}.tmp', 'w') as snapshot_file:
+                json.dump(self.snapshot(), snapshot_file)
+            os.replace(f'{path}.tmp', path)
+
+    def collect(self) -> 'MetricsRegistry':
+        """
+        Return the metrics to expose: this registry, or the sum of all workers in multiprocess mode
+        """
+        if self.directory is None:
+            return self
+        self.flush()
+        merged = MetricsRegistry(buckets=self.buckets)
+        merged.directory = None
+        for file_name in sorted(os.listdir(self.directory)):
+            if not file_name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, file_name)) as snapshot_file:
+                    snapshot = json.load(snapshot_file)
+            except (OSError, ValueError):
+                log.warning('Could not read metrics snapshot %s', file_name)
+                continue
+            if tuple(snapshot['buckets']) != self.buckets:
+                log.warning('Skipping metrics snapshot %s with different buckets', file_name)
+                continue
+            for method, route, status, count in snapshot['requests']:
+                merged.requests[(method, route, status)] = merged.requests.get((method, route, status), 0) + count
+            for method, route, counts, total in snapshot['latency']:
+                histogram = merged.latency.get((method, route))
+                if histogram is None:
+                    histogram = merged.latency[(method, route)] = Histogram(self.buckets)
+                histogram.merge(counts, total)
+            for name, count in snapshot['exceptions']:
+                merged.exceptions[name] = merged.exceptions.get(name, 0) + count
+        merged.gauges = self.gauges
+        return merged
+
+    def render(self) -> str:
+        """
+        Render the metrics in the Prometheus text exposition format
+        """
+        metrics = self.collect()
+        lines = [
+            '# HELP http_requests_total Number of HTTP requests by method, route and status class',
+            '# TYPE http_requests_total counter',
+        ]
+        for (method, route, status), count in sorted(metrics.requests.items()):
+            lines.append(f'http_requests_total{_labels(method=method, route=route, status=status)} {count}')
+
+        lines += [
+            '# HELP http_request_duration_seconds HTTP request duration by method and route',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for (method, route), histogram in sorted(metrics.latency.items()):
+            cumulative = 0
+            for upper_bound, count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+                cumulative += count
+                labels = _labels(method=method, route=route, le=str(upper_bound))
+                lines.append(f'http_request_duration_seconds_bucket{labels} {cumulative}')
+            labels = _labels(method=method, route=route)
+            lines.append(f'http_request_duration_seconds_sum{labels} {histogram.sum}')
+            lines.append(f'http_request_duration_seconds_count{labels} {cumulative}')
+
+        lines += [
+            '# HELP http_unhandled_exceptions_total Number of unhandled exceptions by exception type',
+            '# TYPE http_unhandled_exceptions_total counter',
+        ]
+        for name, count in sorted(metrics.exceptions.items()):
+            lines.append(f'http_unhandled_exceptions_total{_labels(exception=name)} {count}')
+
+        for name, (documentation, function, metric_type) in metrics.gauges.items():
+            lines += [f'# HELP {name} {documentation}', f'# TYPE {name} {metric_type}', f'{name} {function()}']
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(**labels: str) -> str:
+    """
+    Format Prometheus labels, escaping backslashes, quotes and newlines
+    """
+    escaped = (
+        f'{key}="' + value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') + '"'
+        for key, value in labels.items()
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+# All registries, to reset them in forked processes and flush them on exit
+_registries: 'weakref.WeakSet[MetricsRegistry]' = weakref.WeakSet()
+
+
+def _reset_registries() -> None:
+    for registry in list(_registries):
+        registry.reset()
+
+
+@atexit.register
+def _flush_registries() -> None:
+    for registry in list(_registries):
+        try:
+            registry.flush()
+        except OSError:
+            log.warning('Could not write metrics snapshot', exc_info=True)
+
+
+if hasattr(os, 'register_at_fork'):  # pragma: no branch
+    os.register_at_fork(after_in_child=_reset_registries)
+
+REGISTRY = MetricsRegistry()
+
+
+def match_route_template(routes: list[Any], scope: 'Scope') -> str | None:
+    """
+    Template of the route matching the request, e.g. `/static/{path}` or `/admin/users/{user_id}`,
+    including the paths of the `Mount`s it's in
+    """
+    from starlette.routing import Match, Mount
+
+    # Like the router: the first full match, else the first partial match (wrong method)
+    partial = None
+    for route in routes:
+        match, child_scope = route.matches(scope)
+        if match == Match.FULL:
+            break
+        if match == Match.PARTIAL and partial is None:
+            partial = (route, child_scope)
+    else:
+        if partial is None:
+            return None
+        route, child_scope = partial
+    if isinstance(route, Mount):
+        mounted = match_route_template(route.routes, {**scope, **child_scope})
+        return route.path_format.removesuffix('/{path}') + (mounted or '/{path}')
+    return getattr(route, 'path_format', None)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording request count, status class and latency per route template in `registry`.
+    A request whose app raises is counted as a 5xx of its route. Warmup requests are not recorded, and requests to
+    a mounted FastAPI app are only recorded once, by the middleware of the outer app.
+    """
+
+    def __init__(self, app: 'ASGIApp', registry: MetricsRegistry = REGISTRY) -> None:
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope: 'Scope', receive: 'Receive', send: 'Send') -> None:
+        """
+        Time the request and record the status code of the response
+        """
+        if scope['type'] != 'http' or is_warmup_request(scope) or scope.get(RECORDING_SCOPE_KEY) is self.registry:
+            await self.app(scope, receive, send)
+            return
+
+        start = perf_counter()
+        scope[RECORDING_SCOPE_KEY] = self.registry
+        # The router rewrites `path` and `root_path` of mounted apps in place, and mounted apps replace `app`
+        request_scope = {**scope}
+        recorder = ResponseRecorder(send)
+        try:
+            await self.app(scope, receive, recorder)
+        finally:
+            self.registry.observe_request(
+                scope['method'], self.route_template(request_scope, scope), recorder.status_code, perf_counter() - start
+            )
+
+    @staticmethod
+    def route_template(request_scope: 'Scope', scope: 'Scope') -> str:
+        """
+        Template of the route that handled the request, from the scope before and after routing
+        """
+        route = scope.get('route')
+        if route is not None and scope.get('root_path', '') == request_scope.get('root_path', ''):
+            # Set by FastAPI's `APIRoute`
+            return route.path_format  # type: ignore[no-any-return]
+        if 'endpoint' not in scope or not hasattr(request_scope.get('app'), 'router'):
+            # Not found, before any route matched
+            return UNMATCHED_ROUTE
+        # A Starlette `Route`, a mounted app or a route of a mounted app: match the request again to get the template
+        return match_route_template(request_scope['app'].router.routes, request_scope) or UNMATCHED_ROUTE
+
+
+class MetricsEndpoint:
+    """
+    ASGI app exposing the metrics in the Prometheus text format:
+      app.add_route('/metrics', MetricsEndpoint(), include_in_schema=False)
+    """
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY) -> None:
+        self.registry = registry
+
+    async def __call__(self, scope: 'Scope', receive: 'Receive', send: 'Send') -> None:
+        """
+        Render and send the metrics
+        """
+        body = self.registry.render().encode()
+        await send(
+            {
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/plain; version=0.0.4; charset=utf-8'),
+                    (b'content-length', str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({'type': 'http.response.body', 'body': body})
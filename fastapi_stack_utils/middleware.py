@@ -1,16 +1,99 @@
 import logging
+from time import perf_counter
 from typing import TYPE_CHECKING, Any
 
 from fastapi import FastAPI
+from starlette.middleware import Middleware
 
 if TYPE_CHECKING:  # pragma: no cover
-    from typing import Callable
+    from typing import Callable, Iterable
 
-    from starlette.middleware import Middleware
+    from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 log = logging.getLogger('fastapi_stack_utils.middleware')
 
 
+class PathRules:
+    """
+    Exact (`/health`) and prefix (`/metrics/*`) path rules, compiled into a set and a tuple of prefixes
+    """
+
+    def __init__(self, paths: 'Iterable[str]') -> None:
+        paths = list(paths)
+        self.exact = frozenset(path for path in paths if not path.endswith('*'))
+        self.prefixes = tuple(path.removesuffix('*') for path in paths if path.endswith('*'))
+
+    def __bool__(self) -> bool:
+        """
+        Whether there are any rules
+        """
+        return bool(self.exact or self.prefixes)
+
+    def match(self, path: str) -> bool:
+        """
+        Whether the path matches any of the rules
+        """
+        return path in self.exact or path.startswith(self.prefixes)
+
+
+class PathMiddleware(Middleware):
+    """
+    A `Middleware` which is only applied to some paths, for `patch_fastapi_middlewares`:
+      PathMiddleware(CorrelationIdMiddleware, exclude_paths=['/health', '/metrics/*'], header_name='Correlation-ID')
+
+    Paths ending with `*` are prefixes, others must match exactly.
+    If `include_paths` is given, the middleware only runs on matching paths.
+    Requests to excluded paths (or not included paths) skip straight to the inner app.
+    """
+
+    def __init__(
+        self,
+        cls: type,
+        *,
+        exclude_paths: 'Iterable[str]' = (),
+        include_paths: 'Iterable[str] | None' = None,
+        **options: Any,
+    ) -> None:
+        super().__init__(cls, **options)
+        self.exclude_paths = PathRules(exclude_paths)
+        self.include_paths = PathRules(include_paths) if include_paths is not None else None
+
+    def build(self, app: 'ASGIApp') -> 'ASGIApp':
+        """
+        Wrap the app with the middleware, and a dispatcher choosing between them per request
+        """
+        middleware_app = self.cls(app, **self.options)
+        if not self.exclude_paths and self.include_paths is None:
+            return middleware_app  # type: ignore[no-any-return]
+        return PathDispatch(app, middleware_app, exclude_paths=self.exclude_paths, include_paths=self.include_paths)
+
+
+class PathDispatch:
+    """
+    Sends requests through the middleware, or straight to the app the middleware wraps, based on the path
+    """
+
+    def __init__(
+        self, app: 'ASGIApp', middleware_app: 'ASGIApp', exclude_paths: PathRules, include_paths: PathRules | None
+    ) -> None:
+        self.app = app
+        self.middleware_app = middleware_app
+        self.exclude_paths = exclude_paths
+        self.include_paths = include_paths
+
+    async def __call__(self, scope: 'Scope', receive: 'Receive', send: 'Send') -> None:
+        """
+        Dispatch the request. Lifespan events always go through the middleware.
+        """
+        if scope['type'] in ('http', 'websocket'):
+            path = scope['path']
+            included = self.include_paths is None or self.include_paths.match(path)
+            if not included or self.exclude_paths.match(path):
+                await self.app(scope, receive, send)
+                return
+        await self.middleware_app(scope, receive, send)
+
+
 def patch_fastapi_middlewares(middlewares: list['Middleware']) -> None:
     """
     This function will take a list of Middleware(), and replace(extend) the `build_middleware_stack` function in
@@ -43,6 +126,9 @@ def patch_fastapi_middlewares(middlewares: list['Middleware']) -> None:
 
     Here, we can see that _after_ ServerErrorMiddleware(and ExceptionMiddleware for handled exceptions)
     has done its work, the request will still go through our CorrelationID and CORS middlewares.
+
+    Use `PathMiddleware` instead of `Middleware` to skip a middleware for some paths, e.g. health probes.
+    The middleware keeps its position in the stack, the path rules are compiled once when the stack is built.
     """
     current_middleware_stack = FastAPI.build_middleware_stack
 
@@ -52,7 +138,78 @@ def patch_fastapi_middlewares(middlewares: list['Middleware']) -> None:
         """
         app = current_middleware_stack(self)
         for middleware in middlewares:
-            app = middleware.cls(app, **middleware.options)
+            if isinstance(middleware, PathMiddleware):
+                app = middleware.build(app)
+            else:
+                app = middleware.cls(app, **middleware.options)
         return app
 
     FastAPI.build_middleware_stack = _build_new_middleware_stack  # type: ignore
+
+
+class ResponseRecorder:
+    """
+    `send` wrapper for pure ASGI middlewares, recording the status code and body size of the response it sends
+    """
+
+    def __init__(self, send: 'Send') -> None:
+        self.send = send
+        # If the app raises before a response is started, the server will respond with a 500
+        self.status_code = 500
+        self.response_size = 0
+
+    async def __call__(self, message: 'Message') -> None:
+        """
+        Record the response start or body chunk, and send it
+        """
+        if message['type'] == 'http.response.body':
+            self.response_size += len(message.get('body', b''))
+        elif message['type'] == 'http.response.start':
+            self.status_code = message['status']
+        await self.send(message)
+
+
+class LoggingMiddleware:
+    """
+    Access log middleware, emitting one record per request after the response is completed, with
+    method, path, status code, response size and duration.
+
+    This is a pure ASGI middleware (unlike `BaseHTTPMiddleware`, it doesn't spawn tasks or buffer the response), so
+    the only work done per streamed chunk is adding up its size. The path is the requested one, not the path left
+    after a `Mount`, and a request whose app raises is logged with status 500 and the size sent so far.
+    """
+
+    def __init__(self, app: 'ASGIApp') -> None:
+        self.app = app
+
+    async def __call__(self, scope: 'Scope', receive: 'Receive', send: 'Send') -> None:
+        """
+        Time the request and record status code and size of the response
+        """
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = perf_counter()
+        # Mounted apps rewrite the path in place
+        path = scope['path']
+        recorder = ResponseRecorder(send)
+        try:
+            await self.app(scope, receive, recorder)
+        finally:
+            duration_ms = (perf_counter() - start) * 1000
+            log.info(
+                '%s %s %s %s bytes %.2fms',
+                scope['method'],
+                path,
+                recorder.status_code,
+                recorder.response_size,
+                duration_ms,
+                extra={
+                    'method': scope['method'],
+                    'path': path,
+                    'status_code': recorder.status_code,
+                    'response_size': recorder.response_size,
+                    'duration_ms': duration_ms,
+                },
+            )
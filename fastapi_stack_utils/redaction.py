@@ -0,0 +1,124 @@
+import re
+from typing import Any, Iterable
+
+from starlette.datastructures import MutableHeaders
+
+# Parts of key names whose values are redacted, e.g. `password` also matches `db_password`
+DEFAULT_KEYS = ('password', 'passwd', 'secret', 'token', 'api_key', 'apikey', 'authorization', 'credential')
+DEFAULT_HEADERS = ('authorization', 'proxy-authorization', 'cookie', 'set-cookie', 'x-api-key')
+REPLACEMENT = '[REDACTED]'
+# Authentication schemes followed by credentials in `Authorization` style values, lowercase
+AUTH_SCHEMES = 'bearer|basic|digest|negotiate|token|apikey'
+
+
+class Redactor:
+    """
+    Redacts secrets from audit logged bodies and headers.
+
+    Values are redacted if their key contains one of `keys` (case insensitive), if they are the value of one of
+    `headers`, or if they match one of the regex `patterns`. Keys and patterns are each compiled once into a single
+    regex. Parsed JSON is redacted in one pass over the object, and text in one scan for `key: value`/`key=value`
+    pairs plus one scan for the patterns.
+    """
+
+    def __init__(
+        self,
+        keys: Iterable[str] = DEFAULT_KEYS,
+        headers: Iterable[str] = DEFAULT_HEADERS,
+        patterns: Iterable[str] = (),
+        replacement: str = REPLACEMENT,
+    ) -> None:
+        self.keys = tuple(keys)
+        self.headers = frozenset(header.lower() for header in headers)
+        self.patterns = tuple(patterns)
+        self.replacement = replacement
+        key_names = '|'.join(re.escape(key.lower()) for key in self.keys) or '(?!)'
+        self.key_matcher = re.compile(key_names, re.IGNORECASE)
+        # A key containing a key name, a separator, and a quoted or unquoted value. The closing quote is optional, as
+        # truncated text may end in the middle of a value. Unquoted values end at whitespace, unless they start with
+        # an authentication scheme, like `Authorization: Bearer <token>`.
+        key_value = (
+            rf'(?P<key>(?:{key_names})[\w.-]*["\']?\s*[:=]\s*)'
+            r'(?P<value>"(?:[^"\\]|\\.)*"?|\'(?:[^\'\\]|\\.)*\'?'
+            rf'|(?:{AUTH_SCHEMES})[ \t]+[^\s&,;}}\]]+|[^\s&,;}}\]]+)'
+        )
+        # Case insensitive regexes are much slower to scan, so ASCII text is matched lowercased instead
+        self.key_value_matcher = re.compile(key_value)
+        self.key_value_matcher_ignorecase = re.compile(key_value, re.IGNORECASE)
+        self.pattern_matcher = (
+            re.compile('|'.join(f'(?:{pattern})' for pattern in self.patterns)) if self.patterns else None
+        )
+        # Keys repeat a lot in JSON, so remember whether each one matched
+        self._redacted_keys: dict[str, bool] = {}
+
+    def extend(self, keys: Iterable[str] = (), headers: Iterable[str] = (), patterns: Iterable[str] = ()) -> 'Redactor':
+        """
+        Return a new redactor, also redacting the given keys, headers and patterns
+        """
+        return Redactor(
+            keys=(*self.keys, *keys),
+            headers=(*self.headers, *headers),
+            patterns=(*self.patterns, *patterns),
+            replacement=self.replacement,
+        )
+
+    def is_redacted_key(self, key: str) -> bool:
+        """
+        Whether values of this key are redacted
+        """
+        redacted = self._redacted_keys.get(key)
+        if redacted is None:
+            redacted = self.key_matcher.search(key) is not None
+            if len(self._redacted_keys) < 10_000:
+                self._redacted_keys[key] = redacted
+        return redacted
+
+    def redact_json(self, value: Any) -> Any:
+        """
+        Return a redacted copy of parsed JSON. The value itself is not modified, as FastAPI validates it afterwards.
+        """
+        if isinstance(value, dict):
+            return {
+                key: self.replacement if isinstance(key, str) and self.is_redacted_key(key) else self.redact_json(item)
+                for key, item in value.items()
+            }
+        if isinstance(value, list):
+            return [self.redact_json(item) for item in value]
+        if isinstance(value, str) and self.pattern_matcher is not None:
+            return self.pattern_matcher.sub(self.replacement, value)
+        return value
+
+    def redact_text(self, text: str) -> str:
+        """
+        Redact key/value pairs (JSON, form data, query strings) and patterns in raw, possibly truncated, text
+        """
+        if self.keys:
+            if text.isascii():
+                # Lowercasing ASCII keeps the offsets of the matches valid for the original text
+                matches = self.key_value_matcher.finditer(text.lower())
+            else:
+                matches = self.key_value_matcher_ignorecase.finditer(text)
+            parts = []
+            end = 0
+            for match in matches:
+                # Keep the key, separator and opening quote
+                value_start = match.start('value')
+                quote = text[value_start] if text[value_start] in '"\'' else ''
+                parts += [text[end:value_start], quote, self.replacement, quote]
+                end = match.end()
+            if parts:
+                text = ''.join(parts) + text[end:]
+        if self.pattern_matcher is not None:
+            text = self.pattern_matcher.sub(self.replacement, text)
+        return text
+
+    def redact_headers(self, headers: MutableHeaders) -> MutableHeaders:
+        """
+        Return a copy of the headers, with the values of sensitive headers redacted
+        """
+        return MutableHeaders(
+            raw=[
+                (name, self.replacement.encode() if name.decode('latin-1') in self.headers else value)
+                for name, value in headers.raw
+            ]
+        )
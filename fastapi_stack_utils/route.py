@@ -1,14 +1,301 @@
-import contextlib
+import json
 import logging
-from typing import Callable
+from contextvars import Context, copy_context
+from functools import partial
+from queue import Full, Queue
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Callable
 
 from fastapi import Request, Response
 from fastapi.routing import APIRoute
+from fastapi_stack_utils.background import BackgroundThread
+from fastapi_stack_utils.metrics import REGISTRY
+from fastapi_stack_utils.redaction import Redactor
+from fastapi_stack_utils.warmup import is_warmup_request
+from starlette.datastructures import MutableHeaders
+
+if TYPE_CHECKING:  # pragma: no cover
+    from starlette.types import Message, Receive, Scope, Send
 
 log = logging.getLogger('fastapi_stack_utils.route')
 
+TEXT_MEDIA_TYPES = ('application/x-www-form-urlencoded', 'application/xml')
+# Markers for a JSON request body that is not parsed yet, or can't be parsed
+_NOT_PARSED = object()
+_INVALID_JSON = object()
+
+
+def is_json_media_type(media_type: str) -> bool:
+    """
+    Mirrors FastAPI: a missing content type, `application/json` and `application/*+json` are parsed as JSON
+    """
+    return not media_type or media_type == 'application/json' or media_type.endswith('+json')
+
+
+def is_text_media_type(media_type: str) -> bool:
+    """
+    Content types that are safe (and useful) to decode and log as text
+    """
+    return media_type.startswith('text/') or media_type in TEXT_MEDIA_TYPES
+
+
+class AuditLogBacklog:
+    """
+    Bounded backlog of deferred audit log calls, run in order by a background thread.
+
+    `submit` never blocks: when the backlog is full the call is discarded and counted in `dropped`, so a slow log
+    sink can't stall requests. The calls run in a copy of the submitter's context, so context variables such as the
+    correlation ID are logged as if the call was made inline.
+    """
+
+    def __init__(self, maxsize: int = 10_000) -> None:
+        self.calls: Queue[tuple[Context, Callable[[], None]] | None] = Queue(maxsize)
+        self.dropped = 0
+        self.thread = BackgroundThread(self.run, 'audit-log-backlog')
+
+    @property
+    def running(self) -> bool:
+        """
+        Whether submitted calls are being made
+        """
+        return self.thread.running
+
+    def start(self) -> None:
+        """
+        Start making submitted calls, e.g. on warmup, so the first request doesn't start the thread
+        """
+        self.thread.start()
+
+    def submit(self, function: Callable[[], None]) -> None:
+        """
+        Queue a call, or drop it if the backlog is full
+        """
+        self.thread.start()
+        try:
+            self.calls.put_nowait((copy_context(), function))
+        except Full:
+            self.dropped += 1
+
+    def run(self) -> None:
+        """
+        Make the queued calls until stopped
+        """
+        while (call := self.calls.get()) is not None:
+            context, function = call
+            try:
+                context.run(function)
+            except Exception:
+                log.exception('Deferred audit logging failed')
+
+    def stop(self) -> None:
+        """
+        Make all queued calls and stop the thread. Add to the app shutdown events.
+        """
+        self.thread.stop(lambda: self.calls.put(None))
+        if self.dropped:
+            log.warning('Dropped %s audit log records, the backlog was full', self.dropped)
+            self.dropped = 0
+
+
+AUDIT_LOG_BACKLOG = AuditLogBacklog()
+REGISTRY.add_gauge('audit_log_backlog', 'Deferred audit log calls waiting to run', AUDIT_LOG_BACKLOG.calls.qsize)
+REGISTRY.add_gauge(
+    'audit_log_dropped', 'Deferred audit log calls dropped since the last stop', lambda: AUDIT_LOG_BACKLOG.dropped
+)
+
 
 class AuditLog(APIRoute):
+    # Maximum number of request body bytes to include in the audit log. Larger bodies are truncated with a marker.
+    # Subclass and override to change, `None` captures the full body.
+    max_body_capture: int | None = 64 * 1024
+    # Same for the response body, which is captured while it is sent, so streamed responses are never buffered
+    max_response_capture: int | None = 64 * 1024
+    # Measure the time spent reading the body, decoding it for the audit log, in the route handler
+    # (validation, endpoint and serialization) and logging the request. Logged as `timings` in `extra` when the
+    # response is ready, before it is sent.
+    timing: bool = False
+    # Also add the timings as a `Server-Timing` response header. Requires `timing`.
+    server_timing: bool = False
+    # Only snapshot the request and response on the request path, and format and log them in `backlog`, after
+    # the response is sent. Records are logged as soon as the backlog's thread gets to them.
+    deferred: bool = False
+    backlog: AuditLogBacklog = AUDIT_LOG_BACKLOG
+    # Redacts secrets from the logged query, bodies and response headers. Override with e.g.
+    # `Redactor().extend(keys=['ssn'])` on a subclass, or `None` to log everything verbatim.
+    redactor: Redactor | None = Redactor()
+
+    async def read_request_body(self, request: Request) -> tuple[str, bytes | None]:
+        """
+        Return the media type, and the body if it should be logged.
+        Binary/multipart bodies are not read, so they can still be streamed by the endpoint.
+        """
+        media_type = request.headers.get('content-type', '').split(';', 1)[0].strip().lower()
+        if not is_json_media_type(media_type) and not is_text_media_type(media_type):
+            return media_type, None
+        return media_type, await request.body()
+
+    async def decode_request_body(self, request: Request, media_type: str, bytes_body: bytes | None) -> str | None:
+        """
+        Build the loggable representation of the request body.
+
+        JSON bodies are parsed through `request.json()`, which caches the result on the request, so FastAPI reuses
+        the parsed object instead of parsing the body again. Bodies larger than `max_body_capture` are never parsed.
+        """
+        json_body: Any = _NOT_PARSED
+        if bytes_body and not self.is_truncated(bytes_body) and is_json_media_type(media_type):
+            try:
+                json_body = await request.json()
+            except ValueError:  # JSONDecodeError and UnicodeDecodeError
+                json_body = _INVALID_JSON
+        return self.format_request_body(media_type, bytes_body, request.headers.get('content-length'), json_body)
+
+    def is_truncated(self, bytes_body: bytes) -> bool:
+        """
+        Whether the body is larger than `max_body_capture`
+        """
+        return self.max_body_capture is not None and len(bytes_body) > self.max_body_capture
+
+    def format_request_body(
+        self, media_type: str, bytes_body: bytes | None, content_length: str | None, json_body: Any = _NOT_PARSED
+    ) -> str | None:
+        """
+        Build the loggable representation of the request body, parsing JSON unless it's already parsed.
+        Binary/multipart bodies are summarized by content type and length.
+        """
+        if bytes_body is None:
+            if content_length is None:
+                return f'<{media_type}>'
+            return f'<{media_type}; {content_length} bytes>'
+        if not bytes_body:
+            return None
+        if self.max_body_capture is not None and len(bytes_body) > self.max_body_capture:
+            truncated = self.redact_text(bytes_body[: self.max_body_capture].decode(errors='replace'))
+            return f'{truncated}... [truncated {len(bytes_body) - self.max_body_capture} bytes]'
+        if is_json_media_type(media_type):
+            if json_body is _NOT_PARSED:
+                try:
+                    json_body = json.loads(bytes_body)
+                except ValueError:
+                    json_body = _INVALID_JSON
+            if json_body is not _INVALID_JSON:
+                return str(json_body if self.redactor is None else self.redactor.redact_json(json_body))
+        return self.redact_text(bytes_body.decode(errors='replace'))
+
+    def redact_text(self, text: str) -> str:
+        """
+        Redact secrets in text with the route's redactor, if any
+        """
+        return text if self.redactor is None else self.redactor.redact_text(text)
+
+    async def capture_request_body(self, request: Request) -> str | None:
+        """
+        Read and decode the request body for the audit log
+        """
+        media_type, bytes_body = await self.read_request_body(request)
+        return await self.decode_request_body(request, media_type, bytes_body)
+
+    def log_request(self, request: Request, str_body: str | None) -> None:
+        """
+        Log user, method, path, query and body of the request
+        """
+        extra: dict[str, Any] = {
+            'user': request.headers.get('remote-user', 'Unknown'),
+            'method': str(request.method),
+            'path': str(request.url.path),
+            # str(QueryParam) wrongly translates e.g. %20 into `+` instead of `space`
+            'query': self.redact_text(request.scope['query_string'].decode()) if request.query_params else None,
+            'str_body': str_body,
+        }
+        if is_warmup_request(request.scope):
+            # Kept out of the audit database by `SqliteAuditHandler`
+            extra['warmup'] = True
+
+        path_param_body = ' | '.join(filter(None, [extra['path'], extra['query'], extra['str_body']]))
+        log.info(
+            '%s > [%s] | %s',
+            extra['user'],
+            extra['method'],
+            path_param_body,
+            extra=extra,
+        )
+
+    def decode_response_body(self, media_type: str, captured: bytes, size: int) -> str:
+        """
+        Build the loggable representation of the captured response body, which is the first `max_response_capture`
+        bytes of `size` bytes sent. Binary bodies are summarized by content type and length.
+        """
+        if not is_json_media_type(media_type) and not is_text_media_type(media_type):
+            return f'<{media_type}; {size} bytes>'
+        str_body = self.redact_text(captured.decode(errors='replace'))
+        if size > len(captured):
+            return f'{str_body}... [truncated {size - len(captured)} bytes]'
+        return str_body
+
+    def log_deferred_request(self, request: Request, media_type: str, bytes_body: bytes | None) -> None:
+        """
+        Format and log the request from the backlog. The request is only read, never awaited.
+        """
+        str_body = self.format_request_body(media_type, bytes_body, request.headers.get('content-length'))
+        self.log_request(request, str_body)
+
+    def log_captured_response(self, media_type: str, captured: bytes, size: int, headers: MutableHeaders) -> None:
+        """
+        Format and log the response captured by `handle`
+        """
+        self.log_response(self.decode_response_body(media_type, captured, size), headers)
+
+    def log_timings(self, timings: dict[str, float]) -> None:
+        """
+        Log the duration of each phase of the request, in milliseconds
+        """
+        log.info(
+            'Timings: %s',
+            ' | '.join(f'{name} {duration:.3f}ms' for name, duration in timings.items()),
+            extra={'timings': timings},
+        )
+
+    def log_response(self, str_body: str, headers: MutableHeaders) -> None:
+        """
+        Log body and headers of the response
+        """
+        log.info('Response body: %s', str_body)
+        log.info('Response headers: %s', headers if self.redactor is None else self.redactor.redact_headers(headers))
+
+    async def handle(self, scope: 'Scope', receive: 'Receive', send: 'Send') -> None:
+        """
+        Extends `handle` to capture the response body as it is sent, unless the request was only reading.
+        The chunks are passed on untouched, and the response is logged once the last chunk is sent.
+        """
+        if scope['method'] in ('OPTIONS', 'GET', 'HEAD'):
+            await super().handle(scope, receive, send)
+            return
+
+        headers = MutableHeaders()
+        media_type = ''
+        captured = bytearray()
+        size = 0
+
+        async def send_wrapper(message: 'Message') -> None:
+            nonlocal headers, media_type, size
+            if message['type'] == 'http.response.start':
+                headers = MutableHeaders(raw=list(message.get('headers', [])))
+                media_type = headers.get('content-type', '').split(';', 1)[0].strip().lower()
+            elif message['type'] == 'http.response.body':
+                chunk = message.get('body', b'')
+                size += len(chunk)
+                if self.max_response_capture is None:
+                    captured.extend(chunk)
+                elif len(captured) < self.max_response_capture:
+                    captured.extend(chunk[: self.max_response_capture - len(captured)])
+            await send(message)
+            if message['type'] == 'http.response.body' and not message.get('more_body', False):
+                if self.deferred:
+                    self.backlog.submit(partial(self.log_captured_response, media_type, bytes(captured), size, headers))
+                else:
+                    self.log_captured_response(media_type, bytes(captured), size, headers)
+
+        await super().handle(scope, receive, send_wrapper)
+
     def get_route_handler(self) -> Callable:
         """
         Overrides `get_route_handler`
@@ -19,31 +306,46 @@ class AuditLog(APIRoute):
             """
             Replacement of route_handler that will attempt to log input body
             """
-            bytes_body = await request.body()
-            extra = {
-                'user': request.headers.get('remote-user', 'Unknown'),
-                'method': str(request.method),
-                'path': str(request.url.path),
-                # str(QueryParam) wrongly translates e.g. %20 into `+` instead of `space`
-                'query': request.scope['query_string'].decode() if request.query_params else None,
-                'str_body': bytes_body.decode() or None,
-            }
-            with contextlib.suppress(Exception):
-                # override body with JSON if possible
-                extra['str_body'] = str(await request.json())
-
-            path_param_body = ' | '.join(filter(None, [extra['path'], extra['query'], extra['str_body']]))
-            log.info(
-                '%s > [%s] | %s',
-                extra['user'],
-                extra['method'],
-                path_param_body,
-                extra=extra,
-            )
+            if self.deferred:
+                media_type, bytes_body = await self.read_request_body(request)
+                self.backlog.submit(partial(self.log_deferred_request, request, media_type, bytes_body))
+            else:
+                self.log_request(request, await self.capture_request_body(request))
+            return await original_route_handler(request)
+
+        async def timed_route_handler(request: Request) -> Response:
+            """
+            `input_body_route_handler`, measuring the time spent in each phase
+            """
+            start = perf_counter()
+            media_type, bytes_body = await self.read_request_body(request)
+            read = perf_counter()
+            if self.deferred:
+                decoded = read
+                self.backlog.submit(partial(self.log_deferred_request, request, media_type, bytes_body))
+            else:
+                str_body = await self.decode_request_body(request, media_type, bytes_body)
+                decoded = perf_counter()
+                self.log_request(request, str_body)
+            request_logged = perf_counter()
             response: Response = await original_route_handler(request)
-            if request.method not in ['OPTIONS', 'GET', 'HEAD']:
-                log.info('Response body: %s', response.body.decode())
-                log.info('Response headers: %s', response.headers)
+            handled = perf_counter()
+
+            timings = {
+                'read': (read - start) * 1000,
+                'decode': (decoded - read) * 1000,
+                'handler': (handled - request_logged) * 1000,
+                'log': (request_logged - decoded) * 1000,
+            }
+            if self.server_timing:
+                response.headers.append(
+                    'Server-Timing', ', '.join(f'{name};dur={duration:.3f}' for name, duration in timings.items())
+                )
+            if self.deferred:
+                self.backlog.submit(partial(self.log_timings, timings))
+            else:
+                self.log_timings(timings)
             return response
 
-        return input_body_route_handler
+        # Pick the handler once, so there's no cost when timing is disabled
+        return timed_route_handler if self.timing else input_body_route_handler
@@ -0,0 +1,233 @@
+import base64
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Any
+
+from hvac.exceptions import VaultError  # type: ignore[import]
+from pydantic import BaseSettings
+from pydantic.env_settings import SettingsError
+from pydantic_vault.vault_settings import _extract_vault_token, _get_authenticated_vault_client
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+    cryptography_installed = True
+except ModuleNotFoundError:  # pragma: no cover
+    cryptography_installed = False
+
+log = logging.getLogger('fastapi_stack_utils.vault_cache')
+
+DEFAULT_CACHE_PATH = Path.home() / '.cache' / 'fastapi-stack-utils' / 'vault.cache'
+
+
+class VaultSecretCache:
+    """
+    Cache of Vault secrets (the `data` of the API response), keyed by Vault URL and secret path.
+
+    Secrets are always memoized in memory, so settings classes in the same process share one fetch per secret.
+    If a `key` is given, secrets are also stored in `path`, encrypted with Fernet, and reused by later processes
+    until they are older than `ttl` seconds.
+    """
+
+    def __init__(self, path: Path, ttl: float, key: bytes | None) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.fernet = Fernet(key) if key is not None else None
+        self.secrets: dict[str, tuple[float, Any]] = {}
+        self.loaded = False
+        self.lock = Lock()
+
+    def load(self) -> None:
+        """
+        Read the encrypted cache file once. A missing, corrupt or undecryptable file is an empty cache.
+        """
+        if self.loaded:
+            return
+        self.loaded = True
+        if self.fernet is None or not self.path.exists():
+            return
+        try:
+            self.secrets.update(json.loads(self.fernet.decrypt(self.path.read_bytes())))
+        except (OSError, ValueError, InvalidToken):
+            log.info('Ignoring unreadable Vault cache %s', self.path)
+
+    def get(self, key: str) -> Any | None:
+        """
+        Return the cached secret, if it has not expired
+        """
+        with self.lock:
+            self.load()
+            cached = self.secrets.get(key)
+        if cached is None:
+            return None
+        fetched_at, secret = cached
+        if self.fernet is not None and time.time() - fetched_at > self.ttl:
+            return None
+        return secret
+
+    def set(self, key: str, secret: Any) -> None:
+        """
+        Cache a secret in memory. Call `save` to write it to disk.
+        """
+        with self.lock:
+            self.secrets[key] = (time.time(), secret)
+
+    def save(self) -> None:
+        """
+        Atomically write the cache to disk, readable by the owner only
+        """
+        if self.fernet is None:
+            return
+        with self.lock:
+            now = time.time()
+            secrets = {key: cached for key, cached in self.secrets.items() if now - cached[0] <= self.ttl}
+            token = self.fernet.encrypt(json.dumps(secrets).encode())
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.path.with_suffix('.tmp')
+        fd = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as cache_file:
+            cache_file.write(token)
+        os.replace(temporary_path, self.path)
+
+    def invalidate(self) -> None:
+        """
+        Forget all secrets, in memory and on disk
+        """
+        with self.lock:
+            self.secrets.clear()
+            self.loaded = True
+        self.path.unlink(missing_ok=True)
+
+
+# Keyed by cache file, TTL and encryption key
+_caches: dict[tuple[Path, float, bytes | None], VaultSecretCache] = {}
+_caches_lock = Lock()
+
+
+def derive_cache_key(vault_token: str) -> bytes:
+    """
+    Derive the cache encryption key from the Vault token. A new token (e.g. after `vault login`) can't read the
+    old cache, so it is refetched.
+    """
+    derived = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'fastapi-stack-utils vault cache').derive(
+        vault_token.encode()
+    )
+    return base64.urlsafe_b64encode(derived)
+
+
+def get_vault_cache(settings: BaseSettings) -> VaultSecretCache:
+    """
+    Return the process wide cache for the settings' Config. Settings classes share it if they use the same cache
+    file, TTL and key; classes with a different TTL or key get their own cache, and fetch the secrets again.
+
+    The disk cache is enabled by `vault_cache_ttl` on the Config (or `FSU_VAULT_CACHE_TTL`), and encrypted with
+    `FSU_VAULT_CACHE_KEY` (a Fernet key), or else a key derived from the Vault token.
+    Without a TTL, a key or the `cryptography` package, secrets are only memoized in memory.
+    """
+    config = settings.__config__
+    path = Path(
+        getattr(config, 'vault_cache_path', None) or os.environ.get('FSU_VAULT_CACHE_PATH') or DEFAULT_CACHE_PATH
+    )
+    ttl = getattr(config, 'vault_cache_ttl', None) or os.environ.get('FSU_VAULT_CACHE_TTL')
+    key: bytes | None = None
+    if ttl is not None and not cryptography_installed:
+        log.warning('Install `cryptography` to cache Vault secrets on disk')
+    elif ttl is not None:
+        if 'FSU_VAULT_CACHE_KEY' in os.environ:
+            key = os.environ['FSU_VAULT_CACHE_KEY'].encode()
+        elif (vault_token := _extract_vault_token(settings)) is not None:
+            key = derive_cache_key(vault_token.get_secret_value())
+    cache_id = (path, float(ttl or 0), key)
+    with _caches_lock:
+        if cache_id not in _caches:
+            _caches[cache_id] = VaultSecretCache(path=path, ttl=cache_id[1], key=key)
+        return _caches[cache_id]
+
+
+def invalidate_vault_cache(path: Path | None = None) -> None:
+    """
+    Forget all cached Vault secrets, in this process and on disk
+    """
+    path = path or Path(os.environ.get('FSU_VAULT_CACHE_PATH') or DEFAULT_CACHE_PATH)
+    with _caches_lock:
+        caches = [_caches.pop(cache_id) for cache_id in list(_caches) if cache_id[0] == path]
+    for cache in caches:
+        cache.invalidate()
+    path.unlink(missing_ok=True)
+
+
+def cached_vault_config_settings_source(settings: BaseSettings) -> dict[str, Any]:
+    """
+    Drop-in replacement for `pydantic_vault.vault_config_settings_source`, reading secrets through the
+    `VaultSecretCache`. Vault is only authenticated against if a secret is not cached.
+    """
+    cache = get_vault_cache(settings)
+    vault_url = str(getattr(settings.__config__, 'vault_url', None) or os.environ.get('VAULT_ADDR'))
+    vault_client = None
+    values: dict[str, Any] = {}
+    fetched = False
+    # Secrets which could not be read, so fields sharing a secret path only try once
+    unreadable: set[str] = set()
+
+    for field in settings.__fields__.values():
+        vault_secret_path: str | None = field.field_info.extra.get('vault_secret_path')
+        vault_secret_key: str | None = field.field_info.extra.get('vault_secret_key')
+        if vault_secret_path is None:
+            continue
+
+        cache_key = f'{vault_url} {vault_secret_path}'
+        if cache_key in unreadable:
+            continue
+        vault_api_response = cache.get(cache_key)
+        if vault_api_response is None:
+            if vault_client is None:
+                vault_client = _get_authenticated_vault_client(settings)
+                if vault_client is None:
+                    log.warning('Could not find a suitable authentication method for Vault')
+                    break
+            try:
+                response = vault_client.read(vault_secret_path)
+                if response is None:
+                    raise VaultError
+                vault_api_response = response['data']
+            except VaultError:
+                log.info('could not get secret "%s"', vault_secret_path)
+                unreadable.add(cache_key)
+                continue
+            cache.set(cache_key, vault_api_response)
+            fetched = True
+
+        # Same lookup as `pydantic_vault`: KV v2 nests the secret in `data`, KV v1 doesn't
+        vault_val: Any
+        if vault_secret_key is None:
+            vault_val = vault_api_response.get('data', vault_api_response)
+        else:
+            try:
+                vault_val = vault_api_response['data'][vault_secret_key]
+            except (KeyError, TypeError):
+                try:
+                    vault_val = vault_api_response[vault_secret_key]
+                except KeyError:
+                    log.info('could not get key "%s" in secret "%s"', vault_secret_key, vault_secret_path)
+                    continue
+
+        if field.is_complex() and not isinstance(vault_val, dict):
+            try:
+                vault_val = settings.__config__.json_loads(vault_val)
+            except ValueError as error:
+                secret_full_path = vault_secret_path
+                if vault_secret_key is not None:
+                    secret_full_path += f':{vault_secret_key}'
+                raise SettingsError(f'error parsing JSON for "{secret_full_path}"') from error
+
+        values[field.alias] = vault_val
+
+    if fetched:
+        cache.save()
+    return values
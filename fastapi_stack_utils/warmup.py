@@ -0,0 +1,194 @@
+import asyncio
+import logging
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Callable, Coroutine, Iterable
+from urllib.parse import urlsplit
+
+if TYPE_CHECKING:  # pragma: no cover
+    from fastapi import FastAPI
+    from starlette.types import Message, Scope
+
+log = logging.getLogger('fastapi_stack_utils.warmup')
+
+USER_AGENT = b'fastapi-stack-utils-warmup'
+# ASGI scope extension marking warmup requests, so they are kept out of the metrics, audit database and response cache
+WARMUP_EXTENSION = 'fsu.warmup'
+
+
+def is_warmup_request(scope: 'Scope') -> bool:
+    """
+    Whether the request was sent by `warm_up`
+    """
+    return WARMUP_EXTENSION in (scope.get('extensions') or {})
+
+
+class WarmupRequest:
+    """
+    A synthetic request to a route which is safe to call on startup: no side effects, and no external dependencies
+    which may be unavailable while the app starts
+    """
+
+    def __init__(
+        self, path: str, method: str = 'GET', body: bytes = b'', headers: dict[str, str] | None = None
+    ) -> None:
+        self.path = path
+        self.method = method.upper()
+        self.body = body
+        self.headers = headers or {}
+
+    def __repr__(self) -> str:
+        """
+        Method and path, as shown in the warmup log
+        """
+        return f'{self.method} {self.path}'
+
+
+async def call_app(app: 'FastAPI', request: WarmupRequest) -> int:
+    """
+    Send a request through the whole app in process, including the middlewares, and return the status code.
+    The request is marked with the `WARMUP_EXTENSION` scope extension.
+    """
+    url = urlsplit(request.path)
+    headers = [(b'host', b'warmup'), (b'user-agent', USER_AGENT)]
+    headers += [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in request.headers.items()]
+    if request.body:
+        headers.append((b'content-length', str(len(request.body)).encode()))
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': request.method,
+        'scheme': 'http',
+        'path': url.path,
+        'raw_path': url.path.encode(),
+        'query_string': url.query.encode(),
+        'root_path': '',
+        'headers': headers,
+        'client': ('127.0.0.1', 0),
+        'server': ('warmup', 80),
+        'extensions': {WARMUP_EXTENSION: {}},
+    }
+    status = 0
+    request_sent = False
+    response_complete = asyncio.Event()
+
+    async def receive() -> 'Message':
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': request.body, 'more_body': False}
+        # Like a client which stays connected until the response is complete
+        await response_complete.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message: 'Message') -> None:
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body' and not message.get('more_body', False):
+            response_complete.set()
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        response_complete.set()
+    return status
+
+
+def warm_up_loggers() -> None:
+    """
+    Run the filters and formatters of all configured handlers once, without emitting anything
+    """
+    from fastapi_stack_utils.audit_sink import SqliteAuditHandler
+    from fastapi_stack_utils.log_aggregation import SocketLineHandler
+
+    loggers = [logging.getLogger()]
+    loggers += [logger for logger in logging.Logger.manager.loggerDict.values() if isinstance(logger, logging.Logger)]
+    handlers = {handler for logger in loggers for handler in logger.handlers}
+    for handler in handlers:
+        record = logging.makeLogRecord({'name': log.name, 'msg': 'Warming up', 'levelno': logging.INFO})
+        record.levelname = 'INFO'
+        try:
+            if handler.filter(record):
+                handler.format(record)
+            if isinstance(handler, SqliteAuditHandler):
+                handler.start()
+            elif isinstance(handler, SocketLineHandler):
+                handler.connect()
+        except Exception:
+            log.debug('Could not warm up %r', handler, exc_info=True)
+
+
+async def warm_up_error_responses() -> None:
+    """
+    Validate and render the `ErrorResponse` bodies once
+    """
+    from fastapi import HTTPException, Request
+    from fastapi_stack_utils.exception_handler import http_exception_handler
+    from fastapi_stack_utils.schemas.http_exceptions import ErrorResponse, ServerError
+
+    ErrorResponse(detail=[ServerError(description='Not Found', error='Not Found')]).dict()
+    request = Request({'type': 'http', 'method': 'GET', 'path': '/', 'headers': [], 'query_string': b''})
+    await http_exception_handler(request, HTTPException(status_code=404, detail='Not Found'))
+
+
+async def warm_up(
+    app: 'FastAPI', requests: Iterable[str | WarmupRequest] = (), timeout: float = 10.0
+) -> dict[str, tuple[int, float]]:
+    """
+    Do the work which otherwise slows down the first requests after a deploy:
+    * build the middleware stack, e.g. the one from `patch_fastapi_middlewares`
+    * generate the OpenAPI schema, which walks every route, dependency and model
+    * start the `AuditLog` backlog, if any route defers its audit logs
+    * validate and render the `ErrorResponse` bodies
+    * run the filters and formatters of all logging handlers, and connect the audit database and log writer
+    * send `requests` (paths for GET, or `WarmupRequest`s) through the whole app, in process
+
+    Returns the status code and duration in seconds per request. Failing requests are logged, and do not stop the
+    warmup. Warmup requests are not counted by `MetricsMiddleware`, stored by `SqliteAuditHandler` or cached by
+    `ResponseCacheMiddleware`, and their `AuditLog` records have `warmup=True`.
+    """
+    from fastapi.routing import APIRoute
+
+    start = perf_counter()
+    if app.middleware_stack is None:
+        app.middleware_stack = app.build_middleware_stack()
+    if app.openapi_url:
+        app.openapi()
+    for route in app.routes:
+        if isinstance(route, APIRoute) and getattr(route, 'deferred', False):
+            route.backlog.start()  # type: ignore[attr-defined]
+    await warm_up_error_responses()
+    warm_up_loggers()
+
+    results = {}
+    for request in requests:
+        if isinstance(request, str):
+            request = WarmupRequest(request)
+        request_start = perf_counter()
+        try:
+            status = await asyncio.wait_for(call_app(app, request), timeout)
+        except Exception:
+            log.warning('Warmup request %r failed', request, exc_info=True)
+            status = 500
+        results[repr(request)] = (status, perf_counter() - request_start)
+        if status >= 400:
+            log.warning('Warmup request %r returned %s', request, status)
+    log.info('Warmed up in %.3f seconds', perf_counter() - start, extra={'warmup_requests': results})
+    return results
+
+
+def add_warmup(
+    app: 'FastAPI', requests: Iterable[str | WarmupRequest] = (), timeout: float = 10.0
+) -> Callable[[], Coroutine[Any, Any, dict[str, tuple[int, float]]]]:
+    """
+    Warm up the app on startup, after the other startup handlers, so it's warm before the worker accepts requests.
+    Startup handlers don't run for apps with a `lifespan` context, call `warm_up` at the end of its startup instead.
+    """
+    requests = list(requests)
+
+    async def warm_up_on_startup() -> dict[str, tuple[int, float]]:
+        return await warm_up(app, requests, timeout)
+
+    app.router.add_event_handler('startup', warm_up_on_startup)
+    return warm_up_on_startup
@@ -1,9 +1,11 @@
 import asyncio
+import logging
 from logging.config import dictConfig
 
 import pytest
 import pytest_asyncio
 from fastapi import APIRouter, FastAPI
+from fastapi.responses import StreamingResponse
 from fastapi_stack_utils.logging_config import generate_base_logging_config
 from fastapi_stack_utils.route import AuditLog
 from httpx import AsyncClient
@@ -45,7 +47,51 @@ async def logged_path_query(param: str, body: InputBody):
     return {'message': f'{param}: {body.dict()}'}
 
 
+class TruncatedAuditLog(AuditLog):
+    max_body_capture = 10
+    max_response_capture = 10
+
+
+truncated_router = APIRouter(route_class=TruncatedAuditLog)
+
+
+@truncated_router.post('/truncated')
+async def truncated(body: InputBody):
+    return {'message': body.a}
+
+
+async def stream_chunks(chunk: bytes, count: int):
+    for index in range(count):
+        logging.getLogger('tests').info('Chunk %s', index)
+        yield chunk
+
+
+@truncated_router.post('/truncated/streamed')
+async def truncated_streamed():
+    return StreamingResponse(stream_chunks(b'0123456', 3), media_type='text/plain')
+
+
+@truncated_router.post('/truncated/download')
+async def truncated_download():
+    return StreamingResponse(stream_chunks(b'\x00\xff', 3), media_type='application/octet-stream')
+
+
+class TimedAuditLog(AuditLog):
+    timing = True
+    server_timing = True
+
+
+timed_router = APIRouter(route_class=TimedAuditLog)
+
+
+@timed_router.post('/timed')
+async def timed(body: InputBody):
+    return {'message': body.a}
+
+
 fastapi_app.include_router(router=router)
+fastapi_app.include_router(router=truncated_router)
+fastapi_app.include_router(router=timed_router)
 
 
 @pytest.fixture(scope='session', autouse=True)
@@ -0,0 +1,149 @@
+import json
+import logging
+from datetime import datetime
+
+import pytest
+from fastapi_stack_utils.audit_sink import SqliteAuditHandler, connect, query_audit_log
+from fastapi_stack_utils.cli.cli import cli
+from fastapi_stack_utils.logging_config import generate_base_logging_config
+from typer.testing import CliRunner
+
+
+def make_record(created, user, method, path, body=None):
+    record = logging.makeLogRecord(
+        {'msg': 'audit', 'user': user, 'method': method, 'path': path, 'query': None, 'str_body': body}
+    )
+    record.created = created
+    return record
+
+
+@pytest.fixture
+def audit_db(tmp_path):
+    path = str(tmp_path / 'audit.db')
+    handler = SqliteAuditHandler(path, batch_size=2)
+    handler.handle(make_record(datetime(2023, 1, 1, 12).timestamp(), 'jonas', 'POST', '/items', '{"a": 1}'))
+    handler.handle(make_record(datetime(2023, 1, 2, 12).timestamp(), 'jonas', 'DELETE', '/items/1'))
+    handler.handle(make_record(datetime(2023, 1, 3, 12).timestamp(), 'ola', 'POST', '/users'))
+    # Not an audit record
+    handler.handle(logging.makeLogRecord({'msg': 'Response body: {}'}))
+    # A warmup request
+    warmup_record = make_record(datetime(2023, 1, 4, 12).timestamp(), 'Unknown', 'GET', '/health')
+    warmup_record.warmup = True
+    handler.handle(warmup_record)
+    handler.close()
+    return path
+
+
+def test_query_filters(audit_db):
+    assert [row['path'] for row in query_audit_log(audit_db)] == ['/users', '/items/1', '/items']
+    assert [row['path'] for row in query_audit_log(audit_db, user='jonas')] == ['/items/1', '/items']
+    assert [row['path'] for row in query_audit_log(audit_db, method='post')] == ['/users', '/items']
+    assert [row['path'] for row in query_audit_log(audit_db, request_path='/items*')] == ['/items/1', '/items']
+    assert [row['path'] for row in query_audit_log(audit_db, request_path='/items')] == ['/items']
+    in_range = query_audit_log(audit_db, since=datetime(2023, 1, 2), until=datetime(2023, 1, 3))
+    assert [row['path'] for row in in_range] == ['/items/1']
+    assert [row['path'] for row in query_audit_log(audit_db, limit=1)] == ['/users']
+    assert query_audit_log(audit_db, user='jonas', method='POST')[0]['body'] == '{"a": 1}'
+
+
+def test_queries_use_indexes(audit_db):
+    connection = connect(audit_db)
+    for condition in ('user = ?', 'path = ?', 'method = ?', 'created >= ?'):
+        plan = connection.execute(f'EXPLAIN QUERY PLAN SELECT * FROM audit WHERE {condition}', ['x']).fetchall()
+        assert 'USING INDEX' in plan[0][-1]
+
+
+def test_wal_mode(audit_db):
+    assert connect(audit_db).execute('PRAGMA journal_mode').fetchone() == ('wal',)
+
+
+def test_drops_when_full(tmp_path, caplog):
+    handler = SqliteAuditHandler(str(tmp_path / 'audit.db'), maxsize=1)
+    handler.writer.start = lambda: None  # no writer, so the queue fills up
+    for index in range(3):
+        handler.handle(make_record(index, 'jonas', 'POST', '/items'))
+    assert handler.dropped == 2
+    handler.flush()
+    assert caplog.messages == ['Dropped 2 audit records, the audit sink was full']
+
+
+def test_database_not_opened(tmp_path, caplog):
+    handler = SqliteAuditHandler(str(tmp_path / 'missing' / 'audit.db'))
+    handler.handle(make_record(0, 'jonas', 'POST', '/items'))
+    writer = handler.writer.thread
+    writer.join()
+    for index in range(1, 3):
+        handler.handle(make_record(index, 'jonas', 'POST', '/items'))
+    # Not restarted for every record
+    assert handler.writer.thread is writer
+    assert handler.dropped == 3
+    handler.flush()
+    assert caplog.messages == [
+        f'Could not open the audit database {tmp_path / "missing" / "audit.db"}, audit records are dropped',
+        'Dropped 3 audit records, the database could not be opened',
+    ]
+
+    (tmp_path / 'missing').mkdir()
+    handler.start()
+    handler.handle(make_record(3, 'jonas', 'POST', '/items'))
+    handler.close()
+    assert len(query_audit_log(handler.path)) == 1
+
+
+async def test_audit_log_requests_stored(client, tmp_path):
+    handler = SqliteAuditHandler(str(tmp_path / 'audit.db'))
+    route_logger = logging.getLogger('fastapi_stack_utils.route')
+    route_logger.addHandler(handler)
+    try:
+        await client.post(
+            '/logged/hello?query_param=1',
+            content=json.dumps({'a': 'a', 'b': 'b', 'c': [], 'password': 'hunter2'}),
+            headers={'remote-user': 'jonas'},
+        )
+    finally:
+        route_logger.removeHandler(handler)
+        handler.close()
+
+    [row] = query_audit_log(handler.path)
+    assert dict(row) | {'created': None} == {
+        'created': None,
+        'user': 'jonas',
+        'method': 'POST',
+        'path': '/logged/hello',
+        'query': 'query_param=1',
+        'body': "{'a': 'a', 'b': 'b', 'c': [], 'password': '[REDACTED]'}",
+        'correlation_id': None,
+    }
+
+
+def test_cli(audit_db):
+    result = CliRunner().invoke(cli, ['audit', '--db', audit_db, '--user', 'jonas', '--method', 'POST'])
+    assert result.exit_code == 0
+    created = datetime(2023, 1, 1, 12).isoformat(sep=' ', timespec='milliseconds')
+    assert result.output == f'{created} [-] jonas > [POST] | /items | {{"a": 1}}\n'
+
+
+def test_cli_missing_database(tmp_path):
+    result = CliRunner().invoke(cli, ['audit', '--db', str(tmp_path / 'typo.db')])
+    assert result.exit_code == 1
+    assert f'No audit database at `{tmp_path / "typo.db"}`' in result.output
+    # Not created by the query
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_cli_not_an_audit_database(tmp_path):
+    path = tmp_path / 'other.db'
+    path.write_bytes(b'')
+    result = CliRunner().invoke(cli, ['audit', '--db', str(path)])
+    assert result.exit_code == 1
+    assert 'no such table: audit' in result.output
+
+
+def test_logging_config():
+    class Settings:
+        ENVIRONMENT = 'prod'
+
+    config = generate_base_logging_config(Settings(), audit_db='audit.db')
+    assert config['handlers']['audit']['path'] == 'audit.db'
+    assert config['loggers']['fastapi_stack_utils.route'] == {'handlers': ['audit']}
+    assert 'audit' not in generate_base_logging_config(Settings())['handlers']
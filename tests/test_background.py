@@ -0,0 +1,37 @@
+import threading
+from queue import Queue
+
+from fastapi_stack_utils.background import BackgroundThread
+
+
+def test_started_once_and_restarted_after_stop():
+    items: Queue[int | None] = Queue()
+    seen = []
+
+    def consume():
+        while (item := items.get()) is not None:
+            seen.append((item, threading.current_thread().name))
+
+    thread = BackgroundThread(consume, 'consumer')
+    assert not thread.running
+    thread.start()
+    first = thread.thread
+    thread.start()
+    assert thread.thread is first
+    items.put(1)
+    thread.stop(lambda: items.put(None))
+    assert not thread.running
+    assert seen == [(1, 'consumer')]
+
+    thread.start()
+    assert thread.running
+    assert thread.thread is not first
+    thread.stop(lambda: items.put(None))
+    assert not thread.running
+
+
+def test_stop_without_thread_does_not_signal():
+    signals = []
+    thread = BackgroundThread(lambda: None, 'idle')
+    thread.stop(lambda: signals.append(None))
+    assert signals == []
@@ -0,0 +1,49 @@
+from logging.config import dictConfig
+
+import pytest
+from benchmarks import redaction
+from benchmarks.asgi import Result, find_regressions, main
+from fastapi import FastAPI
+from fastapi_stack_utils.logging_config import generate_base_logging_config
+from pydantic import BaseSettings
+
+
+@pytest.fixture
+def _restore_logging():
+    build_middleware_stack = FastAPI.build_middleware_stack
+    yield
+
+    class Settings(BaseSettings):
+        ENVIRONMENT: str = 'dev'
+
+    dictConfig(generate_base_logging_config(settings=Settings()))
+    assert FastAPI.build_middleware_stack is build_middleware_stack
+
+
+@pytest.mark.usefixtures('_restore_logging')
+def test_asgi_benchmark_runs(tmp_path, capsys):
+    baseline = tmp_path / 'baseline.json'
+    assert main(['--requests', '5', '--warmup', '1', '--save-baseline', str(baseline)]) == 0
+    output = capsys.readouterr().out
+    for scenario in ['get', 'post_large_json', 'http_exception', 'unhandled_500']:
+        for mode in ['console', 'json']:
+            assert f'{scenario}[{mode}]' in output
+    assert baseline.exists()
+    # Everything is a regression when it has to be twice as fast as the baseline
+    assert main(['--requests', '5', '--warmup', '1', '--baseline', str(baseline), '--threshold', '-1']) == 1
+
+
+def test_find_regressions():
+    baseline = {'get[json]': {'requests_per_second': 1000, 'p50_ms': 1, 'p99_ms': 2, 'peak_kib_per_request': 1}}
+    ok = Result(requests_per_second=950, p50_ms=1, p99_ms=2.1, peak_kib_per_request=1)
+    slow = Result(requests_per_second=850, p50_ms=1, p99_ms=2.5, peak_kib_per_request=1)
+    assert find_regressions({'get[json]': ok, 'other[json]': slow}, baseline, threshold=0.1) == []
+    assert find_regressions({'get[json]': slow}, baseline, threshold=0.1) == [
+        'get[json]: 850 requests/s, baseline 1,000 requests/s',
+        'get[json]: p99 2.500ms, baseline 2.000ms',
+    ]
+
+
+def test_redaction_benchmark_runs(capsys):
+    assert redaction.main(['--size', '10000', '--repeat', '1', '--budget-ms', '100000']) == 0
+    assert 'json overhead' in capsys.readouterr().out
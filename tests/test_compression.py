@@ -0,0 +1,186 @@
+import asyncio
+import gzip
+import json
+import zlib
+
+import pytest
+from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
+from fastapi_stack_utils.compression import CompressionMiddleware, parse_accept_encoding
+from fastapi_stack_utils.exception_handler import format_and_log_exception_internal
+from fastapi_stack_utils.middleware import patch_fastapi_middlewares
+from httpx import ASGITransport, AsyncClient
+from starlette.middleware import Middleware
+
+ITEMS = [{'id': item, 'name': f'item {item}'} for item in range(200)]
+
+
+@pytest.fixture
+async def app_client(monkeypatch):
+    monkeypatch.setattr(FastAPI, 'build_middleware_stack', FastAPI.build_middleware_stack)
+    patch_fastapi_middlewares(middlewares=[Middleware(CompressionMiddleware, encodings=['gzip', 'deflate'])])
+    app = FastAPI()
+    app.add_exception_handler(Exception, format_and_log_exception_internal)
+
+    @app.get('/items')
+    async def items():
+        return ITEMS
+
+    @app.get('/small')
+    async def small():
+        return {'small': True}
+
+    @app.get('/stream')
+    async def stream():
+        async def chunks():
+            yield b'['
+            for index, item in enumerate(ITEMS):
+                yield (b',' if index else b'') + json.dumps(item).encode()
+            yield b']'
+
+        return StreamingResponse(chunks(), media_type='application/json')
+
+    @app.get('/image')
+    async def image():
+        return Response(b'\x89PNG' * 1000, media_type='image/png')
+
+    @app.get('/compressed')
+    async def compressed():
+        return Response(gzip.compress(b'a' * 1000), headers={'Content-Encoding': 'gzip'})
+
+    @app.get('/error')
+    async def error():
+        raise ValueError('x' * 1000)
+
+    @app.get('/small-error')
+    async def small_error():
+        raise ValueError('Not ready')
+
+    async with AsyncClient(transport=ASGITransport(app, raise_app_exceptions=False), base_url='http://test') as client:
+        yield client
+
+
+def get_raw(client, path, accept_encoding):
+    """
+    Get the response without httpx decoding it
+    """
+    return client.send(client.build_request('GET', path, headers={'Accept-Encoding': accept_encoding}), stream=True)
+
+
+async def read_raw(response):
+    return b''.join([chunk async for chunk in response.aiter_raw()])
+
+
+@pytest.mark.parametrize(
+    'accept_encoding,encoding,decompress',
+    [
+        ('gzip', 'gzip', gzip.decompress),
+        ('deflate', 'deflate', zlib.decompress),
+        ('deflate;q=0.5, gzip;q=0.8', 'gzip', gzip.decompress),
+        ('gzip;q=0.5, deflate', 'deflate', zlib.decompress),
+        ('*', 'gzip', gzip.decompress),
+    ],
+)
+async def test_negotiated_encoding(app_client, accept_encoding, encoding, decompress):
+    response = await get_raw(app_client, '/items', accept_encoding)
+    body = await read_raw(response)
+    assert response.headers['content-encoding'] == encoding
+    assert response.headers['vary'] == 'Accept-Encoding'
+    assert int(response.headers['content-length']) == len(body)
+    assert json.loads(decompress(body)) == ITEMS
+
+
+@pytest.mark.parametrize('accept_encoding', ['identity', 'gzip;q=0, deflate;q=0', 'br'])
+async def test_not_accepted(app_client, accept_encoding):
+    response = await get_raw(app_client, '/items', accept_encoding)
+    assert 'content-encoding' not in response.headers
+    assert json.loads(await response.aread()) == ITEMS
+
+
+async def test_streamed_chunk_by_chunk(app_client):
+    response = await get_raw(app_client, '/stream', 'gzip')
+    assert response.headers['content-encoding'] == 'gzip'
+    assert 'content-length' not in response.headers
+    assert json.loads(gzip.decompress(await read_raw(response))) == ITEMS
+
+
+async def test_chunks_not_buffered():
+    chunks = [json.dumps(item).encode() + b'\n' for item in ITEMS[:5]]
+    app = CompressionMiddleware(StreamingResponse(iter(chunks), media_type='application/x-ndjson'), minimum_size=0)
+    messages = []
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': '/', 'headers': [(b'accept-encoding', b'gzip')]}
+    await app(scope, receive, send)
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    # Every chunk is sent as soon as the app sends it, and can be decompressed right away
+    for chunk, message in zip(chunks, messages[1:]):
+        assert decompressor.decompress(message['body']) == chunk
+    assert decompressor.decompress(messages[-1]['body']) == b''
+    assert decompressor.eof
+
+
+async def test_etag_weakened():
+    async def etag_app(scope, receive, send):
+        await Response(b'a' * 1000, headers={'ETag': '"abc"'})(scope, receive, send)
+
+    app = CompressionMiddleware(etag_app)
+    async with AsyncClient(app=app, base_url='http://test') as client:
+        response = await client.get('/', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['etag'] == 'W/"abc"'
+        response = await client.get('/', headers={'Accept-Encoding': 'identity'})
+        assert response.headers['etag'] == '"abc"'
+
+
+@pytest.mark.parametrize('path', ['/small', '/image'])
+async def test_skipped(app_client, path):
+    response = await app_client.get(path, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert 'content-encoding' not in response.headers
+
+
+async def test_already_compressed(app_client):
+    response = await get_raw(app_client, '/compressed', 'deflate')
+    assert response.headers['content-encoding'] == 'gzip'
+    assert gzip.decompress(await read_raw(response)) == b'a' * 1000
+
+
+async def test_server_error_compressed(app_client):
+    response = await get_raw(app_client, '/error', 'gzip')
+    assert response.status_code == 500
+    assert response.headers['content-encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(await read_raw(response))) == {
+        'detail': [{'description': 'Internal Server Error', 'error': 'x' * 1000}]
+    }
+
+
+async def test_small_server_error_not_compressed(app_client):
+    response = await get_raw(app_client, '/small-error', 'gzip')
+    assert response.status_code == 500
+    assert 'content-encoding' not in response.headers
+    assert json.loads(await read_raw(response)) == {
+        'detail': [{'description': 'Internal Server Error', 'error': 'Not ready'}]
+    }
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding('gzip, deflate;q=0.5, br;q=invalid, *;q=0') == {
+        'gzip': 1.0,
+        'deflate': 0.5,
+        'br': 0.0,
+        '*': 0.0,
+    }
+
+
+async def test_brotli():
+    brotli = pytest.importorskip('brotli')
+    app = CompressionMiddleware(Response(b'a' * 1000), encodings=['br', 'gzip'])
+    async with AsyncClient(app=app, base_url='http://test') as client:
+        response = await get_raw(client, '/', 'gzip, br')
+        assert response.headers['content-encoding'] == 'br'
+        assert brotli.decompress(await read_raw(response)) == b'a' * 1000
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi_stack_utils.concurrency import AdaptiveLimit, ConcurrencyLimitMiddleware
+from fastapi_stack_utils.metrics import MetricsRegistry
+from fastapi_stack_utils.middleware import patch_fastapi_middlewares
+from fastapi_stack_utils.schemas.http_exceptions import ErrorResponse
+from httpx import AsyncClient
+from starlette.middleware import Middleware
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry()
+
+
+@pytest.fixture
+def release():
+    return asyncio.Event()
+
+
+@pytest.fixture
+async def app_client(monkeypatch, registry, release):
+    monkeypatch.setattr(FastAPI, 'build_middleware_stack', FastAPI.build_middleware_stack)
+    limit = AdaptiveLimit(initial_limit=2, min_limit=1, window_size=5)
+    patch_fastapi_middlewares(
+        middlewares=[
+            Middleware(ConcurrencyLimitMiddleware, limit=limit, exempt_paths=['/health'], registry=registry),
+        ]
+    )
+    app = FastAPI()
+
+    @app.get('/slow')
+    async def slow():
+        await release.wait()
+        return {}
+
+    @app.get('/health')
+    async def health():
+        return {}
+
+    async with AsyncClient(app=app, base_url='http://test') as client:
+        yield client
+
+
+async def test_excess_requests_rejected(app_client, registry, release):
+    in_flight = [asyncio.create_task(app_client.get('/slow')) for _ in range(2)]
+    await asyncio.sleep(0.01)
+
+    response = await app_client.get('/slow')
+    assert response.status_code == 503
+    assert response.headers['retry-after'] == '1'
+    assert ErrorResponse(**response.json()).detail[0].description == 'Service Unavailable'
+    # Health probes are never rejected
+    assert (await app_client.get('/health')).status_code == 200
+    assert 'concurrency_in_flight 2' in registry.render()
+
+    release.set()
+    assert [(await task).status_code for task in in_flight] == [200, 200]
+    assert (await app_client.get('/slow')).status_code == 200
+    metrics = registry.render()
+    assert '# TYPE concurrency_rejected_total counter\nconcurrency_rejected_total 1' in metrics
+    assert 'concurrency_limit 2' in metrics
+    assert 'concurrency_in_flight 0' in metrics
+
+
+def test_limit_decreases_when_latency_increases():
+    limit = AdaptiveLimit(initial_limit=100, window_size=10)
+    for _ in range(10):
+        limit.observe(0.01, in_flight=5)
+    assert limit.limit == 100
+    for _ in range(10):
+        limit.observe(0.05, in_flight=5)
+    assert limit.limit == 90
+    for _ in range(10):
+        limit.observe(0.05, in_flight=5)
+    assert limit.limit == 81
+
+
+def test_limit_increases_when_saturated():
+    limit = AdaptiveLimit(initial_limit=10, max_limit=11, window_size=10)
+    for _ in range(10):
+        limit.observe(0.01, in_flight=5)
+    # Not saturated
+    assert limit.limit == 10
+    for _ in range(2):
+        for _ in range(10):
+            limit.observe(0.01, in_flight=10)
+    assert limit.limit == 11
+
+
+def test_limit_bounded():
+    limit = AdaptiveLimit(initial_limit=10, min_limit=9, window_size=1, tolerance=1.5)
+    limit.observe(0.01, in_flight=1)
+    for _ in range(5):
+        limit.observe(1.0, in_flight=1)
+    assert limit.limit == 9
+
+
+def test_metrics_prefix(registry):
+    async def app(scope, receive, send):
+        pass
+
+    ConcurrencyLimitMiddleware(app, registry=registry)
+    ConcurrencyLimitMiddleware(app, registry=registry, metrics_prefix='admin_concurrency')
+    metrics = registry.render()
+    assert 'concurrency_limit 100' in metrics
+    assert 'admin_concurrency_limit 100' in metrics
+    assert 'admin_concurrency_rejected_total 0' in metrics
@@ -0,0 +1,64 @@
+import sys
+import types
+
+import pytest
+from fastapi_stack_utils import custom_base_settings
+from fastapi_stack_utils.custom_base_settings import CustomBaseSettings, get_env
+
+
+@pytest.fixture(autouse=True)
+def environment(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    get_env.cache_clear()
+    yield
+    get_env.cache_clear()
+
+
+def test_env_is_read_on_first_access(monkeypatch):
+    monkeypatch.setenv('ENVIRONMENT', 'qa')
+    assert custom_base_settings.env.ENVIRONMENT == 'qa'
+    # Cached after the first access
+    monkeypatch.setenv('ENVIRONMENT', 'prod')
+    assert custom_base_settings.env.ENVIRONMENT == 'qa'
+
+
+def test_environment_default(monkeypatch):
+    monkeypatch.setenv('ENVIRONMENT', 'prod')
+
+    class Settings(CustomBaseSettings):
+        NAME: str = 'name'
+
+    assert Settings().ENVIRONMENT == 'prod'
+
+
+def test_test_environment_reads_dotenv(monkeypatch, tmp_path):
+    pytest.importorskip('dotenv')
+    monkeypatch.setenv('ENVIRONMENT', 'test')
+    (tmp_path / '.env').write_text('NAME=from-dotenv\n')
+
+    class Settings(CustomBaseSettings):
+        NAME: str = 'name'
+
+    assert Settings().NAME == 'from-dotenv'
+
+
+def test_azure_credentials_kept_untouched(monkeypatch):
+    # Stand-in for `azure.identity`, which is an optional dependency
+    identity = types.ModuleType('azure.identity')
+    identity.ClientSecretCredential = type('ClientSecretCredential', (), {'__init__': lambda self, **kwargs: None})
+    monkeypatch.setitem(sys.modules, 'azure.identity', identity)
+    monkeypatch.setenv('ENVIRONMENT', 'prod')
+
+    class Settings(CustomBaseSettings):
+        credential = identity.ClientSecretCredential(tenant_id='tenant', client_id='client', client_secret='secret')
+
+    assert 'credential' not in Settings.__fields__
+
+
+def test_other_class_attributes_are_fields(monkeypatch):
+    monkeypatch.setenv('ENVIRONMENT', 'prod')
+
+    class Settings(CustomBaseSettings):
+        NAME = 'name'
+
+    assert 'NAME' in Settings.__fields__
@@ -0,0 +1,102 @@
+import json
+import logging
+import threading
+from contextvars import ContextVar
+
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi_stack_utils.route import AuditLog, AuditLogBacklog
+from httpx import AsyncClient
+
+request_id: ContextVar[str | None] = ContextVar('request_id', default=None)
+
+
+class DeferredAuditLog(AuditLog):
+    deferred = True
+    timing = True
+    backlog = AuditLogBacklog()
+
+
+router = APIRouter(route_class=DeferredAuditLog)
+
+
+@router.post('/deferred')
+async def deferred(body: dict):
+    return {'password': body['password'], 'thread': threading.current_thread().name}
+
+
+app = FastAPI()
+app.include_router(router)
+
+
+@pytest.fixture
+def request_id_filter():
+    def add_request_id(record):
+        record.request_id = request_id.get()
+        return True
+
+    route_logger = logging.getLogger('fastapi_stack_utils.route')
+    route_logger.addFilter(add_request_id)
+    yield
+    route_logger.removeFilter(add_request_id)
+
+
+async def test_logged_after_response_in_backlog_thread(caplog, request_id_filter):
+    request_id.set('abc')
+    async with AsyncClient(app=app, base_url='http://test') as client:
+        response = await client.post('/deferred', content=json.dumps({'password': 'hunter2'}))
+    DeferredAuditLog.backlog.stop()
+
+    assert response.json() == {'password': 'hunter2', 'thread': 'MainThread'}
+    records = [record for record in caplog.records if record.name == 'fastapi_stack_utils.route']
+    assert [record.getMessage().split(':')[0] for record in records] == [
+        "Unknown > [POST] | /deferred | {'password'",
+        'Timings',
+        'Response body',
+        'Response headers',
+    ]
+    assert records[0].getMessage().endswith("{'password': '[REDACTED]'}")
+    assert records[2].getMessage() == 'Response body: {"password":"[REDACTED]","thread":"MainThread"}'
+    assert {record.threadName for record in records} == {'audit-log-backlog'}
+    # Logged with the context of the request
+    assert {record.request_id for record in records} == {'abc'}
+    assert records[1].timings['decode'] == 0
+
+
+def test_backlog_drops_when_full(caplog):
+    backlog = AuditLogBacklog(maxsize=1)
+    release = threading.Event()
+    started = threading.Event()
+    calls = []
+
+    def blocking_call():
+        started.set()
+        release.wait()
+
+    backlog.submit(blocking_call)
+    started.wait()
+    for index in range(3):
+        backlog.submit(lambda index=index: calls.append(index))
+    assert backlog.dropped == 2
+
+    release.set()
+    backlog.stop()
+    assert calls == [0]
+    assert backlog.dropped == 0
+    assert caplog.messages == ['Dropped 2 audit log records, the backlog was full']
+
+
+def test_backlog_survives_failing_calls(caplog):
+    backlog = AuditLogBacklog()
+    calls = []
+    backlog.submit(lambda: 1 / 0)
+    backlog.submit(lambda: calls.append('called'))
+    backlog.stop()
+    assert calls == ['called']
+    assert caplog.messages == ['Deferred audit logging failed']
+    assert not backlog.running
+
+    # Restarted by the next call
+    backlog.submit(lambda: calls.append('restarted'))
+    backlog.stop()
+    assert calls == ['called', 'restarted']
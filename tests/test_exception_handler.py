@@ -5,10 +5,13 @@ import pytest
 from dirty_equals import IsStr
 from fastapi import HTTPException, Request
 from fastapi_stack_utils.exception_handler import (
+    PUBLIC_SERVER_ERROR_BODY,
     format_and_log_exception_internal,
     format_and_log_exception_public,
+    generate_json_response,
     http_exception_handler,
 )
+from fastapi_stack_utils.schemas.http_exceptions import ErrorResponse, ServerError
 
 
 @pytest.mark.parametrize(
@@ -109,3 +112,28 @@ async def test_unhandled_exception_public():
     assert json.loads(response.body) == {
         'detail': [{'description': 'Internal Server Error', 'error': 'Internal Server Error'}]
     }
+
+
+@pytest.mark.parametrize(
+    'detail',
+    ['Some error', ['æøå', '"quoted"', '\\n\u2028\x00'], [1, None, {'a': [1.5]}], ('tuple', 'detail')],
+)
+async def test_http_exception_handler_identical_to_pydantic(detail):
+    response = await http_exception_handler(request=Request(scope={'type': 'http'}), exc=HTTPException(400, detail))
+    elements = detail if isinstance(detail, (list, tuple)) else [detail]
+    expected = generate_json_response(
+        ErrorResponse(detail=[ServerError(description=str(element), error=str(element)) for element in elements]),
+        status_code=400,
+    )
+    assert response.body == expected.body
+    assert response.status_code == 400
+
+
+async def test_unhandled_exception_public_pre_rendered():
+    expected = generate_json_response(
+        ErrorResponse(detail=[ServerError(description='Internal Server Error', error='Internal Server Error')]),
+        status_code=500,
+    )
+    assert PUBLIC_SERVER_ERROR_BODY == expected.body
+    response = await format_and_log_exception_public(request=Request(scope={'type': 'http'}), exc=ValueError('x'))
+    assert response.body == expected.body
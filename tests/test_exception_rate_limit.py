@@ -0,0 +1,163 @@
+import logging
+import subprocess
+import sys
+import time
+from threading import Thread
+
+import pytest
+from fastapi_stack_utils import logging_config
+from fastapi_stack_utils.logging_config import ExceptionRateLimit, generate_base_logging_config
+from pydantic import BaseSettings
+
+
+def _raise_value_error():
+    raise ValueError('Some value error')
+
+
+def _raise_key_error():
+    raise KeyError('Some key error')
+
+
+def _record(raiser=_raise_value_error) -> logging.LogRecord:
+    try:
+        raiser()
+    except Exception:
+        exc_info = sys.exc_info()
+    return logging.makeLogRecord({'msg': 'Unhandled exception', 'levelno': logging.ERROR, 'exc_info': exc_info})
+
+
+@pytest.fixture(autouse=True)
+def flush_rate_limits():
+    yield
+    # Log the pending summaries while the test's log capture is still open, not on exit
+    logging_config._flush_rate_limits()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(logging_config, 'monotonic', lambda: now[0])
+    return now
+
+
+def _summaries(caplog):
+    return [record for record in caplog.records if record.name == 'fastapi_stack_utils.logging_config']
+
+
+def test_records_without_exceptions_pass():
+    rate_limit = ExceptionRateLimit(limit=0)
+    assert rate_limit.filter(logging.makeLogRecord({'msg': 'hello'}))
+
+
+def test_limit_per_fingerprint(clock, caplog):
+    rate_limit = ExceptionRateLimit(limit=2, window=60)
+    assert [rate_limit.filter(_record()) for _ in range(5)] == [True, True, False, False, False]
+    # A different exception has its own budget
+    assert rate_limit.filter(_record(_raise_key_error))
+    assert _summaries(caplog) == []
+
+    clock[0] += 60
+    assert rate_limit.filter(_record())
+    [summary] = _summaries(caplog)
+    assert summary.levelno == logging.WARNING
+    assert summary.suppressed == 3
+    assert summary.exception_type == 'ValueError'
+    assert summary.getMessage().startswith('Suppressed 3 log records of ValueError raised at ')
+    assert summary.getMessage().endswith('in the last 60 seconds')
+
+
+def test_no_summary_without_suppressed_records(clock, caplog):
+    rate_limit = ExceptionRateLimit(limit=2, window=60)
+    assert rate_limit.filter(_record())
+    clock[0] += 61
+    assert rate_limit.filter(_record())
+    assert _summaries(caplog) == []
+
+
+def test_least_recently_seen_fingerprint_evicted(clock, caplog):
+    rate_limit = ExceptionRateLimit(limit=1, max_fingerprints=1)
+    assert rate_limit.filter(_record())
+    assert not rate_limit.filter(_record())
+    assert rate_limit.filter(_record(_raise_key_error))
+    assert len(rate_limit.fingerprints) == 1
+    [summary] = _summaries(caplog)
+    assert summary.suppressed == 1
+    assert summary.exception_type == 'ValueError'
+
+
+def test_flush(clock, caplog):
+    rate_limit = ExceptionRateLimit(limit=1)
+    for _ in range(3):
+        rate_limit.filter(_record())
+    rate_limit.flush()
+    [summary] = _summaries(caplog)
+    assert summary.suppressed == 2
+    assert rate_limit.fingerprints == {}
+
+
+def test_summary_logged_when_window_expires(clock, caplog):
+    rate_limit = ExceptionRateLimit(limit=1, window=60)
+    for _ in range(3):
+        rate_limit.filter(_record())
+    assert rate_limit.timer is not None
+    clock[0] += 30
+    # The timer fired early, the window is rescheduled
+    rate_limit.summarize_expired()
+    assert _summaries(caplog) == []
+    assert rate_limit.timer is not None
+    clock[0] += 30
+    rate_limit.summarize_expired()
+    [summary] = _summaries(caplog)
+    assert summary.suppressed == 2
+    assert rate_limit.fingerprints == {}
+    assert rate_limit.timer is None
+
+
+def test_summary_logged_without_further_records(caplog):
+    rate_limit = ExceptionRateLimit(limit=1, window=0.1)
+    for _ in range(3):
+        rate_limit.filter(_record())
+    time.sleep(0.3)
+    [summary] = _summaries(caplog)
+    assert summary.suppressed == 2
+
+
+def test_summary_logged_on_exit():
+    script = (
+        'import logging, sys; from fastapi_stack_utils.logging_config import ExceptionRateLimit; '
+        'logging.basicConfig(); rate_limit = ExceptionRateLimit(limit=1)\n'
+        'for _ in range(3):\n'
+        '    try:\n'
+        '        1 / 0\n'
+        '    except ZeroDivisionError:\n'
+        '        rate_limit.filter(logging.makeLogRecord({"exc_info": sys.exc_info()}))\n'
+    )
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+    assert 'Suppressed 2 log records of ZeroDivisionError' in result.stderr
+
+
+def test_thread_safe():
+    rate_limit = ExceptionRateLimit(limit=100, window=3600)
+    record = _record()
+    results = []
+
+    def log_many():
+        results.extend(rate_limit.filter(record) for _ in range(1000))
+
+    threads = [Thread(target=log_many) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(True) == 100
+    [state] = rate_limit.fingerprints.values()
+    assert state.suppressed == 7900
+
+
+def test_opt_in_config():
+    class Settings(BaseSettings):
+        ENVIRONMENT: str = 'prod'
+
+    assert 'exception_rate_limit' not in generate_base_logging_config(Settings())['handlers']['json']['filters']
+    config = generate_base_logging_config(Settings(), rate_limit_exceptions=True)
+    assert config['handlers']['json']['filters'] == ['exception_rate_limit', 'correlation_id', 'nanostamp']
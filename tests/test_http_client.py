@@ -0,0 +1,96 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+from asgi_correlation_id import CorrelationIdMiddleware
+from fastapi import Depends, FastAPI, Request
+from fastapi_stack_utils.http_client import HttpClient, add_http_client, get_http_client
+
+stub_service = FastAPI()
+
+
+@stub_service.get('/echo')
+async def echo(request: Request):
+    return {'correlation_id': request.headers.get('x-request-id'), 'query': str(request.query_params)}
+
+
+@pytest.fixture
+async def app_client():
+    app = FastAPI()
+    add_http_client(app, base_url='http://stub', transport=httpx.ASGITransport(stub_service))
+    app.add_middleware(CorrelationIdMiddleware)
+
+    @app.get('/proxy')
+    async def proxy(client: httpx.AsyncClient = Depends(get_http_client)):
+        return (await client.get('/echo', params={'token': 'secret'})).json()
+
+    await app.router.startup()
+    async with httpx.AsyncClient(app=app, base_url='http://test') as client:
+        yield client
+    await app.router.shutdown()
+    assert app.state.http_client._client is None
+
+
+async def test_correlation_id_forwarded(app_client, caplog):
+    response = await app_client.get('/proxy', headers={'X-Request-ID': 'a' * 32})
+    assert response.json() == {'correlation_id': 'a' * 32, 'query': 'token=secret'}
+    [record] = [record for record in caplog.records if record.name == 'fastapi_stack_utils.http_client']
+    # The query is not logged, it may contain secrets
+    assert record.getMessage().startswith('GET http://stub/echo 200 in ')
+    assert record.outbound_status == 200
+    assert record.outbound_duration > 0
+
+
+async def test_without_correlation_id():
+    http_client = HttpClient(base_url='http://stub', transport=httpx.ASGITransport(stub_service))
+    with pytest.raises(RuntimeError):
+        http_client.client
+    await http_client.start()
+    response = await http_client.client.get('/echo')
+    assert response.json()['correlation_id'] is None
+    await http_client.stop()
+
+
+async def test_failure_logged(caplog):
+    http_client = HttpClient(base_url='http://127.0.0.1:1', timeout=1)
+    await http_client.start()
+    with pytest.raises(httpx.ConnectError):
+        await http_client.client.get('/items?token=secret')
+    await http_client.stop()
+    assert caplog.records[-1].getMessage().startswith('GET http://127.0.0.1:1/items failed after ')
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = json.dumps({'port': self.client_address[1]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+async def test_connections_reused(stub_server):
+    http_client = HttpClient(base_url=stub_server, max_connections=1)
+    await http_client.start()
+    ports = {(await http_client.client.get('/')).json()['port'] for _ in range(5)}
+    await http_client.stop()
+    # All requests were sent over the same connection
+    assert len(ports) == 1
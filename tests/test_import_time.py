@@ -0,0 +1,49 @@
+import subprocess
+import sys
+
+import pytest
+
+# Cumulative import time budgets in microseconds, generous enough for slow CI machines
+IMPORT_BUDGETS = {
+    'fastapi_stack_utils': 20_000,
+    'fastapi_stack_utils.custom_base_settings': 400_000,
+}
+# Modules which are only needed once a feature is used
+LAZY_MODULES = ('azure', 'cryptography', 'hvac', 'pydantic_vault', 'fastapi_stack_utils.vault_cache')
+
+
+def import_times(module: str) -> dict[str, int]:
+    """
+    Import the module in a fresh interpreter, returning the cumulative import time per imported module
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.removeprefix('import time:').split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize('module', IMPORT_BUDGETS)
+def test_import_time_budget(module):
+    times = import_times(module)
+    assert times[module] < IMPORT_BUDGETS[module]
+    assert not [name for name in times if name.split('.')[0] in LAZY_MODULES or name in LAZY_MODULES]
+
+
+def test_package_import_does_not_import_pydantic():
+    assert 'pydantic' not in import_times('fastapi_stack_utils')
+
+
+def test_lazy_reexports():
+    import fastapi_stack_utils
+    from fastapi_stack_utils.schemas.http_exceptions import ErrorResponse
+
+    assert fastapi_stack_utils.ErrorResponse is ErrorResponse
+    assert 'ServerError' in dir(fastapi_stack_utils)
+    with pytest.raises(AttributeError):
+        fastapi_stack_utils.Missing
@@ -0,0 +1,73 @@
+import json
+import logging
+import sys
+from datetime import datetime
+
+import pytest
+from fastapi_stack_utils import logging_config
+from fastapi_stack_utils.logging_config import JsonFormatter
+from pythonjsonlogger.jsonlogger import JsonFormatter as PythonJsonLoggerFormatter
+
+PYTHON_JSON_LOGGER_FORMAT = ' '.join(f'%({field})s' for field in logging_config.JSON_LOG_FIELDS)
+
+
+def _record(**kwargs) -> logging.LogRecord:
+    record = logging.LogRecord(
+        name='fastapi_stack_utils',
+        level=logging.INFO,
+        pathname=__file__,
+        lineno=10,
+        msg='%s > [%s] | %s',
+        args=('Jonas', 'POST', '/logged'),
+        exc_info=kwargs.pop('exc_info', None),
+    )
+    record.correlation_id = 'abc'
+    record.nanostamp = '2023-01-31T12:00:00.123456789'
+    record.__dict__.update(kwargs)
+    return record
+
+
+def _exc_info():
+    try:
+        raise ValueError('Some value error')
+    except ValueError:
+        return sys.exc_info()
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def formatter(request, monkeypatch):
+    if request.param == 'json':
+        monkeypatch.setattr(logging_config, 'orjson', None)
+    return JsonFormatter(datefmt='%Y-%m-%d %H:%M:%S')
+
+
+@pytest.mark.parametrize(
+    'record',
+    [
+        pytest.param(lambda: _record(), id='plain'),
+        pytest.param(lambda: _record(user='Jonas', method='POST', query=None, str_body="{'a': 1}"), id='extra'),
+        pytest.param(lambda: _record(exc_info=_exc_info()), id='exception'),
+        pytest.param(lambda: _record(when=datetime(2023, 1, 31, 12), obj=object(), _private=1), id='unsupported'),
+        pytest.param(lambda: _record(huge=2**70, mapping={1: 'a'}), id='not-orjson-compatible'),
+    ],
+)
+def test_same_output_as_python_json_logger(formatter, record):
+    reference = PythonJsonLoggerFormatter(PYTHON_JSON_LOGGER_FORMAT, datefmt='%Y-%m-%d %H:%M:%S')
+    log_record = record()
+    assert json.loads(formatter.format(log_record)) == json.loads(reference.format(log_record))
+
+
+def test_keys_in_order(formatter):
+    output = json.loads(formatter.format(_record(exc_info=_exc_info(), user='Jonas')))
+    assert list(output) == [*logging_config.JSON_LOG_FIELDS, 'user']
+    assert output['nanostamp'] == '2023-01-31T12:00:00.123456789'
+    assert output['exc_info'].endswith('ValueError: Some value error')
+
+
+def test_exception_formatted_once(formatter, monkeypatch):
+    calls = []
+    monkeypatch.setattr(formatter, 'formatException', lambda exc_info: calls.append(exc_info) or 'traceback')
+    record = _record(exc_info=_exc_info())
+    formatter.format(record)
+    formatter.format(record)
+    assert len(calls) == 1
@@ -0,0 +1,197 @@
+import json
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from fastapi_stack_utils.cli.cli import cli
+from fastapi_stack_utils.cli.load_docker_env import (
+    fetch_secrets,
+    format_env_value,
+    get_vault_client,
+    load_docker_env,
+    project_name_from_git,
+)
+from typer.testing import CliRunner
+
+SECRETS = {
+    'kv-nsa/data/project/dev': {
+        'POSTGRES_PASSWORD': 'pass: word',
+        'REDIS_PASSWORD': 'hunter2',
+        'OTHER_SECRET': 'not written',
+    },
+    'kv-nsa/data/project/test': {'POSTGRES_PASSWORD': 'test-password', 'POSTGRES_USER': 'test'},
+    'kv-nsa/data/shared/dev': {'SENTRY_DSN': 'https://abc@sentry/1'},
+}
+
+
+class FakeVault(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    requests: list[tuple[str, int]] = []
+    # Secret reads wait, so they only finish quickly when they are sent concurrently
+    delay = 0.2
+
+    def do_GET(self):
+        if self.headers.get('X-Vault-Token') != 'token':
+            return self.respond(403, {'errors': ['permission denied']})
+        if self.path == '/v1/auth/token/lookup-self':
+            return self.respond(200, {'data': {'id': 'token'}})
+        FakeVault.requests.append((self.path, self.client_address[1]))
+        if self.path.endswith('/forbidden'):
+            return self.respond(403, {'errors': ['1 error occurred:\n\t* permission denied\n\n']})
+        time.sleep(self.delay)
+        secret = SECRETS.get(self.path.removeprefix('/v1/'))
+        if secret is None:
+            return self.respond(404, {'errors': []})
+        self.respond(200, {'data': {'data': secret, 'metadata': {'version': 1}}})
+
+    def respond(self, status, content):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def vault_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeVault)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def git(*args, cwd):
+    subprocess.run(['git', *args], cwd=cwd, check=True, capture_output=True)
+
+
+@pytest.fixture
+def project_dir(tmp_path, monkeypatch, vault_url):
+    git('init', cwd=tmp_path)
+    git('remote', 'add', 'origin', 'git@gitlab.com:group/project-backend.git', cwd=tmp_path)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('VAULT_TOKEN', 'token')
+    monkeypatch.setenv('VAULT_ADDR', vault_url)
+    monkeypatch.delenv('ENVIRONMENT', raising=False)
+    FakeVault.requests.clear()
+    return tmp_path
+
+
+def test_load_env(project_dir):
+    result = CliRunner().invoke(cli, ['load-env'])
+    assert result.exit_code == 0, result.output
+    assert result.output == 'Wrote 2 variables to .env\n'
+    assert (project_dir / '.env').read_text() == "POSTGRES_PASSWORD='pass: word'\nREDIS_PASSWORD=hunter2\n"
+    assert (project_dir / '.env').stat().st_mode & 0o077 == 0
+    # Only the `.env` file is left
+    assert sorted(path.name for path in project_dir.iterdir()) == ['.env', '.git']
+
+
+def test_environments_and_paths_fetched_concurrently(project_dir):
+    start = time.perf_counter()
+    secrets = load_docker_env(
+        environments=['dev', 'test'], paths=['kv-nsa/data/shared/dev'], keys=['POSTGRES_*', 'SENTRY_DSN']
+    )
+    assert time.perf_counter() - start < 3 * FakeVault.delay
+    # Merged in order, later environments win
+    assert secrets == {
+        'POSTGRES_PASSWORD': 'test-password',
+        'POSTGRES_USER': 'test',
+        'SENTRY_DSN': 'https://abc@sentry/1',
+    }
+    assert sorted(path for path, _ in FakeVault.requests) == [
+        '/v1/kv-nsa/data/project/dev',
+        '/v1/kv-nsa/data/project/test',
+        '/v1/kv-nsa/data/shared/dev',
+    ]
+
+
+def test_connection_reused(project_dir, vault_url):
+    client = get_vault_client(vault_url)
+    paths = ['kv-nsa/data/project/dev', 'kv-nsa/data/project/test', 'kv-nsa/data/shared/dev']
+    assert list(fetch_secrets(client, paths, max_workers=1)) == paths
+    # All reads were sent over the same connection
+    assert len({port for _, port in FakeVault.requests}) == 1
+
+
+def test_missing_path(project_dir):
+    (project_dir / '.env').write_text('KEEP=1\n')
+    result = CliRunner().invoke(cli, ['load-env', '--environment', 'prod'])
+    assert result.exit_code == 1
+    assert 'Vault has no secrets at `kv-nsa/data/project/prod`' in result.output
+    # The old file is kept
+    assert (project_dir / '.env').read_text() == 'KEEP=1\n'
+
+
+def test_vault_errors(project_dir, unused_tcp_port, monkeypatch):
+    result = CliRunner().invoke(cli, ['load-env', '--environment', 'forbidden'])
+    assert result.exit_code == 1
+    [line] = result.output.splitlines()
+    assert line.startswith('Could not read the secrets from Vault: 1 error occurred: * permission denied')
+    assert isinstance(result.exception, SystemExit)
+
+    monkeypatch.setenv('VAULT_ADDR', f'http://127.0.0.1:{unused_tcp_port}')
+    result = CliRunner().invoke(cli, ['load-env'])
+    assert result.exit_code == 1
+    assert result.output.startswith('Could not read the secrets from Vault: ')
+    assert isinstance(result.exception, SystemExit)
+
+
+@pytest.mark.parametrize(
+    'url',
+    [
+        'git@gitlab.com:group/project-backend.git',
+        'https://gitlab.com/group/sub/project-build.git',
+        'git@github.com:project.git',
+    ],
+)
+def test_project_name_from_git(tmp_path, url):
+    git('init', cwd=tmp_path)
+    git('remote', 'add', 'upstream', 'git@gitlab.com:group/other.git', cwd=tmp_path)
+    git('remote', 'add', 'origin', url, cwd=tmp_path)
+    assert project_name_from_git(tmp_path) == 'project'
+
+
+def test_project_name_from_git_duplicate_keys(project_dir):
+    git(
+        'config',
+        '--add',
+        'remote.origin.fetch',
+        '+refs/merge-requests/*/head:refs/remotes/origin/mr/*',
+        cwd=project_dir,
+    )
+    assert project_name_from_git() == 'project'
+
+
+def test_project_name_from_git_subdirectory(project_dir, monkeypatch):
+    (project_dir / 'app' / 'api').mkdir(parents=True)
+    monkeypatch.chdir(project_dir / 'app' / 'api')
+    assert project_name_from_git() == 'project'
+
+
+def test_project_name_without_remote(tmp_path):
+    git('init', cwd=tmp_path)
+    with pytest.raises(ValueError, match='No git remote found'):
+        project_name_from_git(tmp_path)
+
+
+@pytest.mark.parametrize(
+    'value,expected',
+    [
+        ('hunter2', 'hunter2'),
+        ('with space', "'with space'"),
+        ("it's $HOME", '"it\'s $$HOME"'),
+        ('multi\nline', '"multi\\nline"'),
+        ({'a': 1}, '\'{"a": 1}\''),
+        (5432, '5432'),
+    ],
+)
+def test_format_env_value(value, expected):
+    assert format_env_value(value) == expected
@@ -0,0 +1,130 @@
+import io
+import logging
+import multiprocessing
+import os
+import threading
+
+import pytest
+from fastapi_stack_utils.log_aggregation import LogWriter, LogWriterServer, SocketLineHandler
+from fastapi_stack_utils.logging_config import generate_base_logging_config
+
+
+def make_logger(name, handler):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.handlers = [handler]
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def log_lines(path, worker, lines):
+    """
+    Log lines long enough to be split by the socket, from one worker
+    """
+    handler = SocketLineHandler(path)
+    logger = make_logger(f'tests.worker.{worker}', handler)
+    for index in range(lines):
+        logger.info('%s %s %s', worker, index, 'x' * 10_000)
+    handler.close()
+
+
+def read_lines(path):
+    with open(path) as output:
+        return output.read().splitlines()
+
+
+def assert_complete(lines, workers, count):
+    assert len(lines) == workers * count
+    for line in lines:
+        worker, index, padding = line.split(' ')
+        assert padding == 'x' * 10_000
+    for worker in range(workers):
+        # In order per worker
+        indexes = [int(line.split(' ')[1]) for line in lines if line.startswith(f'{worker} ')]
+        assert indexes == list(range(count))
+
+
+def test_lines_from_threads_batched(tmp_path):
+    output_path = tmp_path / 'output.log'
+    fd = os.open(output_path, os.O_WRONLY | os.O_CREAT)
+    server = LogWriterServer(str(tmp_path / 'log.sock'), fd=fd, flush_interval=0.05)
+    ready = threading.Event()
+    server_thread = threading.Thread(target=server.serve, kwargs={'ready': ready})
+    server_thread.start()
+    ready.wait()
+
+    workers = [threading.Thread(target=log_lines, args=(server.path, worker, 50)) for worker in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    server.stopping.set()
+    server_thread.join()
+    os.close(fd)
+
+    assert_complete(read_lines(output_path), workers=4, count=50)
+    assert server.lines == 200
+    assert server.writes < server.lines
+    assert not os.path.exists(server.path)
+
+
+def test_lines_from_forked_workers(tmp_path):
+    output_path = tmp_path / 'output.log'
+    fd = os.open(output_path, os.O_WRONLY | os.O_CREAT)
+    writer = LogWriter(str(tmp_path / 'log.sock'), fd=fd)
+    writer.start()
+
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=log_lines, args=(writer.path, worker, 100)) for worker in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    writer.stop()
+    os.close(fd)
+
+    assert_complete(read_lines(output_path), workers=4, count=100)
+
+
+def test_reconnects_after_fork(tmp_path):
+    output_path = tmp_path / 'output.log'
+    fd = os.open(output_path, os.O_WRONLY | os.O_CREAT)
+    writer = LogWriter(str(tmp_path / 'log.sock'), fd=fd)
+    writer.start()
+
+    # Connected in the parent, like logging configured in the gunicorn master with `--preload`
+    handler = SocketLineHandler(writer.path)
+    logger = make_logger('tests.preload', handler)
+    logger.info('parent')
+
+    def child():
+        logger.info('child')
+        handler.close()
+
+    process = multiprocessing.get_context('fork').Process(target=child)
+    process.start()
+    process.join()
+    handler.close()
+    writer.stop()
+    os.close(fd)
+
+    assert sorted(read_lines(output_path)) == ['child', 'parent']
+
+
+def test_fallback_without_writer(tmp_path):
+    fallback = io.StringIO()
+    handler = SocketLineHandler(str(tmp_path / 'missing.sock'), fallback=fallback)
+    make_logger('tests.fallback', handler).info('not lost')
+    assert fallback.getvalue() == 'not lost\n'
+    assert handler.sock is None
+
+
+def test_logging_config():
+    class Settings:
+        ENVIRONMENT = 'prod'
+
+    config = generate_base_logging_config(Settings(), log_socket='/tmp/logs.sock')
+    assert config['handlers']['json']['()'] == 'fastapi_stack_utils.log_aggregation.SocketLineHandler'
+    assert config['handlers']['json']['path'] == '/tmp/logs.sock'
+    with pytest.raises(ValueError, match='can not be combined'):
+        generate_base_logging_config(Settings(), queue=True, log_socket='/tmp/logs.sock')
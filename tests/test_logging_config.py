@@ -1,5 +1,19 @@
+import io
+import logging
+import random
+import threading
+from datetime import datetime
+
 import pytest
-from fastapi_stack_utils.logging_config import generate_base_logging_config
+import pytz
+from fastapi_stack_utils import logging_config
+from fastapi_stack_utils.logging_config import (
+    QueueStreamHandler,
+    generate_base_logging_config,
+    get_time_in_nano_seconds,
+    start_queue_logging,
+    stop_queue_logging,
+)
 from pydantic import BaseSettings
 
 
@@ -18,3 +32,148 @@ def test_fails_if_not_valid_settings():
     settings = Settings()
     with pytest.raises(AttributeError):
         generate_base_logging_config(settings=settings)
+
+
+def _record(message: str) -> logging.LogRecord:
+    return logging.makeLogRecord({'msg': message, 'levelno': logging.INFO, 'levelname': 'INFO'})
+
+
+def test_queue_mode_uses_queue_handlers():
+    class Settings(BaseSettings):
+        ENVIRONMENT: str = 'prod'
+
+    config = generate_base_logging_config(settings=Settings(), queue=True, queue_size=10, overflow='drop')
+    for name in ['console', 'json']:
+        assert config['handlers'][name]['()'] == 'fastapi_stack_utils.logging_config.QueueStreamHandler'
+        assert config['handlers'][name]['maxsize'] == 10
+        assert config['handlers'][name]['overflow'] == 'drop'
+        assert config['handlers'][name]['filters'] == ['correlation_id', 'nanostamp']
+
+
+def test_queue_handler_writes_in_background():
+    stream = io.StringIO()
+    handler = QueueStreamHandler(stream=stream)
+    handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+    record = logging.makeLogRecord({'msg': 'hello %s', 'args': ({'a': 1},), 'levelname': 'INFO'})
+    handler.handle(record)
+    assert record.args == ({'a': 1},)  # the original record is untouched
+    handler.stop()
+    assert stream.getvalue() == "INFO hello {'a': 1}\n"
+    handler.close()
+
+
+@pytest.mark.parametrize(
+    'overflow, expected',
+    [
+        ('drop', ['first', 'second']),
+        ('drop_oldest', ['third', 'fourth']),
+    ],
+)
+def test_queue_handler_overflow(overflow, expected, monkeypatch):
+    stream = io.StringIO()
+    handler = QueueStreamHandler(stream=stream, maxsize=2, overflow=overflow)
+    handler.listener.stop(lambda: handler.queue.put(None))
+    # Queue the records as if the listener was stalled
+    monkeypatch.setattr(QueueStreamHandler, 'running', True)
+    for message in ['first', 'second', 'third', 'fourth']:
+        handler.handle(_record(message))
+    assert handler.dropped == 2
+    assert [handler.queue.get_nowait().msg for _ in range(2)] == expected
+    monkeypatch.undo()
+    handler.stop()
+    assert handler.dropped == 0
+    assert 'Dropped 2 log records, the logging queue was full' in stream.getvalue()
+    handler.close()
+
+
+def test_queue_handler_block():
+    stream = io.StringIO()
+    handler = QueueStreamHandler(stream=stream, maxsize=1, overflow='block')
+    for message in ['first', 'second', 'third']:
+        handler.handle(_record(message))
+    handler.stop()
+    assert handler.dropped == 0
+    assert stream.getvalue() == 'first\nsecond\nthird\n'
+    handler.close()
+
+
+@pytest.mark.parametrize('overflow', ['block', 'drop'])
+def test_queue_handler_writes_directly_when_stopped(overflow):
+    stream = io.StringIO()
+    handler = QueueStreamHandler(stream=stream, maxsize=1, overflow=overflow)
+    handler.stop()
+    # Neither queued where nobody reads them, nor blocked on the full queue
+    for message in ['first', 'second', 'third']:
+        handler.handle(_record(message))
+    assert handler.queue.empty()
+    assert stream.getvalue() == 'first\nsecond\nthird\n'
+    handler.start()
+    handler.handle(_record('fourth'))
+    handler.close()
+    assert stream.getvalue().endswith('third\nfourth\n')
+
+
+def test_start_and_stop_queue_logging():
+    handler = QueueStreamHandler(stream=io.StringIO())
+    handler.handle(_record('first'))
+    assert handler.running
+    stop_queue_logging()
+    assert not handler.running
+    start_queue_logging()
+    handler.handle(_record('second'))
+    assert handler.running
+    handler.close()
+    assert not handler.running
+
+
+def test_listener_started_by_first_record():
+    used, unused = QueueStreamHandler(stream=io.StringIO()), QueueStreamHandler(stream=io.StringIO())
+    assert not used.running
+    used.handle(_record('first'))
+    assert used.running
+    assert not unused.running
+    used.close()
+    unused.close()
+
+
+def test_no_record_lost_while_stopping():
+    stream = io.StringIO()
+    handler = QueueStreamHandler(stream=stream, maxsize=10)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    started = threading.Barrier(5)
+
+    def log_records():
+        started.wait()
+        for i in range(500):
+            handler.handle(_record(str(i)))
+
+    threads = [threading.Thread(target=log_records) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    started.wait()
+    handler.stop()
+    for thread in threads:
+        thread.join()
+    assert len(stream.getvalue().splitlines()) == 2000
+    handler.close()
+
+
+def _reference_time_in_nano_seconds(nano_timestamp: int) -> str:
+    """
+    The previous, uncached implementation
+    """
+    date_time = datetime.fromtimestamp(nano_timestamp // 1000000000, tz=pytz.utc)
+    return date_time.strftime(f'%Y-%m-%dT%H:%M:%S.{str(int(nano_timestamp % 1000000000)).zfill(9)}')
+
+
+def test_nano_seconds_identical_to_reference_across_second_boundaries(monkeypatch):
+    rng = random.Random(1337)
+    timestamps = []
+    for _ in range(500):
+        second = rng.randrange(0, 4_102_444_800) * 1_000_000_000  # until 2100
+        timestamps += [second - 1, second, second + 1, second + rng.randrange(1_000_000_000)]
+    # Also walk forwards and backwards, so the cache is hit, invalidated and hit again
+    timestamps += sorted(timestamps) + sorted(timestamps, reverse=True)
+    for timestamp in timestamps:
+        monkeypatch.setattr(logging_config, 'time_ns', lambda: timestamp)
+        assert get_time_in_nano_seconds() == _reference_time_in_nano_seconds(timestamp)
@@ -0,0 +1,65 @@
+import pytest
+from dirty_equals import IsFloat
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi_stack_utils.exception_handler import format_and_log_exception_public
+from fastapi_stack_utils.middleware import LoggingMiddleware, patch_fastapi_middlewares
+from httpx import ASGITransport, AsyncClient
+from starlette.middleware import Middleware
+from starlette.responses import PlainTextResponse
+
+
+@pytest.fixture
+def app(monkeypatch):
+    # Restore the original `build_middleware_stack` afterwards, so other tests are not affected
+    monkeypatch.setattr(FastAPI, 'build_middleware_stack', FastAPI.build_middleware_stack)
+    patch_fastapi_middlewares(middlewares=[Middleware(LoggingMiddleware)])
+    app = FastAPI()
+    app.add_exception_handler(Exception, format_and_log_exception_public)
+
+    @app.get('/view')
+    async def view():
+        return {'message': 'Pure view'}
+
+    @app.get('/stream')
+    async def stream():
+        async def chunks():
+            for _ in range(3):
+                yield b'x' * 10
+
+        return StreamingResponse(chunks())
+
+    @app.get('/error')
+    async def error():
+        raise ValueError('Some value error')
+
+    app.mount('/files', PlainTextResponse('file'))
+    return app
+
+
+def _access_logs(caplog):
+    return [record for record in caplog.records if record.name == 'fastapi_stack_utils.middleware']
+
+
+@pytest.mark.parametrize(
+    'path, status_code',
+    [
+        ('/view', 200),
+        ('/stream', 200),
+        ('/error', 500),
+        ('/not-found', 404),
+        ('/files/a.txt', 200),
+    ],
+)
+async def test_access_logged(app, caplog, path, status_code):
+    async with AsyncClient(transport=ASGITransport(app, raise_app_exceptions=False), base_url='http://test') as client:
+        response = await client.get(path)
+    assert response.status_code == status_code
+    response_size = len(response.content)
+    [record] = _access_logs(caplog)
+    assert record.getMessage().startswith(f'GET {path} {status_code} {response_size} bytes ')
+    assert record.method == 'GET'
+    assert record.path == path
+    assert record.status_code == status_code
+    assert record.response_size == response_size
+    assert record.duration_ms == IsFloat(ge=0)
@@ -0,0 +1,94 @@
+import asyncio
+import subprocess
+import sys
+import time
+
+import pytest
+from asgi_correlation_id.context import correlation_id
+from fastapi_stack_utils.metrics import MetricsRegistry
+from fastapi_stack_utils.loop_monitor import LoopMonitor
+
+
+def blocking_call():
+    time.sleep(0.3)
+
+
+async def handle_request():
+    correlation_id.set('abc')
+    blocking_call()
+
+
+@pytest.fixture
+async def monitor(request):
+    monitor = LoopMonitor(interval=0.02, threshold=0.1, registry=MetricsRegistry(), **request.param)
+    await monitor.start()
+    yield monitor
+    await monitor.stop()
+
+
+@pytest.mark.parametrize('monitor', [{}], indirect=True)
+async def test_blocked_loop_captured_with_correlation_id(monitor, caplog):
+    await asyncio.create_task(handle_request(), name='request')
+    await asyncio.sleep(0.05)
+
+    assert monitor.stalls == 1
+    # Back to normal
+    assert monitor.lag < 0.1
+    [record] = [record for record in caplog.records if record.name == 'fastapi_stack_utils.loop_monitor']
+    assert record.blocked_correlation_id == 'abc'
+    assert record.blocked_task == 'request'
+    assert record.loop_lag >= 0.2
+    assert record.getMessage().startswith('Event loop was blocked for ')
+    assert 'in blocking_call' in record.getMessage()
+
+
+@pytest.mark.parametrize('monitor', [{'capture_signal': None}], indirect=True)
+async def test_blocked_loop_captured_without_signal(monitor, caplog):
+    await asyncio.create_task(handle_request(), name='request')
+    await asyncio.sleep(0.05)
+
+    [record] = [record for record in caplog.records if record.name == 'fastapi_stack_utils.loop_monitor']
+    assert record.blocked_correlation_id is None
+    assert record.blocked_task == 'request'
+    assert 'in blocking_call' in record.getMessage()
+
+
+@pytest.mark.parametrize('monitor', [{}], indirect=True)
+async def test_stats_exposed_as_metrics(monitor):
+    blocking_call()
+    await asyncio.sleep(0.05)
+    rendered = monitor.registry.render()
+    assert 'event_loop_stalls 1' in rendered
+    [max_lag] = [float(line.split()[1]) for line in rendered.splitlines() if line.startswith('event_loop_lag_max')]
+    assert max_lag >= 0.2
+    # The maximum is reset by every scrape
+    assert monitor.pop_max_lag() < 0.1
+
+
+@pytest.mark.parametrize('monitor', [{}], indirect=True)
+async def test_no_stall_when_idle(monitor, caplog):
+    await asyncio.sleep(0.2)
+    assert monitor.stalls == 0
+    assert not caplog.records
+
+
+def test_import_without_sigurg():
+    # Windows has neither `SIGURG` nor `pthread_kill`
+    script = (
+        'import signal; del signal.SIGURG, signal.pthread_kill; '
+        'import fastapi_stack_utils.uvloop; from fastapi_stack_utils.loop_monitor import LoopMonitor; '
+        'assert LoopMonitor().capture_signal is None'
+    )
+    subprocess.run([sys.executable, '-c', script], check=True)
+
+
+async def test_stack_read_without_pthread_kill(monkeypatch, caplog):
+    monkeypatch.delattr('signal.pthread_kill')
+    monitor = LoopMonitor(interval=0.02, threshold=0.1, registry=MetricsRegistry())
+    await monitor.start()
+    assert monitor.capture_signal is None
+    await asyncio.create_task(handle_request(), name='request')
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+    [record] = [record for record in caplog.records if record.name == 'fastapi_stack_utils.loop_monitor']
+    assert 'in blocking_call' in record.getMessage()
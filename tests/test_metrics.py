@@ -0,0 +1,175 @@
+import os
+import time
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi_stack_utils.exception_handler import format_and_log_exception_internal, format_and_log_exception_public
+from fastapi_stack_utils.metrics import REGISTRY, Histogram, MetricsEndpoint, MetricsMiddleware, MetricsRegistry
+from fastapi_stack_utils.middleware import patch_fastapi_middlewares
+from httpx import ASGITransport, AsyncClient
+from starlette.middleware import Middleware
+from starlette.responses import PlainTextResponse
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry(buckets=(0.1, 1.0))
+
+
+@pytest.fixture
+def app(monkeypatch, registry):
+    # Restore the original `build_middleware_stack` afterwards, so other tests are not affected
+    monkeypatch.setattr(FastAPI, 'build_middleware_stack', FastAPI.build_middleware_stack)
+    patch_fastapi_middlewares(middlewares=[Middleware(MetricsMiddleware, registry=registry)])
+    app = FastAPI()
+    app.add_exception_handler(Exception, format_and_log_exception_public)
+    app.add_route('/metrics', MetricsEndpoint(registry), include_in_schema=False)
+
+    @app.get('/items/{item_id}')
+    async def item(item_id: int):
+        return {'id': item_id}
+
+    @app.get('/error')
+    async def error():
+        raise ValueError('Some value error')
+
+    return app
+
+
+def test_histogram_buckets():
+    histogram = Histogram((0.1, 1.0))
+    for value in [0.05, 0.1, 0.5, 1.0, 5.0]:
+        histogram.observe(value)
+    assert list(histogram.counts) == [2, 2, 1]
+    assert histogram.sum == pytest.approx(6.65)
+
+
+async def test_middleware_records_route_template(app, registry):
+    async with AsyncClient(transport=ASGITransport(app, raise_app_exceptions=False), base_url='http://test') as client:
+        for item_id in range(3):
+            await client.get(f'/items/{item_id}')
+        await client.get('/items/not-a-number')
+        await client.get('/error')
+        await client.get('/does-not-exist')
+    assert registry.requests == {
+        ('GET', '/items/{item_id}', '2xx'): 3,
+        ('GET', '/items/{item_id}', '4xx'): 1,
+        ('GET', '/error', '5xx'): 1,
+        ('GET', '<unmatched>', '4xx'): 1,
+    }
+    assert sum(registry.latency[('GET', '/items/{item_id}')].counts) == 4
+
+
+async def test_middleware_records_template_of_starlette_and_mounted_routes(app, registry):
+    async def plain(request: Request) -> PlainTextResponse:
+        return PlainTextResponse('plain')
+
+    sub_app = FastAPI()
+
+    @sub_app.get('/users/{user_id}')
+    async def user(user_id: int):
+        return {'id': user_id}
+
+    app.add_route('/plain/{name:str}', plain)
+    app.mount('/admin', sub_app)
+    app.mount('/files', PlainTextResponse('file'))
+    async with AsyncClient(transport=ASGITransport(app), base_url='http://test') as client:
+        await client.get('/metrics')
+        await client.get('/plain/a')
+        await client.post('/plain/b')
+        await client.get('/admin/users/1')
+        await client.get('/admin/missing')
+        await client.get('/files/a/b.txt')
+    assert registry.requests == {
+        ('GET', '/metrics', '2xx'): 1,
+        ('GET', '/plain/{name}', '2xx'): 1,
+        ('POST', '/plain/{name}', '4xx'): 1,
+        ('GET', '/admin/users/{user_id}', '2xx'): 1,
+        ('GET', '/admin/{path}', '4xx'): 1,
+        ('GET', '/files/{path}', '2xx'): 1,
+    }
+
+
+async def test_metrics_endpoint(app, registry):
+    registry.add_gauge('event_loop_lag_seconds', 'Event loop lag', lambda: 0.5)
+    registry.count_exception(ValueError())
+    async with AsyncClient(app=app, base_url='http://test') as client:
+        await client.get('/items/1')
+        response = await client.get('/metrics')
+    assert response.headers['content-type'] == 'text/plain; version=0.0.4; charset=utf-8'
+    lines = response.text.splitlines()
+    assert 'http_requests_total{method="GET",route="/items/{item_id}",status="2xx"} 1' in lines
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/items/{item_id}",le="0.1"} 1' in lines
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/items/{item_id}",le="+Inf"} 1' in lines
+    assert 'http_request_duration_seconds_count{method="GET",route="/items/{item_id}"} 1' in lines
+    assert 'http_unhandled_exceptions_total{exception="ValueError"} 1' in lines
+    assert lines[-3:] == [
+        '# HELP event_loop_lag_seconds Event loop lag',
+        '# TYPE event_loop_lag_seconds gauge',
+        'event_loop_lag_seconds 0.5',
+    ]
+
+
+def test_labels_escaped(registry):
+    registry.observe_request('GET', '/a"b\\c\n', 200, 0.01)
+    assert 'http_requests_total{method="GET",route="/a\\"b\\\\c\\n",status="2xx"} 1' in registry.render()
+
+
+@pytest.mark.parametrize('handler', [format_and_log_exception_internal, format_and_log_exception_public])
+async def test_exception_handlers_counted(handler, monkeypatch):
+    monkeypatch.setattr(REGISTRY, 'exceptions', {})
+    await handler(request=Request(scope={'type': 'http'}), exc=KeyError('x'))
+    assert REGISTRY.exceptions == {'KeyError': 1}
+
+
+def test_multiprocess_aggregation(tmp_path):
+    workers = [MetricsRegistry(buckets=(0.1, 1.0), directory=str(tmp_path), process_id=str(i)) for i in range(3)]
+    for worker in workers:
+        worker.observe_request('GET', '/items/{item_id}', 200, 0.05)
+        worker.observe_request('POST', '/items', 500, 2.0)
+        worker.count_exception(ValueError())
+    for worker in workers[1:]:
+        worker.flush()
+    (tmp_path / 'corrupt.json').write_text('{')
+
+    merged = workers[0].collect()
+    assert merged.requests == {('GET', '/items/{item_id}', '2xx'): 3, ('POST', '/items', '5xx'): 3}
+    assert list(merged.latency[('GET', '/items/{item_id}')].counts) == [3, 0, 0]
+    assert list(merged.latency[('POST', '/items')].counts) == [0, 0, 3]
+    assert merged.exceptions == {'ValueError': 3}
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['0.json', '1.json', '2.json', 'corrupt.json']
+
+
+def test_multiprocess_flush_interval(tmp_path):
+    registry = MetricsRegistry(directory=str(tmp_path), flush_interval=0)
+    registry.observe_request('GET', '/', 200, 0.01)
+    assert (tmp_path / f'{registry.process_id}.json').exists()
+
+
+def test_multiprocess_idle_worker_flushed(tmp_path):
+    registry = MetricsRegistry(directory=str(tmp_path), flush_interval=0.05)
+    registry.observe_request('GET', '/', 200, 0.01)
+    assert not (tmp_path / f'{registry.process_id}.json').exists()
+    # Without further requests, the worker writes its metrics from a timer
+    time.sleep(0.3)
+    assert (tmp_path / f'{registry.process_id}.json').exists()
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+def test_multiprocess_forked_workers(tmp_path):
+    # Created before forking, like the module level registry with gunicorn `--preload`
+    registry = MetricsRegistry(directory=str(tmp_path))
+    registry.observe_request('GET', '/', 200, 0.01)
+    registry.flush()
+    children = []
+    for _ in range(2):
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            registry.observe_request('GET', '/', 200, 0.01)
+            registry.flush()
+            os._exit(0)
+        children.append(pid)
+    for pid in children:
+        os.waitpid(pid, 0)
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(f'{pid}.json' for pid in [os.getpid(), *children])
+    assert registry.collect().requests == {('GET', '/', '2xx'): 3}
@@ -1,10 +1,11 @@
 from uuid import uuid4
 
+import pytest
 from asgi_correlation_id import CorrelationIdMiddleware
 from dirty_equals import IsUUID
 from fastapi import FastAPI
-from fastapi_stack_utils.middleware import patch_fastapi_middlewares
-from httpx import AsyncClient
+from fastapi_stack_utils.middleware import PathMiddleware, PathRules, patch_fastapi_middlewares
+from httpx import ASGITransport, AsyncClient
 from starlette.middleware import Middleware
 
 patch_fastapi_middlewares(
@@ -26,3 +27,65 @@ async def test_overrides_properly():
         assert response.json() == {'message': 'Pure view'}
         assert 'correlation-id' in response.headers
         assert response.headers.get('correlation-id') == IsUUID
+
+
+class HeaderMiddleware:
+    def __init__(self, app, name):
+        self.app = app
+        self.name = name
+
+    async def __call__(self, scope, receive, send):
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = [*message['headers'], (self.name.encode(), b'1')]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+@pytest.fixture
+def path_app(monkeypatch):
+    # Restore the original `build_middleware_stack` afterwards, so other tests are not affected
+    monkeypatch.setattr(FastAPI, 'build_middleware_stack', FastAPI.build_middleware_stack)
+    patch_fastapi_middlewares(
+        middlewares=[
+            Middleware(HeaderMiddleware, name='always'),
+            PathMiddleware(HeaderMiddleware, exclude_paths=['/health', '/metrics/*'], name='excluded'),
+            PathMiddleware(HeaderMiddleware, include_paths=['/api/*'], exclude_paths=['/api/private'], name='included'),
+        ]
+    )
+    app = FastAPI()
+
+    @app.get('/{path:path}')
+    async def view(path: str):
+        raise ValueError('Boom') if path == 'api/error' else None
+
+    return app
+
+
+@pytest.mark.parametrize(
+    'path, headers',
+    [
+        ('/health', {'always'}),
+        ('/healthz', {'always', 'excluded'}),
+        ('/metrics/', {'always'}),
+        ('/metrics/requests', {'always'}),
+        ('/metrics', {'always', 'excluded'}),
+        ('/api/view', {'always', 'excluded', 'included'}),
+        ('/api/private', {'always', 'excluded'}),
+        ('/api/error', {'always', 'excluded', 'included'}),
+        ('/other', {'always', 'excluded'}),
+    ],
+)
+async def test_path_middleware(path_app, path, headers):
+    transport = ASGITransport(path_app, raise_app_exceptions=False)
+    async with AsyncClient(transport=transport, base_url='http://test') as app_client:
+        response = await app_client.get(path)
+    assert {name for name in ['always', 'excluded', 'included'] if name in response.headers} == headers
+
+
+def test_path_rules():
+    rules = PathRules(['/health', '/metrics/*', '*'])
+    assert rules.exact == {'/health'}
+    assert rules.prefixes == ('/metrics/', '')
+    assert not PathRules([])
@@ -0,0 +1,114 @@
+import json
+
+import pytest
+from fastapi import APIRouter, FastAPI, Response
+from fastapi_stack_utils.redaction import Redactor
+from fastapi_stack_utils.route import AuditLog
+from httpx import AsyncClient
+from starlette.datastructures import MutableHeaders
+
+
+@pytest.fixture
+def redactor():
+    return Redactor(patterns=[r'\b\d{4}-\d{4}-\d{4}-\d{4}\b'])
+
+
+def test_redact_json(redactor):
+    body = {'user': 'jonas', 'Password': 'hunter2', 'items': [{'api_key': 'key', 'card': '1234-5678-1234-5678'}]}
+    assert redactor.redact_json(body) == {
+        'user': 'jonas',
+        'Password': '[REDACTED]',
+        'items': [{'api_key': '[REDACTED]', 'card': '[REDACTED]'}],
+    }
+    # The parsed body is still used by FastAPI, so it must not be modified
+    assert body['Password'] == 'hunter2'
+
+
+@pytest.mark.parametrize(
+    'text,expected',
+    [
+        ('{"user": "jonas", "password": "hun\\"ter2"}', '{"user": "jonas", "password": "[REDACTED]"}'),
+        ('{"access_token":123,"card":"1234-5678-1234-5678"}', '{"access_token":[REDACTED],"card":"[REDACTED]"}'),
+        ('user=jonas&db_password=hunter2&page=1', 'user=jonas&db_password=[REDACTED]&page=1'),
+        ("{'client_secret': 'abc'}", "{'client_secret': '[REDACTED]'}"),
+        # Truncated in the middle of a value
+        ('{"token": "abc def', '{"token": "[REDACTED]"'),
+        ('nothing to see', 'nothing to see'),
+        # The credentials after an authentication scheme
+        ('authorization: Bearer abc123\nuser: jonas', 'authorization: [REDACTED]\nuser: jonas'),
+        ('Proxy-Authorization: basic dXNlcjpwYXNz', 'Proxy-Authorization: [REDACTED]'),
+        ('token=abc def', 'token=[REDACTED] def'),
+        # Not ASCII, matched case insensitive instead of lowercased
+        ('{"navn": "Bø", "Token": "abc"}', '{"navn": "Bø", "Token": "[REDACTED]"}'),
+    ],
+)
+def test_redact_text(redactor, text, expected):
+    assert redactor.redact_text(text) == expected
+
+
+def test_redact_headers(redactor):
+    headers = MutableHeaders(raw=[(b'set-cookie', b'session=abc'), (b'content-type', b'application/json')])
+    assert redactor.redact_headers(headers).items() == [
+        ('set-cookie', '[REDACTED]'),
+        ('content-type', 'application/json'),
+    ]
+    assert headers['set-cookie'] == 'session=abc'
+
+
+def test_extend():
+    redactor = Redactor(keys=['password']).extend(keys=['ssn'], headers=['x-session'], patterns=['secret-\\d+'])
+    assert redactor.redact_json({'password': 1, 'ssn': 2, 'note': 'secret-42'}) == {
+        'password': '[REDACTED]',
+        'ssn': '[REDACTED]',
+        'note': '[REDACTED]',
+    }
+    assert 'x-session' in redactor.headers
+
+
+class VerbatimAuditLog(AuditLog):
+    redactor = None
+
+
+class CustomAuditLog(AuditLog):
+    redactor = Redactor().extend(keys=['ssn'])
+
+
+@pytest.fixture
+async def app_client():
+    app = FastAPI()
+    for prefix, route_class in (('/default', AuditLog), ('/verbatim', VerbatimAuditLog), ('/custom', CustomAuditLog)):
+        router = APIRouter(prefix=prefix, route_class=route_class)
+
+        @router.post('')
+        async def login(body: dict, response: Response):
+            response.set_cookie('session', 'abc')
+            return {'token': 'secret-token', 'ssn': body.get('ssn')}
+
+        app.include_router(router)
+
+    async with AsyncClient(app=app, base_url='http://test') as client:
+        yield client
+
+
+async def test_audit_log_redacted(app_client, caplog):
+    response = await app_client.post(
+        '/default?token=abc&page=1', content=json.dumps({'user': 'jonas', 'password': 'hunter2', 'ssn': '1'})
+    )
+    # The endpoint gets the original values
+    assert response.json() == {'token': 'secret-token', 'ssn': '1'}
+    assert caplog.messages[:2] == [
+        "Unknown > [POST] | /default | token=[REDACTED]&page=1 | "
+        "{'user': 'jonas', 'password': '[REDACTED]', 'ssn': '1'}",
+        'Response body: {"token":"[REDACTED]","ssn":"1"}',
+    ]
+    assert "'set-cookie': '[REDACTED]'" in caplog.messages[2]
+
+
+async def test_audit_log_redaction_per_route(app_client, caplog):
+    await app_client.post('/custom', content=json.dumps({'password': 'hunter2', 'ssn': '1'}))
+    await app_client.post('/verbatim', content=json.dumps({'password': 'hunter2', 'ssn': '1'}))
+    request_logs = [message for message in caplog.messages if message.startswith('Unknown')]
+    assert request_logs == [
+        "Unknown > [POST] | /custom | {'password': '[REDACTED]', 'ssn': '[REDACTED]'}",
+        "Unknown > [POST] | /verbatim | {'password': 'hunter2', 'ssn': '1'}",
+    ]
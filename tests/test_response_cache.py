@@ -0,0 +1,207 @@
+import asyncio
+from collections import Counter
+from time import monotonic
+
+import pytest
+from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
+from fastapi_stack_utils.cache import CachedResponse, ResponseCacheMiddleware
+from fastapi_stack_utils.middleware import patch_fastapi_middlewares
+from fastapi_stack_utils.warmup import WarmupRequest, call_app
+from httpx import AsyncClient
+from starlette.middleware import Middleware
+
+
+@pytest.fixture
+def calls():
+    return Counter()
+
+
+@pytest.fixture
+async def app_client(monkeypatch, calls):
+    monkeypatch.setattr(FastAPI, 'build_middleware_stack', FastAPI.build_middleware_stack)
+    patch_fastapi_middlewares(
+        middlewares=[
+            Middleware(
+                ResponseCacheMiddleware,
+                route_ttls={'/uncached': 0, '/search': 0, '/items/{item_id}': 30},
+                max_bytes=4096,
+                max_entry_bytes=1024,
+            )
+        ]
+    )
+    app = FastAPI()
+
+    @app.get('/items/{item_id}')
+    async def item(item_id: int, q: str = ''):
+        calls[item_id] += 1
+        return {'item_id': item_id, 'q': q}
+
+    @app.get('/slow')
+    async def slow():
+        calls['slow'] += 1
+        await asyncio.sleep(0.05)
+        return {'slow': True}
+
+    @app.get('/uncached')
+    async def uncached():
+        calls['uncached'] += 1
+        return {}
+
+    @app.get('/search')
+    async def search():
+        calls['search'] += 1
+        await asyncio.sleep(0.1)
+        return {}
+
+    @app.get('/slow-session')
+    async def slow_session(response: Response):
+        calls['slow-session'] += 1
+        await asyncio.sleep(0.1)
+        response.set_cookie('session', 'abc')
+        return {}
+
+    @app.get('/session')
+    async def session(response: Response):
+        calls['session'] += 1
+        response.set_cookie('session', 'abc')
+        return {}
+
+    @app.get('/large')
+    async def large():
+        calls['large'] += 1
+        return Response(b'x' * 2048)
+
+    @app.get('/stream')
+    async def stream():
+        calls['stream'] += 1
+        return StreamingResponse(iter([b'a' * 10, b'b' * 10]))
+
+    @app.get('/error')
+    async def error():
+        calls['error'] += 1
+        return Response(status_code=500)
+
+    async with AsyncClient(app=app, base_url='http://test') as client:
+        yield client
+
+
+async def test_cache_hit(app_client, calls):
+    first = await app_client.get('/items/1?q=a')
+    second = await app_client.get('/items/1?q=a')
+    assert first.json() == second.json() == {'item_id': 1, 'q': 'a'}
+    assert first.headers['etag'] == second.headers['etag']
+    assert calls[1] == 1
+    # The query is part of the key
+    await app_client.get('/items/1?q=b')
+    assert calls[1] == 2
+
+
+async def test_head_served_from_cache(app_client, calls):
+    get = await app_client.get('/items/1')
+    head = await app_client.head('/items/1')
+    assert head.status_code == 200
+    assert head.content == b''
+    assert head.headers['etag'] == get.headers['etag']
+    assert calls[1] == 1
+
+
+async def test_vary_headers(app_client, calls):
+    await app_client.get('/items/1', headers={'Accept': 'application/json'})
+    await app_client.get('/items/1', headers={'Accept': 'text/html'})
+    await app_client.get('/items/1', headers={'Accept': 'application/json'})
+    assert calls[1] == 2
+
+
+async def test_authorization_not_cached(app_client, calls):
+    await app_client.get('/items/1')
+    await app_client.get('/items/1', headers={'Authorization': 'Bearer abc'})
+    assert calls[1] == 2
+
+
+async def test_etag_not_modified(app_client, calls):
+    first = await app_client.get('/items/1')
+    etag = first.headers['etag']
+    response = await app_client.get('/items/1', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.content == b''
+    assert response.headers['etag'] == etag
+    assert (await app_client.get('/items/1', headers={'If-None-Match': '"other"'})).status_code == 200
+    assert calls[1] == 1
+
+
+async def test_etag_not_modified_on_miss(app_client, calls):
+    etag = ResponseCacheMiddleware.etag(b'{"item_id":1,"q":""}')
+    response = await app_client.get('/items/1', headers={'If-None-Match': f'W/{etag}'})
+    assert response.status_code == 304
+    assert (await app_client.get('/items/1')).json() == {'item_id': 1, 'q': ''}
+    assert calls[1] == 1
+
+
+@pytest.mark.parametrize('path', ['/uncached', '/session', '/large', '/error'])
+async def test_not_cached(app_client, calls, path):
+    await app_client.get(path)
+    await app_client.get(path)
+    assert calls[path.strip('/')] == 2
+
+
+async def test_streamed_response_cached(app_client, calls):
+    first = await app_client.get('/stream')
+    second = await app_client.get('/stream')
+    assert first.content == second.content == b'a' * 10 + b'b' * 10
+    assert second.headers['content-length'] == '20'
+    assert calls['stream'] == 1
+
+
+async def test_concurrent_misses_coalesced(app_client, calls):
+    responses = await asyncio.gather(*(app_client.get('/slow') for _ in range(10)))
+    assert {response.status_code for response in responses} == {200}
+    assert calls['slow'] == 1
+
+
+async def test_uncached_route_not_coalesced(app_client, calls):
+    start = monotonic()
+    await asyncio.gather(*(app_client.get('/search') for _ in range(5)))
+    # The requests ran concurrently, instead of waiting for each other
+    assert monotonic() - start < 0.18
+    assert calls['search'] == 5
+
+
+async def test_uncacheable_response_not_coalesced(app_client, calls):
+    await asyncio.gather(*(app_client.get('/slow-session') for _ in range(5)))
+    assert calls['slow-session'] == 5
+    # Once a response wasn't cacheable, requests for it run concurrently
+    start = monotonic()
+    await asyncio.gather(*(app_client.get('/slow-session') for _ in range(5)))
+    assert monotonic() - start < 0.18
+    assert calls['slow-session'] == 10
+
+
+async def test_warmup_not_cached(app_client, calls):
+    assert await call_app(app_client._transport.app, WarmupRequest('/items/1')) == 200
+    await app_client.get('/items/1')
+    await app_client.get('/items/1')
+    assert calls[1] == 2
+
+
+async def test_ttl_expires(app_client, calls, monkeypatch):
+    await app_client.get('/items/1')
+    await app_client.get('/slow')
+    # `/items/{item_id}` is cached for 30 seconds, other routes for the default 60
+    monkeypatch.setattr('fastapi_stack_utils.cache.monotonic', lambda: monotonic() + 45)
+    await app_client.get('/items/1')
+    await app_client.get('/slow')
+    assert calls[1] == 2
+    assert calls['slow'] == 1
+
+
+def test_lru_eviction():
+    cache = ResponseCacheMiddleware(app=None, max_bytes=1000)  # type: ignore[arg-type]
+    for item in range(4):
+        cache.store((f'/items/{item}', b'', ()), CachedResponse(200, [], b'x' * 300, '"etag"', ttl=60))
+        if item == 1:
+            # Using the first entry makes the second one the least recently used
+            assert cache.get(('/items/0', b'', ())) is not None
+    assert [key[0] for key in cache.entries] == ['/items/0', '/items/2', '/items/3']
+    assert cache.size == 900
+    assert cache.evictions == 1
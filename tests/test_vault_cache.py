@@ -0,0 +1,162 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from cryptography.fernet import Fernet
+from fastapi_stack_utils import vault_cache
+from fastapi_stack_utils.vault_cache import cached_vault_config_settings_source, invalidate_vault_cache
+from pydantic import BaseSettings, Field
+
+SECRETS = {
+    'kv/data/project/dev': {'POSTGRES_PASSWORD': 'hunter2', 'REDIS_PASSWORD': 'hunter3', 'CONFIG': '{"a": 1}'},
+}
+
+
+class FakeVault(BaseHTTPRequestHandler):
+    requests: list[str] = []
+
+    def do_GET(self):
+        FakeVault.requests.append(self.path)
+        secret = SECRETS.get(self.path.removeprefix('/v1/'))
+        if self.headers.get('X-Vault-Token') != 'token' or secret is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps({'data': {'data': secret, 'metadata': {}}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def vault_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeVault)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+
+
+@pytest.fixture
+def settings_classes(vault_url, tmp_path, monkeypatch):
+    monkeypatch.setenv('VAULT_TOKEN', 'token')
+    monkeypatch.setenv('FSU_VAULT_CACHE_PATH', str(tmp_path / 'vault.cache'))
+    monkeypatch.setattr(vault_cache, '_caches', {})
+    FakeVault.requests.clear()
+
+    class VaultConfig:
+        vault_cache_ttl = 60
+
+        @classmethod
+        def customise_sources(cls, init_settings, env_settings, file_secret_settings):
+            return init_settings, cached_vault_config_settings_source
+
+    VaultConfig.vault_url = vault_url
+
+    class DatabaseSettings(BaseSettings):
+        POSTGRES_PASSWORD: str = Field(
+            ..., vault_secret_path='kv/data/project/dev', vault_secret_key='POSTGRES_PASSWORD'
+        )
+        CONFIG: dict = Field(..., vault_secret_path='kv/data/project/dev', vault_secret_key='CONFIG')
+        MISSING: str = Field('default', vault_secret_path='kv/data/project/missing', vault_secret_key='MISSING')
+
+        Config = type('Config', (VaultConfig,), {})
+
+    class RedisSettings(BaseSettings):
+        REDIS_PASSWORD: str = Field(..., vault_secret_path='kv/data/project/dev', vault_secret_key='REDIS_PASSWORD')
+
+        Config = type('Config', (VaultConfig,), {})
+
+    return DatabaseSettings, RedisSettings
+
+
+def test_one_fetch_shared_by_settings_classes(settings_classes):
+    database_settings_class, redis_settings_class = settings_classes
+    database_settings = database_settings_class()
+    assert database_settings.POSTGRES_PASSWORD == 'hunter2'
+    assert database_settings.CONFIG == {'a': 1}
+    assert database_settings.MISSING == 'default'
+    assert redis_settings_class().REDIS_PASSWORD == 'hunter3'
+    assert FakeVault.requests == ['/v1/kv/data/project/dev', '/v1/kv/data/project/missing']
+
+
+def test_encrypted_disk_cache_reused_by_next_process(settings_classes, tmp_path, monkeypatch):
+    database_settings_class, _ = settings_classes
+    database_settings_class()
+    cache_file = tmp_path / 'vault.cache'
+    assert b'hunter2' not in cache_file.read_bytes()
+    assert cache_file.stat().st_mode & 0o777 == 0o600
+
+    # A new process starts with an empty memory cache
+    monkeypatch.setattr(vault_cache, '_caches', {})
+    FakeVault.requests.clear()
+    assert database_settings_class().POSTGRES_PASSWORD == 'hunter2'
+    assert FakeVault.requests == ['/v1/kv/data/project/missing']
+
+
+def test_disk_cache_expires(settings_classes, monkeypatch):
+    database_settings_class, _ = settings_classes
+    database_settings_class()
+    monkeypatch.setattr(vault_cache, '_caches', {})
+    now = vault_cache.time.time()
+    monkeypatch.setattr(vault_cache.time, 'time', lambda: now + 61)
+    FakeVault.requests.clear()
+    database_settings_class()
+    assert FakeVault.requests == ['/v1/kv/data/project/dev', '/v1/kv/data/project/missing']
+
+
+def test_new_token_does_not_read_old_cache(settings_classes, monkeypatch):
+    database_settings_class, _ = settings_classes
+    database_settings_class()
+    monkeypatch.setattr(vault_cache, '_caches', {})
+    monkeypatch.setenv('VAULT_TOKEN', 'other-token')
+    FakeVault.requests.clear()
+    # The fake Vault rejects the new token, so nothing can be read
+    with pytest.raises(ValueError, match='POSTGRES_PASSWORD'):
+        database_settings_class()
+    assert FakeVault.requests == ['/v1/kv/data/project/dev', '/v1/kv/data/project/missing']
+
+
+def test_explicit_key(settings_classes, monkeypatch, tmp_path):
+    key = Fernet.generate_key()
+    monkeypatch.setenv('FSU_VAULT_CACHE_KEY', key.decode())
+    database_settings_class, _ = settings_classes
+    database_settings_class()
+    assert b'hunter2' in Fernet(key).decrypt((tmp_path / 'vault.cache').read_bytes())
+
+
+def test_invalidate(settings_classes, tmp_path):
+    database_settings_class, _ = settings_classes
+    database_settings_class()
+    invalidate_vault_cache()
+    assert not (tmp_path / 'vault.cache').exists()
+    FakeVault.requests.clear()
+    database_settings_class()
+    assert FakeVault.requests == ['/v1/kv/data/project/dev', '/v1/kv/data/project/missing']
+
+
+def test_memory_only_without_ttl(settings_classes, tmp_path):
+    database_settings_class, redis_settings_class = settings_classes
+    database_settings_class.__config__.vault_cache_ttl = None
+    redis_settings_class.__config__.vault_cache_ttl = None
+    database_settings_class()
+    redis_settings_class()
+    assert not (tmp_path / 'vault.cache').exists()
+    assert FakeVault.requests == ['/v1/kv/data/project/dev', '/v1/kv/data/project/missing']
+
+
+def test_different_ttl_not_shared(settings_classes, tmp_path):
+    database_settings_class, redis_settings_class = settings_classes
+    database_settings_class.__config__.vault_cache_ttl = None
+    database_settings_class()
+    assert not (tmp_path / 'vault.cache').exists()
+    # Not served from the memory-only cache of the first class, so its TTL applies and the secret is cached on disk
+    assert redis_settings_class().REDIS_PASSWORD == 'hunter3'
+    assert (tmp_path / 'vault.cache').exists()
+    assert FakeVault.requests == ['/v1/kv/data/project/dev', '/v1/kv/data/project/missing', '/v1/kv/data/project/dev']
@@ -120,3 +120,81 @@ async def test_input_logged_post_user(client, caplog):
 async def test_openapi_unknown_user_not_logged(client, caplog):
     await client.request(method='GET', url='/api/v1/openapi.json')
     assert caplog.messages == ['HTTP Request: GET http://test/api/v1/openapi.json "HTTP/1.1 404 Not Found"']
+
+
+async def test_input_logged_post_truncated(client, caplog):
+    response = await client.request(
+        method='POST', url='/truncated', data=json.dumps({'a': 'hehe', 'b': 'hoho', 'c': ['tihi', 123]})
+    )
+    assert caplog.messages[0] == 'Unknown > [POST] | /truncated | {"a": "heh... [truncated 36 bytes]'
+    assert response.json() == {'message': 'hehe'}
+
+
+async def test_streamed_response_captured_while_sent(client, caplog):
+    response = await client.request(method='POST', url='/truncated/streamed')
+    assert response.text == '0123456' * 3
+    assert caplog.messages[1:] == [
+        'Chunk 0',
+        'Chunk 1',
+        'Chunk 2',
+        'Response body: 0123456012... [truncated 11 bytes]',
+        "Response headers: MutableHeaders({'content-type': 'text/plain; charset=utf-8'})",
+        'HTTP Request: POST http://test/truncated/streamed "HTTP/1.1 200 OK"',
+    ]
+
+
+async def test_binary_response_summarized(client, caplog):
+    response = await client.request(method='POST', url='/truncated/download')
+    assert response.content == b'\x00\xff' * 3
+    assert 'Response body: <application/octet-stream; 6 bytes>' in caplog.messages
+
+
+async def test_input_logged_post_binary_summarized(client, caplog):
+    await client.request(
+        method='POST',
+        url='/logged/hello',
+        content=b'\x00\xff\x00\xff',
+        headers={'content-type': 'application/octet-stream'},
+    )
+    assert caplog.messages[0] == 'Unknown > [POST] | /logged/hello | <application/octet-stream; 4 bytes>'
+
+
+async def test_input_logged_post_json_parsed_once(client, caplog, monkeypatch):
+    from starlette import requests
+
+    calls = []
+    original_loads = requests.json.loads
+
+    def counting_loads(*args, **kwargs):
+        calls.append(args)
+        return original_loads(*args, **kwargs)
+
+    monkeypatch.setattr(requests.json, 'loads', counting_loads)
+    response = await client.request(
+        method='POST',
+        url='/logged/hello',
+        data=json.dumps({'a': 'hehe', 'b': 'hoho', 'c': ['tihi']}),
+        headers={'content-type': 'application/json'},
+    )
+    assert response.status_code == 200
+    assert len(calls) == 1
+
+
+async def test_timings_logged_and_server_timing_header(client, caplog):
+    response = await client.request(method='POST', url='/timed', data=json.dumps({'a': 'a', 'b': 'b', 'c': []}))
+    assert response.json() == {'message': 'a'}
+    assert caplog.messages[0] == "Unknown > [POST] | /timed | {'a': 'a', 'b': 'b', 'c': []}"
+    timings = caplog.records[1].timings
+    assert list(timings) == ['read', 'decode', 'handler', 'log']
+    assert all(duration >= 0 for duration in timings.values())
+    assert caplog.messages[1] == 'Timings: ' + ' | '.join(f'{name} {value:.3f}ms' for name, value in timings.items())
+    # The response is logged once it is sent, including the header
+    assert caplog.messages[2] == 'Response body: {"message":"a"}'
+    assert 'server-timing' in caplog.messages[3]
+    assert response.headers['server-timing'] == ', '.join(f'{name};dur={value:.3f}' for name, value in timings.items())
+
+
+async def test_no_timings_by_default(client, caplog):
+    response = await client.request(method='POST', url='/logged/hello', data=json.dumps({'a': 'a', 'b': 'b', 'c': []}))
+    assert 'server-timing' not in response.headers
+    assert not any(hasattr(record, 'timings') for record in caplog.records)
@@ -0,0 +1,143 @@
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi_stack_utils.metrics import MetricsMiddleware, MetricsRegistry
+from fastapi_stack_utils.middleware import patch_fastapi_middlewares
+from fastapi_stack_utils.route import AuditLog
+from fastapi_stack_utils.warmup import WarmupRequest, add_warmup, warm_up
+from httpx import AsyncClient
+from starlette.middleware import Middleware
+
+# Measures the first request to a JSON POST route through `AuditLog`, with and without a warmup, in a fresh process
+FIRST_REQUEST_SCRIPT = '''
+import asyncio
+import sys
+from logging.config import dictConfig
+from time import perf_counter
+
+from fastapi import APIRouter, FastAPI
+from fastapi_stack_utils.logging_config import generate_base_logging_config
+from fastapi_stack_utils.middleware import LoggingMiddleware, patch_fastapi_middlewares
+from fastapi_stack_utils.route import AuditLog
+from fastapi_stack_utils.warmup import WarmupRequest, call_app, warm_up
+from pydantic import BaseModel
+from starlette.middleware import Middleware
+
+
+class Settings:
+    ENVIRONMENT = 'prod'
+
+
+class Item(BaseModel):
+    name: str
+    price: float
+
+
+dictConfig(generate_base_logging_config(Settings()))
+patch_fastapi_middlewares(middlewares=[Middleware(LoggingMiddleware)])
+router = APIRouter(route_class=AuditLog)
+
+
+@router.post('/items')
+async def create_item(item: Item) -> Item:
+    return item
+
+
+app = FastAPI()
+app.include_router(router)
+
+
+def create_request(body):
+    return WarmupRequest('/items', method='POST', body=body, headers={'content-type': 'application/json'})
+
+
+async def main():
+    if sys.argv[1] == 'warm':
+        await warm_up(app, [create_request(b'{"name": "warmup", "price": 0}')])
+    start = perf_counter()
+    status = await call_app(app, create_request(b'{"name": "item", "price": 1}'))
+    assert status == 200
+    sys.stderr.write(f'first request: {perf_counter() - start}\\n')
+
+
+asyncio.run(main())
+'''
+
+
+def first_request_latency(mode: str) -> float:
+    result = subprocess.run(
+        [sys.executable, '-c', FIRST_REQUEST_SCRIPT, mode],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).parent.parent,
+    )
+    [line] = [line for line in result.stderr.splitlines() if line.startswith('first request: ')]
+    return float(line.removeprefix('first request: '))
+
+
+def test_warm_first_request_faster_than_cold():
+    cold = statistics.median(first_request_latency('cold') for _ in range(3))
+    warm = statistics.median(first_request_latency('warm') for _ in range(3))
+    assert warm < cold
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(FastAPI, 'build_middleware_stack', FastAPI.build_middleware_stack)
+    registry = MetricsRegistry()
+    patch_fastapi_middlewares(middlewares=[Middleware(MetricsMiddleware, registry=registry)])
+
+    router = APIRouter(route_class=AuditLog)
+
+    @router.get('/health')
+    async def health():
+        return {'status': 'ok'}
+
+    @router.post('/echo')
+    async def echo(body: dict):
+        return body
+
+    @router.get('/broken')
+    async def broken():
+        raise ValueError('Not ready')
+
+    app = FastAPI()
+    app.include_router(router)
+    app.state.registry = registry
+    return app
+
+
+async def test_warm_up(app, caplog):
+    results = await warm_up(
+        app,
+        ['/health', WarmupRequest('/echo', 'POST', b'{"a": 1}', {'content-type': 'application/json'}), '/broken'],
+    )
+    assert app.middleware_stack is not None
+    assert app.openapi_schema is not None
+    assert {request: status for request, (status, _) in results.items()} == {
+        'GET /health': 200,
+        'POST /echo': 200,
+        'GET /broken': 500,
+    }
+    # The requests went through the middlewares and the `AuditLog` route, but are not counted in the metrics
+    assert app.state.registry.requests == {}
+    [audit_record] = [
+        record for record in caplog.records if record.getMessage() == "Unknown > [POST] | /echo | {'a': 1}"
+    ]
+    assert audit_record.warmup is True
+    assert 'Warmup request GET /broken failed' in caplog.messages
+
+
+async def test_add_warmup(app):
+    warm_up_on_startup = add_warmup(app, ['/health'])
+    assert app.router.on_startup == [warm_up_on_startup]
+    async with AsyncClient(app=app, base_url='http://test') as client:
+        await app.router.startup()
+        assert app.state.registry.requests == {}
+        assert (await client.get('/health')).json() == {'status': 'ok'}
+        assert app.state.registry.requests[('GET', '/health', '2xx')] == 1